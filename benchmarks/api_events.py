@@ -0,0 +1,136 @@
+"""/api/events: everything vs. a FullCalendar month range, cold and cached.
+
+Runs against a temporary SQLite database filled with events spread over two
+years. It times the unbounded call, the first call for one month and a
+repeat of it. It checks that the month holds exactly the overlapping events
+and that changing a source invalidates the cached body. It also compares
+FastAPI's default list serialization with the pre-encoded bytes.
+
+Usage: python -m benchmarks.api_events [events] [rounds]
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_tmp = tempfile.TemporaryDirectory()
+# Must be set before src.database creates its engines.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'api_events.db')}"
+os.environ.setdefault("SESSION_SECRET", "api-events-bench")
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.testclient import TestClient
+
+from main import app, fullcalendar_event
+from src.bootstrap import init_database
+from src.database import SessionLocal, engine
+from src.event_cache import ORJSON_SUPPORT, encode_json
+from src.ics_generator import get_unified_events
+from src.models import CalendarSource, Event, SourceType, User
+
+ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
+ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "admin123")
+MONTH_START = "2026-09-28T00:00:00+03:00"
+MONTH_END = "2026-11-09T00:00:00+03:00"
+
+
+def populate(count: int) -> tuple:
+    db = SessionLocal()
+    try:
+        admin = db.query(User).filter(User.username == ADMIN_USERNAME).first()
+        sources = [
+            CalendarSource(user_id=admin.id, name=f"Source {i}", source_type=SourceType.ICS_FEED, masking=i == 0)
+            for i in range(4)
+        ]
+        db.add_all(sources)
+        db.flush()
+        base = datetime(2026, 1, 1)
+        step = timedelta(days=730) / count
+        db.add_all([
+            Event(
+                source_id=sources[i % len(sources)].id, original_uid=f"bench-{i}",
+                original_summary=f"Meeting {i}", original_description="Agenda", original_location="Room 1",
+                start_datetime=base + step * i, end_datetime=base + step * i + timedelta(hours=1),
+                is_all_day=False,
+            )
+            for i in range(count)
+        ])
+        db.commit()
+        return admin.id, sources[1].id
+    finally:
+        db.close()
+
+
+def timed(client, rounds: int, **params) -> tuple:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        response = client.get("/api/events", params=params)
+        response.raise_for_status()
+    return (time.perf_counter() - started) / rounds, response
+
+
+def run(count: int, rounds: int) -> bool:
+    init_database()
+    user_id, source_id = populate(count)
+    month = {"start": MONTH_START, "end": MONTH_END}
+
+    with TestClient(app) as client:
+        response = client.post("/login", data={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD},
+                               follow_redirects=False)
+        # The session cookie is Secure; the test client talks plain HTTP.
+        client.cookies.set("session_token", response.cookies.get("session_token"))
+
+        everything, full = timed(client, 1)
+        cold, cold_response = timed(client, 1, **month)
+        warm, warm_response = timed(client, rounds, **month)
+        print(f"{count:,} events, orjson {'on' if ORJSON_SUPPORT else 'off'}")
+        print(f"  everything          {everything * 1000:8.1f}ms  {len(full.content):>10,} bytes")
+        print(f"  month, cold         {cold * 1000:8.1f}ms  {len(cold_response.content):>10,} bytes")
+        print(f"  month, cached       {warm * 1000:8.1f}ms")
+
+        with SessionLocal() as db:
+            source = db.get(CalendarSource, source_id)
+            source.name = "Renamed"
+            db.commit()
+        _, after_change = timed(client, 1, **month)
+        bad_range = client.get("/api/events", params={"start": "yesterday"})
+
+    with SessionLocal() as db:
+        events = get_unified_events(db, user_id=user_id)
+    payload = [fullcalendar_event(event) for event in events]
+    started = time.perf_counter()
+    json.dumps(jsonable_encoder(payload)).encode()
+    default_encoding = time.perf_counter() - started
+    started = time.perf_counter()
+    encode_json(payload)
+    fast_encoding = time.perf_counter() - started
+    print(f"  encode everything   jsonable_encoder {default_encoding * 1000:.1f}ms, "
+          f"encode_json {fast_encoding * 1000:.1f}ms")
+
+    range_start, range_end = datetime(2026, 9, 27, 21), datetime(2026, 11, 8, 21)
+    expected = {event["id"] for event in payload
+                if event["end"] >= range_start.isoformat() + "+00:00"
+                and event["start"] < range_end.isoformat() + "+00:00"}
+    checks = [
+        ("unbounded call returns everything", len(full.json()) == count),
+        ("month holds exactly the overlapping events", {e["id"] for e in cold_response.json()} == expected),
+        ("cached body matches", warm_response.content == cold_response.content),
+        ("source change invalidates", any(e["extendedProps"]["source"] == "Renamed" for e in after_change.json())),
+        ("bad range is a 400", bad_range.status_code == 400),
+    ]
+    for name, passed in checks:
+        print(f"{'ok  ' if passed else 'FAIL'} {name}")
+    return all(passed for _, passed in checks)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    count, rounds = (args + [20000, 50][len(args):])[:2]
+    try:
+        passed = run(count, rounds)
+    finally:
+        engine.dispose()
+        _tmp.cleanup()
+    sys.exit(0 if passed else 1)
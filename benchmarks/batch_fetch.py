@@ -0,0 +1,266 @@
+"""Google and Outlook sources of one user synced through the batch APIs.
+
+Runs against a temporary SQLite database and a local server that speaks
+Google's multipart/mixed batch endpoint, Graph's JSON $batch and the plain
+per-calendar endpoints, with a fixed latency per HTTP call. It queues eight
+Google and three Outlook sources for the admin, lets one worker claim the
+first job and checks that all jobs ran in a handful of batch calls, that
+each source got its own calendar's events (pagination and a throttled part
+included) and that a calendar the provider rejects only fails its source.
+It then syncs the Google sources one by one for comparison.
+
+Usage: python -m benchmarks.batch_fetch [events per calendar]
+"""
+import asyncio
+import http.server
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, unquote, urlsplit
+
+_tmp = tempfile.TemporaryDirectory()
+# Must be set before src.database creates its engines.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'batch_fetch.db')}"
+os.environ.setdefault("SESSION_SECRET", "batch-fetch")
+
+from sqlalchemy import func
+
+from src import custom_oauth_service, provider_policy
+from src.bootstrap import init_database
+from src.custom_oauth_service import save_oauth_settings, save_oauth_token
+from src.database import SessionLocal, engine
+from src.models import CalendarSource, Event, SourceType, SyncJob, User
+from src.sync_queue import JOB_SUCCEEDED, claim_job, enqueue_sources, run_job
+from src.sync_service import sync_calendar_source
+
+ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
+LATENCY_SECONDS = 0.03
+PAGE_SIZE = 40
+GOOGLE_CALENDARS = [f"team{i}@group.calendar.google.com" for i in range(6)] + ["primary", "missing"]
+OUTLOOK_CALENDARS = ["AAMk-1", "AAMk-2", None]
+
+
+class ProviderHandler(http.server.BaseHTTPRequestHandler):
+    calls = {}
+    throttled = set()
+    events_per_calendar = 100
+
+    def log_message(self, format, *args):
+        pass
+
+    def _count(self, kind: str):
+        self.calls[kind] = self.calls.get(kind, 0) + 1
+        time.sleep(LATENCY_SECONDS)
+
+    def _page(self, calendar: str, start: int) -> tuple:
+        # (status, items, next offset); "missing" is a calendar the user lost access to.
+        if calendar == "missing":
+            return 404, [], None
+        if calendar == "team3@group.calendar.google.com" and calendar not in self.throttled:
+            self.throttled.add(calendar)
+            return 429, [], None
+        end = min(start + PAGE_SIZE, self.events_per_calendar)
+        base = datetime(2026, 11, 1)
+        items = [(f"{calendar}-{i}", base + timedelta(hours=i)) for i in range(start, end)]
+        return 200, items, end if end < self.events_per_calendar else None
+
+    def _google_page(self, path_and_query: str) -> tuple:
+        url = urlsplit(path_and_query)
+        calendar = unquote(url.path.split("/calendars/")[1].split("/")[0])
+        start = int(parse_qs(url.query).get("pageToken", ["0"])[0])
+        status, items, following = self._page(calendar, start)
+        if status != 200:
+            return status, {"error": {"code": status, "message": "Not Found" if status == 404 else "Rate Limit"}}
+        body = {"items": [{
+            "id": uid, "summary": uid,
+            "start": {"dateTime": when.isoformat() + "Z"},
+            "end": {"dateTime": (when + timedelta(minutes=30)).isoformat() + "Z"},
+        } for uid, when in items]}
+        if following:
+            body["nextPageToken"] = str(following)
+        return 200, body
+
+    def _graph_page(self, path_and_query: str) -> tuple:
+        url = urlsplit(path_and_query)
+        match = re.search(r"/me/calendars/([^/]+)/calendarView", url.path)
+        calendar = match.group(1) if match else "default"
+        start = int(parse_qs(url.query).get("$skip", ["0"])[0])
+        status, items, following = self._page(calendar, start)
+        body = {"value": [{
+            "id": uid, "subject": uid,
+            "start": {"dateTime": when.isoformat(), "timeZone": "UTC"},
+            "end": {"dateTime": (when + timedelta(minutes=30)).isoformat(), "timeZone": "UTC"},
+        } for uid, when in items]}
+        if following:
+            body["@odata.nextLink"] = f"{custom_oauth_service.GRAPH_API}{url.path}?$skip={following}"
+        return status, body
+
+    def _reply(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/calendar/v3/"):
+            self._count("google single")
+            status, body = self._google_page(self.path)
+        else:
+            self._count("graph single")
+            status, body = self._graph_page(self.path[len("/v1.0"):])
+        self._reply(status, json.dumps(body).encode(), "application/json")
+
+    def do_POST(self):
+        payload = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/batch/calendar/v3":
+            self._count("google batch")
+            boundary = "batch_response"
+            parts = []
+            for part in payload.decode().split("--" + self.headers["Content-Type"].split("boundary=")[1]):
+                content_id = re.search(r"Content-ID: <([^>]+)>", part)
+                request_line = re.search(r"^GET (\S+)", part, re.M)
+                if not content_id or not request_line:
+                    continue
+                status, body = self._google_page(request_line.group(1))
+                parts.append(
+                    f"--{boundary}\r\nContent-Type: application/http\r\n"
+                    f"Content-ID: <response-{content_id.group(1)}>\r\n\r\n"
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json; charset=UTF-8\r\n"
+                    + ("Retry-After: 0\r\n" if status == 429 else "")
+                    + f"\r\n{json.dumps(body)}\r\n"
+                )
+            self._reply(200, ("".join(parts) + f"--{boundary}--\r\n").encode(),
+                        f"multipart/mixed; boundary={boundary}")
+        else:
+            self._count("graph batch")
+            requests = json.loads(payload)["requests"]
+            if len(requests) > 20:
+                self._reply(400, b'{"error": {"message": "too many requests"}}', "application/json")
+                return
+            responses = []
+            for request in requests:
+                status, body = self._graph_page(request["url"])
+                responses.append({"id": request["id"], "status": status, "headers": {}, "body": body})
+            self._reply(200, json.dumps({"responses": responses}).encode(), "application/json")
+
+
+def serve_providers():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ProviderHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    custom_oauth_service.GOOGLE_CALENDAR_API = f"{base}/calendar/v3"
+    custom_oauth_service.GOOGLE_BATCH_URL = f"{base}/batch/calendar/v3"
+    custom_oauth_service.GRAPH_API = f"{base}/v1.0"
+    # The real hosts' budgets, so neither path waits on the default one.
+    provider_policy.HOST_BUDGETS["127.0.0.1"] = provider_policy.HOST_BUDGETS["www.googleapis.com"]
+    return server
+
+
+def create_sources() -> tuple:
+    with SessionLocal() as db:
+        admin = db.query(User).filter(User.username == ADMIN_USERNAME).first()
+        for provider in ("google", "outlook"):
+            save_oauth_settings(db, provider, f"{provider}-client", "secret")
+            save_oauth_token(db, provider, f"{provider}-token", "refresh", expires_in=3600, user_id=admin.id)
+        google = [
+            CalendarSource(user_id=admin.id, name=f"Google {calendar}", source_type=SourceType.GOOGLE_CALENDAR,
+                           google_calendar_id=calendar)
+            for calendar in GOOGLE_CALENDARS
+        ]
+        outlook = [
+            CalendarSource(user_id=admin.id, name=f"Outlook {calendar or 'default'}",
+                           source_type=SourceType.OUTLOOK_OAUTH, outlook_calendar_id=calendar)
+            for calendar in OUTLOOK_CALENDARS
+        ]
+        db.add_all(google + outlook)
+        db.commit()
+        enqueue_sources(db, google + outlook)
+        return [source.id for source in google], [source.id for source in outlook]
+
+
+async def run_worker():
+    # One worker claims jobs until the queue is empty, like job_worker_loop.
+    claims = 0
+    while True:
+        with SessionLocal() as db:
+            job = claim_job(db)
+        if job is None:
+            return claims
+        claims += 1
+        await run_job(job)
+
+
+def sync_one_by_one(source_ids: list):
+    with SessionLocal() as db:
+        for source_id in source_ids:
+            asyncio.run(sync_calendar_source(db, db.get(CalendarSource, source_id)))
+
+
+def run(events_per_calendar: int) -> bool:
+    ProviderHandler.events_per_calendar = events_per_calendar
+    init_database()
+    server = serve_providers()
+    try:
+        google_ids, outlook_ids = create_sources()
+        started = time.perf_counter()
+        claims = asyncio.run(run_worker())
+        batched_time = time.perf_counter() - started
+        batched_calls = dict(ProviderHandler.calls)
+
+        with SessionLocal() as db:
+            jobs = {job.source_id: job for job in db.query(SyncJob).all()}
+            counts = dict(db.query(Event.source_id, func.count(Event.id)).group_by(Event.source_id).all())
+            wrong_source = db.query(Event).join(CalendarSource).filter(
+                ~Event.original_uid.startswith(CalendarSource.google_calendar_id),
+                CalendarSource.source_type == SourceType.GOOGLE_CALENDAR
+            ).count()
+
+        ProviderHandler.calls.clear()
+        ProviderHandler.throttled.clear()
+        started = time.perf_counter()
+        sync_one_by_one(google_ids)
+        single_time = time.perf_counter() - started
+        single_calls = dict(ProviderHandler.calls)
+    finally:
+        server.shutdown()
+
+    print(f"{len(google_ids)} Google + {len(outlook_ids)} Outlook sources, {events_per_calendar} events each, "
+          f"{PAGE_SIZE} per page, {LATENCY_SECONDS * 1000:.0f}ms per call")
+    print(f"  queue, batched     {batched_time * 1000:7.0f}ms  {claims} claim(s)  calls {batched_calls}")
+    print(f"  Google one by one  {single_time * 1000:7.0f}ms  calls {single_calls}")
+
+    missing_id = google_ids[GOOGLE_CALENDARS.index("missing")]
+    fetched_ids = [source_id for source_id in google_ids + outlook_ids if source_id != missing_id]
+    pages = -(-events_per_calendar // PAGE_SIZE)
+    checks = [
+        ("one claim per provider ran every job", claims == 2),
+        ("every fetchable source succeeded", all(jobs[i].status == JOB_SUCCEEDED for i in fetched_ids)),
+        ("rejected calendar only fails its source", jobs[missing_id].status != JOB_SUCCEEDED
+         and "404" in (jobs[missing_id].message or "")),
+        ("each source got its calendar's events", all(counts[i] == events_per_calendar for i in fetched_ids)
+         and wrong_source == 0),
+        ("Google pages batched", batched_calls.get("google batch") == pages + 1),
+        ("Outlook pages batched", batched_calls.get("graph batch") == pages),
+        ("no single requests when batching", "google single" not in batched_calls
+         and "graph single" not in batched_calls),
+    ]
+    for name, passed in checks:
+        print(f"{'ok  ' if passed else 'FAIL'} {name}")
+    return all(passed for _, passed in checks)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    try:
+        passed = run(args[0] if args else 100)
+    finally:
+        engine.dispose()
+        _tmp.cleanup()
+    sys.exit(0 if passed else 1)
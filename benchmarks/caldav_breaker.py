@@ -0,0 +1,113 @@
+"""CalDAV errors and the per-host circuit breaker.
+
+Points real CalDAV syncs (caldav's client through run_with_policy) at a
+local server that rejects the credentials, then at one that answers 503,
+then at a port nobody listens on. Each host gets more failures than the
+breaker's threshold. The check is that rejected credentials leave the
+breaker closed, so other tenants of a shared host keep syncing, while a
+failing or unreachable host opens it.
+
+Usage: python -m benchmarks.caldav_breaker
+"""
+import asyncio
+import http.server
+import os
+import socket
+import sys
+import tempfile
+import threading
+
+_tmp = tempfile.TemporaryDirectory()
+# Must be set before src.database creates its engines.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'caldav_breaker.db')}"
+os.environ.setdefault("SESSION_SECRET", "caldav-breaker")
+
+from src import provider_policy
+from src.caldav_service import fetch_caldav_events
+from src.crypto import encrypt_password
+from src.database import engine
+from src.provider_policy import BREAKER_FAILURE_THRESHOLD, CircuitOpenError, get_host_policy, run_with_policy
+
+
+class DavHandler(http.server.BaseHTTPRequestHandler):
+    status = 401
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.send_response(self.status)
+        if self.status == 401:
+            self.send_header("WWW-Authenticate", 'Basic realm="calendars"')
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_GET = do_PROPFIND = do_REPORT = do_OPTIONS = _reply
+
+
+def serve(status: int, host: str):
+    handler = type(f"Dav{status}", (DavHandler,), {"status": status})
+    server = http.server.ThreadingHTTPServer((host, 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.3", 0))
+        return probe.getsockname()[1]
+
+
+async def sync_many(url: str, times: int) -> tuple:
+    # (errors raised by the CalDAV client, syncs refused by the breaker)
+    errors, refused = set(), 0
+    for _ in range(times):
+        try:
+            await run_with_policy(url, fetch_caldav_events, caldav_url=url, username="tenant",
+                                  encrypted_password=encrypt_password("wrong"))
+        except CircuitOpenError:
+            refused += 1
+        except Exception as e:
+            errors.add(type(e).__name__)
+    return errors, refused
+
+
+def run() -> bool:
+    provider_policy.BACKOFF_BASE_SECONDS = 0.01
+    # One loopback address per case, so each gets its own host policy.
+    rejecting = serve(401, "127.0.0.1")
+    failing = serve(503, "127.0.0.2")
+    times = BREAKER_FAILURE_THRESHOLD * 2
+    results = {}
+    try:
+        for name, url in (
+            ("wrong password", f"http://127.0.0.1:{rejecting.server_address[1]}/dav/"),
+            ("server error", f"http://127.0.0.2:{failing.server_address[1]}/dav/"),
+            ("unreachable", f"http://127.0.0.3:{free_port()}/dav/"),
+        ):
+            errors, refused = asyncio.run(sync_many(url, times))
+            results[name] = (get_host_policy(url).breaker.state, refused)
+            print(f"  {name:<15} {times} syncs: {', '.join(sorted(errors))}; breaker {results[name][0]}, "
+                  f"{refused} refused")
+    finally:
+        rejecting.shutdown()
+        failing.shutdown()
+
+    checks = [
+        ("wrong password leaves the breaker closed", results["wrong password"] == ("closed", 0)),
+        ("server errors open it", results["server error"][0] == "open" and results["server error"][1] > 0),
+        ("unreachable host opens it", results["unreachable"][0] == "open" and results["unreachable"][1] > 0),
+    ]
+    for name, passed in checks:
+        print(f"{'ok  ' if passed else 'FAIL'} {name}")
+    return all(passed for _, passed in checks)
+
+
+if __name__ == "__main__":
+    try:
+        passed = run()
+    finally:
+        engine.dispose()
+        _tmp.cleanup()
+    sys.exit(0 if passed else 1)
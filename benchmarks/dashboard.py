@@ -0,0 +1,119 @@
+"""Dashboard render time as a user's upcoming events grow.
+
+Runs against a temporary SQLite database. It adds future events to the
+admin's four sources in steps, touching the sources like a sync would. At
+each size it times GET /, first cold and then served from the preview
+cache. For comparison it also times loading every upcoming event, which is
+what the dashboard did before it pushed LIMIT into SQL. It checks that the
+page shows the right per-source and total counts.
+
+Usage: python -m benchmarks.dashboard [max events] [rounds]
+"""
+import os
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_tmp = tempfile.TemporaryDirectory()
+# Must be set before src.database creates its engines.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'dashboard.db')}"
+os.environ.setdefault("SESSION_SECRET", "dashboard-bench")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, update
+
+from main import app
+from src.bootstrap import init_database
+from src.database import SessionLocal, engine
+from src.ics_generator import get_unified_events
+from src.models import CalendarSource, Event, SourceType, User
+
+ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
+ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "admin123")
+SOURCES = 4
+
+
+def create_sources() -> tuple:
+    with SessionLocal() as db:
+        admin = db.query(User).filter(User.username == ADMIN_USERNAME).first()
+        sources = [
+            CalendarSource(user_id=admin.id, name=f"Source {i}", source_type=SourceType.ICS_FEED,
+                           is_enabled=i != SOURCES - 1, encrypted_password="x" * 200)
+            for i in range(SOURCES)
+        ]
+        db.add_all(sources)
+        db.commit()
+        return admin.id, [source.id for source in sources]
+
+
+def add_events(source_ids: list, first: int, last: int):
+    base = datetime.utcnow() + timedelta(hours=1)
+    with engine.begin() as conn:
+        conn.execute(insert(Event), [{
+            "source_id": source_ids[i % len(source_ids)], "original_uid": f"bench-{i}",
+            "original_summary": f"Meeting {i}", "original_description": "Agenda " * 20,
+            "start_datetime": base + timedelta(minutes=10 * i),
+            "end_datetime": base + timedelta(minutes=10 * i + 30), "is_all_day": False,
+        } for i in range(first, last)])
+        conn.execute(update(CalendarSource).where(CalendarSource.id.in_(source_ids)).values(
+            updated_at=datetime.utcnow()
+        ))
+        conn.exec_driver_sql("ANALYZE")
+
+
+def timed(func, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        result = func()
+    return (time.perf_counter() - started) / rounds, result
+
+
+def run(max_events: int, rounds: int) -> bool:
+    init_database()
+    user_id, source_ids = create_sources()
+    sizes = [size for size in (1_000, 10_000, 100_000, 1_000_000) if size <= max_events]
+    ok = True
+
+    with TestClient(app) as client:
+        response = client.post("/login", data={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD},
+                               follow_redirects=False)
+        # The session cookie is Secure; the test client talks plain HTTP.
+        client.cookies.set("session_token", response.cookies.get("session_token"))
+
+        print(f"{'events':>10} {'GET / cold':>12} {'GET / cached':>14} {'all upcoming':>14}")
+        added = 0
+        for size in sizes:
+            add_events(source_ids, added, size)
+            added = size
+            cold_time, page = timed(lambda: client.get("/"), 1)
+            page_time, _ = timed(lambda: client.get("/"), rounds)
+            with SessionLocal() as db:
+                full_time, _ = timed(lambda: get_unified_events(db, upcoming_only=True, user_id=user_id), 1)
+            print(f"{size:>10,} {cold_time * 1000:>10.1f}ms {page_time * 1000:>12.1f}ms {full_time * 1000:>12.1f}ms")
+
+            enabled_total = sum(1 for i in range(size) if i % SOURCES != SOURCES - 1)
+            shown_total = re.search(r"View all (\d+) events", page.text)
+            if not shown_total or int(shown_total.group(1)) != enabled_total:
+                print(f"FAIL total: expected {enabled_total}, page says {shown_total and shown_total.group(1)}")
+                ok = False
+            if page.text.count('class="event-item') != 10:
+                print("FAIL expected 10 previewed events")
+                ok = False
+            if f"<td>{size // SOURCES}</td>" not in page.text:
+                print("FAIL per-source count missing")
+                ok = False
+    print("ok" if ok else "FAIL")
+    return ok
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    max_events, rounds = (args + [100_000, 20][len(args):])[:2]
+    try:
+        passed = run(max_events, rounds)
+    finally:
+        engine.dispose()
+        _tmp.cleanup()
+    sys.exit(0 if passed else 1)
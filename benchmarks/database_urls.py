@@ -0,0 +1,72 @@
+"""Check which drivers DATABASE_URL values resolve to.
+
+PostgreSQL URLs in any of the spellings hosting providers hand out must
+end up on psycopg 3 for the sync engine and asyncpg for the async one, the
+drivers the postgres extra installs; URLs that name a driver keep it. The
+dialect is resolved by the installed SQLAlchemy, which is compared with the
+version pinned in uv.lock. Run it under the locked version (e.g. through
+`uv run`) to check what a deployment gets.
+
+Usage: python -m benchmarks.database_urls
+"""
+import os
+import re
+import sys
+import tempfile
+
+_tmp = tempfile.TemporaryDirectory()
+# Must be set before src.database creates its engines.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'database_urls.db')}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+
+import sqlalchemy
+from sqlalchemy.engine import make_url
+
+from src.database import engine, get_async_database_url, normalize_database_url
+from src.schema import ROOT_DIR
+
+CASES = [
+    # (DATABASE_URL, sync driver, async driver)
+    ("postgres://u:p@db/calendar", "psycopg", "asyncpg"),
+    ("postgresql://u:p@db/calendar", "psycopg", "asyncpg"),
+    ("postgresql+psycopg://u:p@db/calendar", "psycopg", "asyncpg"),
+    ("postgresql+asyncpg://u:p@db/calendar", "asyncpg", "asyncpg"),
+    ("postgresql://postgres@/calagg?host=/tmp/pgdata", "psycopg", "asyncpg"),
+    ("sqlite:///./calendar_aggregator.db", "pysqlite", "aiosqlite"),
+]
+
+
+def locked_version(package: str) -> str:
+    with open(os.path.join(ROOT_DIR, "uv.lock")) as lock:
+        match = re.search(rf'\[\[package\]\]\nname = "{package}"\nversion = "([^"]+)"', lock.read())
+    return match.group(1) if match else "?"
+
+
+def driver(url: str) -> str:
+    # Loads the dialect class only; the DBAPI module is imported on connect.
+    return make_url(url).get_dialect().driver
+
+
+def run() -> bool:
+    locked = locked_version("sqlalchemy")
+    print(f"SQLAlchemy {sqlalchemy.__version__} installed, {locked} locked")
+    if sqlalchemy.__version__ != locked:
+        print("  (not the locked version: the results below may differ from a deployment)")
+    checks = []
+    for url, sync_driver, async_driver in CASES:
+        normalized = normalize_database_url(url)
+        resolved = (driver(normalized), driver(get_async_database_url(normalized)))
+        print(f"  {url:<50} {resolved[0]:<9} {resolved[1]}")
+        checks.append((f"{url}: {sync_driver} / {async_driver}", resolved == (sync_driver, async_driver)))
+    for name, passed in checks:
+        print(f"{'ok  ' if passed else 'FAIL'} {name}")
+    return all(passed for _, passed in checks)
+
+
+if __name__ == "__main__":
+    try:
+        passed = run()
+    finally:
+        engine.dispose()
+        _tmp.cleanup()
+    sys.exit(0 if passed else 1)
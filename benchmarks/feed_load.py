@@ -0,0 +1,134 @@
+"""Concurrent feed/event reads through the sync vs. the async (aiosqlite) engine.
+
+Runs N concurrent readers on one event loop, like uvicorn serving feed polls,
+while a probe task measures how long the loop takes to answer a trivial
+request. Sync reads block the loop for the whole query; async reads only for
+the Python-side work.
+
+Usage: python -m benchmarks.feed_load [events] [concurrency] [rounds]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from src.database import Base
+from src.models import CalendarSource, Event, SourceType, User, UserRole
+from src.ics_generator import (
+    generate_unified_ics, generate_unified_ics_async, get_unified_events, get_unified_events_async
+)
+
+PROBE_INTERVAL = 0.005
+
+
+def populate(session, count: int) -> int:
+    user = User(username="bench", hashed_password="x", role=UserRole.USER, feed_token="bench")
+    session.add(user)
+    session.flush()
+    sources = [
+        CalendarSource(user_id=user.id, name=f"Source {i}", source_type=SourceType.ICS_FEED, masking=i % 2 == 0)
+        for i in range(4)
+    ]
+    session.add_all(sources)
+    session.flush()
+    base = datetime.utcnow()
+    session.add_all([
+        Event(
+            source_id=sources[i % len(sources)].id,
+            original_uid=f"bench-{i}",
+            original_summary=f"Meeting {i}",
+            original_description="Agenda",
+            original_location="Room 1",
+            start_datetime=base + timedelta(hours=i),
+            end_datetime=base + timedelta(hours=i, minutes=30),
+            is_all_day=False,
+        )
+        for i in range(count)
+    ])
+    session.commit()
+    return user.id
+
+
+async def probe(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def run_load(label: str, read, concurrency: int, rounds: int):
+    lags = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(stop, lags))
+
+    async def reader():
+        for _ in range(rounds):
+            await read()
+            # Yield between requests like a real handler returning a response.
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[reader() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    p95 = lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.95))]
+    print(
+        f"  {label:<6} {elapsed:7.2f}s  {concurrency * rounds / elapsed:7.1f} req/s  "
+        f"loop lag p50 {statistics.median(lags_ms):7.1f}ms  p95 {p95:7.1f}ms  max {lags_ms[-1]:7.1f}ms"
+    )
+
+
+async def run(count: int, concurrency: int, rounds: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        Base.metadata.create_all(bind=engine)
+        SyncSession = sessionmaker(bind=engine)
+        AsyncSession = async_sessionmaker(async_engine, expire_on_commit=False)
+
+        with SyncSession() as session:
+            user_id = populate(session, count)
+
+        async def sync_events():
+            with SyncSession() as session:
+                get_unified_events(session, user_id=user_id)
+
+        async def async_events():
+            async with AsyncSession() as session:
+                await get_unified_events_async(session, user_id=user_id)
+
+        async def sync_feed():
+            with SyncSession() as session:
+                generate_unified_ics(session, user_id=user_id)
+
+        async def async_feed():
+            async with AsyncSession() as session:
+                await generate_unified_ics_async(session, user_id=user_id)
+
+        print(f"{count:,} events, {concurrency} concurrent readers x {rounds} rounds")
+        print("/api/events")
+        await run_load("sync", sync_events, concurrency, rounds)
+        await run_load("async", async_events, concurrency, rounds)
+        print("/feed/{token}/calendar.ics")
+        await run_load("sync", sync_feed, concurrency, rounds)
+        await run_load("async", async_feed, concurrency, rounds)
+
+        await async_engine.dispose()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    count, concurrency, rounds = (args + [2000, 20, 5][len(args):])[:3]
+    asyncio.run(run(count, concurrency, rounds))
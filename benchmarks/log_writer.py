@@ -0,0 +1,86 @@
+"""Caller-side cost of a log line: commit per line vs. the batched log writer.
+
+Logs the same lines both ways against a temporary SQLite database (tuned
+like the app's). It reports the per-call latency the caller sees and checks
+that every queued line was written once the writer was stopped. It then
+repeats the queued run with a tiny queue so callers hit back-pressure.
+
+Usage: python -m benchmarks.log_writer [lines]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from src import logging_service
+from src.database import Base, configure_sqlite_engine
+from src.logging_service import LogWriter
+from src.models import ApplicationLog
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(label: str, samples: list, total: float):
+    print(f"  {label:<24} p50 {percentile(samples, 50) * 1e6:8.1f}us  "
+          f"p99 {percentile(samples, 99) * 1e6:8.1f}us  total {total:6.2f}s")
+
+
+def commit_per_line(Session, lines: int):
+    samples = []
+    started = time.perf_counter()
+    with Session() as db:
+        for i in range(lines):
+            t = time.perf_counter()
+            db.add(ApplicationLog(level="INFO", message=f"line {i}", source="bench"))
+            db.commit()
+            samples.append(time.perf_counter() - t)
+    report("commit per line", samples, time.perf_counter() - started)
+
+
+def queued(Session, lines: int, label: str, queue_size: int = None):
+    original = logging_service.LOG_QUEUE_SIZE
+    if queue_size:
+        logging_service.LOG_QUEUE_SIZE = queue_size
+    try:
+        writer = LogWriter(Session)
+    finally:
+        logging_service.LOG_QUEUE_SIZE = original
+
+    samples = []
+    started = time.perf_counter()
+    for i in range(lines):
+        t = time.perf_counter()
+        writer.submit({"level": "INFO", "message": f"queued {i}", "source": label})
+        samples.append(time.perf_counter() - t)
+    writer.stop()
+    report(label, samples, time.perf_counter() - started)
+
+    with Session() as db:
+        written = db.scalar(select(func.count()).select_from(ApplicationLog).where(ApplicationLog.source == label))
+    if written != lines:
+        raise AssertionError(f"{label}: {written} of {lines} lines written")
+
+
+def run(path: str, lines: int):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    configure_sqlite_engine(engine)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    print(f"{lines:,} log lines")
+    commit_per_line(Session, lines)
+    queued(Session, lines, "log writer")
+    queued(Session, lines, "log writer (queue=50)", queue_size=50)
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    lines = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        run(os.path.join(tmp, "logs.db"), lines)
@@ -0,0 +1,149 @@
+"""Scrape /metrics after real traffic and check the hot-path series are there.
+
+Runs against a temporary SQLite database. Serves test_timezones.ics from a
+local HTTP server, syncs it as an ICS source, fetches the user's feed and
+/api/events, then scrapes /metrics. Exits non-zero if any expected series
+is missing or the sync left no sync_runs row. It also prints what one
+histogram observation costs.
+
+Usage: python -m benchmarks.metrics_check
+"""
+import asyncio
+import functools
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+
+_tmp = tempfile.TemporaryDirectory()
+# Must be set before src.database creates its engines.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'metrics.db')}"
+os.environ.setdefault("SESSION_SECRET", "metrics-check")
+os.environ.pop("METRICS_TOKEN", None)
+
+from fastapi.testclient import TestClient
+from prometheus_client.parser import text_string_to_metric_families
+
+from main import app
+from src.bootstrap import init_database
+from src.database import SessionLocal, engine
+from src.metrics import SYNC_PHASE_SECONDS
+from src.models import CalendarSource, SourceType, SyncRun, User
+from src.sync_service import sync_calendar_source
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
+ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "admin123")
+
+EXPECTED = [
+    # (sample name, required labels)
+    ("calagg_sync_phase_seconds_count", {"source_type": "ics_feed", "phase": "fetch"}),
+    ("calagg_sync_phase_seconds_count", {"source_type": "ics_feed", "phase": "parse"}),
+    ("calagg_sync_phase_seconds_count", {"source_type": "ics_feed", "phase": "expand"}),
+    ("calagg_sync_phase_seconds_count", {"source_type": "ics_feed", "phase": "store"}),
+    ("calagg_sync_runs_total", {"source_type": "ics_feed", "result": "success"}),
+    ("calagg_sync_events_fetched_total", {"source_type": "ics_feed"}),
+    ("calagg_sync_events_written_total", {"source_type": "ics_feed", "change": "added"}),
+    ("calagg_feed_render_seconds_count", {"feed": "ics"}),
+    ("calagg_feed_bytes_count", {"feed": "ics"}),
+    ("calagg_feed_render_seconds_count", {"feed": "api_events"}),
+    ("calagg_cache_requests_total", {"cache": "session", "result": "hit"}),
+    ("calagg_cache_requests_total", {"cache": "settings", "result": "hit"}),
+    ("calagg_http_request_seconds_count", {"host": "127.0.0.1"}),
+    ("calagg_http_budget_wait_seconds_count", {"host": "127.0.0.1"}),
+    ("calagg_http_requests_in_flight", {"host": "127.0.0.1"}),
+]
+
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def serve_ics():
+    handler = functools.partial(QuietHandler, directory=ROOT_DIR)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def sync_test_source(port: int) -> str:
+    db = SessionLocal()
+    try:
+        admin = db.query(User).filter(User.username == ADMIN_USERNAME).first()
+        source = CalendarSource(
+            user_id=admin.id, name="metrics check", source_type=SourceType.ICS_FEED,
+            caldav_url=f"http://127.0.0.1:{port}/test_timezones.ics"
+        )
+        db.add(source)
+        db.commit()
+        success, message = asyncio.run(sync_calendar_source(db, source))
+        if not success:
+            raise AssertionError(f"sync failed: {message}")
+        run = db.query(SyncRun).filter(SyncRun.source_id == source.id).one()
+        print(f"sync run: {run.duration_ms}ms (fetch {run.fetch_ms}, parse {run.parse_ms}, "
+              f"expand {run.expand_ms}, store {run.store_ms}), {run.payload_bytes:,} bytes, "
+              f"{run.events_fetched} events, +{run.added}")
+        if not (run.success and run.fetch_ms is not None and run.store_ms is not None and run.payload_bytes):
+            raise AssertionError("sync run row is incomplete")
+        return admin.feed_token
+    finally:
+        db.close()
+
+
+def scrape(client) -> list:
+    started = time.perf_counter()
+    response = client.get("/metrics")
+    elapsed = time.perf_counter() - started
+    response.raise_for_status()
+    print(f"scrape: {len(response.content):,} bytes in {elapsed * 1000:.1f}ms")
+    return [sample for family in text_string_to_metric_families(response.text) for sample in family.samples]
+
+
+def observation_cost() -> float:
+    histogram = SYNC_PHASE_SECONDS.labels("benchmark", "fetch")
+    rounds = 200_000
+    started = time.perf_counter()
+    for _ in range(rounds):
+        histogram.observe(0.01)
+    return (time.perf_counter() - started) / rounds
+
+
+def run() -> bool:
+    init_database()
+    server = serve_ics()
+    try:
+        feed_token = sync_test_source(server.server_address[1])
+    finally:
+        server.shutdown()
+
+    with TestClient(app) as client:
+        response = client.post("/login", data={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD},
+                               follow_redirects=False)
+        # The session cookie is Secure; the test client talks plain HTTP.
+        client.cookies.set("session_token", response.cookies.get("session_token"))
+        for path in ("/", "/admin", "/api/events", f"/feed/{feed_token}/calendar.ics"):
+            client.get(path).raise_for_status()
+        samples = scrape(client)
+
+    ok = True
+    for name, labels in EXPECTED:
+        found = any(
+            sample.name == name and all(sample.labels.get(k) == v for k, v in labels.items())
+            for sample in samples
+        )
+        print(f"{'ok  ' if found else 'FAIL'} {name} {labels}")
+        ok = ok and found
+    print(f"one histogram observation: {observation_cost() * 1e9:.0f}ns")
+    return ok
+
+
+if __name__ == "__main__":
+    try:
+        passed = run()
+    finally:
+        engine.dispose()
+        _tmp.cleanup()
+    sys.exit(0 if passed else 1)
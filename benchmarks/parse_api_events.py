@@ -0,0 +1,87 @@
+"""Compare Google/Graph event parsing with the ISO fast path vs. dateutil.
+
+Usage: python -m benchmarks.parse_api_events [count]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from dateutil import parser as date_parser
+
+from src import sync_service
+
+
+def make_google_items(count: int) -> list:
+    base = datetime(2025, 1, 1, 8, 0)
+    items = []
+    for i in range(count):
+        start = base + timedelta(minutes=30 * i)
+        end = start + timedelta(hours=1)
+        if i % 10 == 0:
+            items.append({
+                "id": f"g{i}",
+                "summary": f"All day {i}",
+                "start": {"date": start.strftime("%Y-%m-%d")},
+                "end": {"date": (start + timedelta(days=1)).strftime("%Y-%m-%d")},
+            })
+        else:
+            suffix = random.choice(["Z", "+03:00", "-05:00"])
+            items.append({
+                "id": f"g{i}",
+                "summary": f"Meeting {i}",
+                "start": {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%S") + suffix},
+                "end": {"dateTime": end.strftime("%Y-%m-%dT%H:%M:%S") + suffix},
+            })
+    return items
+
+
+def make_graph_items(count: int) -> list:
+    base = datetime(2025, 1, 1, 8, 0)
+    items = []
+    for i in range(count):
+        start = base + timedelta(minutes=30 * i)
+        end = start + timedelta(hours=1)
+        items.append({
+            "id": f"m{i}",
+            "subject": f"Meeting {i}",
+            "isAllDay": False,
+            "start": {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%S") + ".0000000", "timeZone": "UTC"},
+            "end": {"dateTime": end.strftime("%Y-%m-%dT%H:%M:%S") + ".0000000", "timeZone": "UTC"},
+            "body": {"contentType": "text", "content": ""},
+            "location": {"displayName": ""},
+        })
+    return items
+
+
+def timed(label: str, func, items: list) -> float:
+    started = time.perf_counter()
+    func(items)
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<10} {elapsed:8.3f}s  ({len(items) / elapsed:,.0f} items/s)")
+    return elapsed
+
+
+def run(count: int):
+    google_items = make_google_items(count)
+    graph_items = make_graph_items(count)
+
+    for name, parse, items in [
+        ("Google", sync_service.parse_google_events, google_items),
+        ("Graph", sync_service.parse_microsoft_events, graph_items),
+    ]:
+        print(f"{name}: {count:,} items")
+        fast = timed("fast path", parse, items)
+
+        original = sync_service.parse_iso_datetime
+        sync_service.parse_iso_datetime = date_parser.parse
+        try:
+            slow = timed("dateutil", parse, items)
+        finally:
+            sync_service.parse_iso_datetime = original
+
+        print(f"  speedup    {slow / fast:8.1f}x")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,201 @@
+"""Google and Graph event fetches with and without field selection.
+
+Serves full event resources (attendees, conference data, HTML bodies and
+the rest) from a local server that applies Google's fields= and Graph's
+$select the way the real APIs do, or ignores them to stand in for the
+unfiltered fetch. For each provider it compares payload bytes, fetch time
+and parse time for the full resources, the selected fields and a masked
+source. It checks that the selected fields parse to exactly the same
+events and that masked sources come without description and location.
+
+Usage: python -m benchmarks.partial_response [events] [rounds]
+"""
+import asyncio
+import http.server
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+_tmp = tempfile.TemporaryDirectory()
+# Must be set before src.database creates its engines.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'partial_response.db')}"
+os.environ.setdefault("SESSION_SECRET", "partial-response")
+
+from src import custom_oauth_service, provider_policy
+from src.custom_oauth_service import fetch_google_events_custom, fetch_microsoft_events_custom
+from src.database import engine
+from src.metrics import SyncTrace, current_sync
+from src.sync_service import parse_google_events, parse_microsoft_events
+
+
+def google_event(i: int) -> dict:
+    start = datetime(2026, 11, 1) + timedelta(hours=i)
+    people = [{"email": f"person{n}@example.com", "displayName": f"Person {n}", "responseStatus": "accepted"}
+              for n in range(8)]
+    return {
+        "kind": "calendar#event", "etag": f'"{3400000000000000 + i}"', "id": f"evt{i:06d}",
+        "status": "confirmed", "htmlLink": f"https://www.google.com/calendar/event?eid=ZXZ0{i:06d}",
+        "created": "2026-01-05T10:00:00.000Z", "updated": "2026-02-01T09:30:00.000Z",
+        "summary": f"Planning session {i}", "description": "Agenda: review roadmap, staffing, budget. " * 12,
+        "location": f"Room {i % 40}, Building B", "creator": people[0], "organizer": people[0],
+        "start": {"dateTime": start.isoformat() + "Z", "timeZone": "Europe/Istanbul"},
+        "end": {"dateTime": (start + timedelta(minutes=45)).isoformat() + "Z", "timeZone": "Europe/Istanbul"},
+        "iCalUID": f"evt{i:06d}@google.com", "sequence": 2, "attendees": people,
+        "hangoutLink": "https://meet.google.com/abc-defg-hij",
+        "conferenceData": {
+            "entryPoints": [{"entryPointType": "video", "uri": "https://meet.google.com/abc-defg-hij",
+                             "label": "meet.google.com/abc-defg-hij"},
+                            {"entryPointType": "phone", "uri": "tel:+1-555-0100", "pin": "123456789"}],
+            "conferenceSolution": {"key": {"type": "hangoutsMeet"}, "name": "Google Meet",
+                                   "iconUri": "https://fonts.gstatic.com/s/i/productlogos/meet_2020q4/v6/web-512dp/logo.png"},
+            "conferenceId": "abc-defg-hij",
+        },
+        "reminders": {"useDefault": True}, "eventType": "default",
+    }
+
+
+def graph_event(i: int) -> dict:
+    start = datetime(2026, 11, 1) + timedelta(hours=i)
+    people = [{"type": "required", "status": {"response": "accepted", "time": "2026-01-05T10:00:00Z"},
+               "emailAddress": {"name": f"Person {n}", "address": f"person{n}@example.com"}} for n in range(8)]
+    return {
+        "@odata.etag": f'W/"DwAAABYAAAA{i:06d}"', "id": f"AAMkAGI2{i:06d}",
+        "createdDateTime": "2026-01-05T10:00:00Z", "lastModifiedDateTime": "2026-02-01T09:30:00Z",
+        "changeKey": f"DwAAABYAAAA{i:06d}", "categories": [], "originalStartTimeZone": "Turkey Standard Time",
+        "iCalUId": f"040000008200E00074C5B7101A82E008{i:06d}", "reminderMinutesBeforeStart": 15,
+        "isReminderOn": True, "hasAttachments": False, "subject": f"Planning session {i}",
+        "bodyPreview": "Agenda: review roadmap, staffing, budget.", "importance": "normal", "sensitivity": "normal",
+        "isAllDay": False, "isCancelled": False, "isOrganizer": False, "responseRequested": True,
+        "showAs": "busy", "type": "singleInstance",
+        "webLink": f"https://outlook.live.com/owa/?itemid=AAMkAGI2{i:06d}&exvsurl=1&path=/calendar/item",
+        "isOnlineMeeting": True, "onlineMeetingProvider": "teamsForBusiness",
+        "body": {"contentType": "html", "content": "<html><body><p>Agenda: review roadmap, staffing, budget.</p>"
+                 + "<div style=\"font-family:Calibri\">&nbsp;</div>" * 20 + "</body></html>"},
+        "start": {"dateTime": start.isoformat() + ".0000000", "timeZone": "UTC"},
+        "end": {"dateTime": (start + timedelta(minutes=45)).isoformat() + ".0000000", "timeZone": "UTC"},
+        "location": {"displayName": f"Room {i % 40}", "locationType": "default",
+                     "address": {"street": "1 Main St", "city": "Istanbul", "countryOrRegion": "TR"}},
+        "locations": [{"displayName": f"Room {i % 40}", "locationType": "default"}],
+        "attendees": people, "organizer": {"emailAddress": people[0]["emailAddress"]},
+        "onlineMeeting": {"joinUrl": "https://teams.microsoft.com/l/meetup-join/19%3ameeting_abc%40thread.v2/0"},
+    }
+
+
+class ProviderHandler(http.server.BaseHTTPRequestHandler):
+    honor_fields = True
+    events = 2000
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, body: dict):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path.startswith("/calendar/v3/"):
+            start = int(query.get("pageToken", "0"))
+            end = min(start + int(query["maxResults"]), self.events)
+            items = [google_event(i) for i in range(start, end)]
+            selected = re.search(r"items\(([^)]*)\)", query.get("fields", ""))
+            if self.honor_fields and selected:
+                keep = selected.group(1).split(",")
+                items = [{key: item[key] for key in keep if key in item} for item in items]
+            body = {"items": items}
+            if end < self.events:
+                body["nextPageToken"] = str(end)
+        else:
+            start = int(query.get("$skip", "0"))
+            end = min(start + int(query["$top"]), self.events)
+            items = [graph_event(i) for i in range(start, end)]
+            if self.honor_fields and "$select" in query:
+                keep = ["@odata.etag", "id"] + query["$select"].split(",")
+                items = [{key: item[key] for key in keep if key in item} for item in items]
+            body = {"value": items}
+            if end < self.events:
+                body["@odata.nextLink"] = (f"{custom_oauth_service.GRAPH_API}{url.path}?"
+                                           f"{urlencode({**query, '$skip': end}, safe='$')}")
+        self._reply(body)
+
+
+def serve_providers():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ProviderHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    custom_oauth_service.GOOGLE_CALENDAR_API = f"{base}/calendar/v3"
+    custom_oauth_service.GRAPH_API = f"{base}/v1.0"
+    provider_policy.HOST_BUDGETS["127.0.0.1"] = (1000.0, 1000)
+    return server
+
+
+def measure(fetch, parse, masked: bool, rounds: int) -> tuple:
+    fetch_time = parse_time = 0.0
+    for _ in range(rounds):
+        trace = SyncTrace("bench")
+        token = current_sync.set(trace)
+        try:
+            started = time.perf_counter()
+            raw_events = asyncio.run(fetch("token", "cal", masked=masked))
+            fetch_time += time.perf_counter() - started
+        finally:
+            current_sync.reset(token)
+        started = time.perf_counter()
+        events = parse(raw_events)
+        parse_time += time.perf_counter() - started
+    return trace.payload_bytes, fetch_time / rounds, parse_time / rounds, events
+
+
+def run(events: int, rounds: int) -> bool:
+    ProviderHandler.events = events
+    server = serve_providers()
+    checks = []
+    try:
+        for provider, fetch, parse in (("Google", fetch_google_events_custom, parse_google_events),
+                                       ("Outlook", fetch_microsoft_events_custom, parse_microsoft_events)):
+            ProviderHandler.honor_fields = False
+            full = measure(fetch, parse, False, rounds)
+            ProviderHandler.honor_fields = True
+            selected = measure(fetch, parse, False, rounds)
+            masked = measure(fetch, parse, True, rounds)
+
+            print(f"{provider}, {events:,} events")
+            for name, (size, fetch_time, parse_time, _) in (("full resources", full), ("selected fields", selected),
+                                                            ("masked source", masked)):
+                print(f"  {name:<16} {size:>12,} bytes  fetch {fetch_time * 1000:7.1f}ms  "
+                      f"parse {parse_time * 1000:6.1f}ms")
+            checks += [
+                (f"{provider}: selected fields parse to the same events", selected[3] == full[3]),
+                (f"{provider}: masked source has no description or location",
+                 all(not e["description"] and not e["location"] for e in masked[3])
+                 and [(e["uid"], e["start"]) for e in masked[3]] == [(e["uid"], e["start"]) for e in full[3]]),
+                (f"{provider}: payload at most half of full", selected[0] * 2 <= full[0]),
+            ]
+    finally:
+        server.shutdown()
+
+    for name, passed in checks:
+        print(f"{'ok  ' if passed else 'FAIL'} {name}")
+    return all(passed for _, passed in checks)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    count, rounds = (args + [2000, 3][len(args):])[:2]
+    try:
+        passed = run(count, rounds)
+    finally:
+        engine.dispose()
+        _tmp.cleanup()
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,142 @@
+"""Arm profiling from /admin and check requests and a sync run get captured.
+
+Runs against a temporary SQLite database. It measures the timing
+middleware's per-request cost while profiling is disarmed, then arms two
+requests and one sync run (with tracemalloc). It checks that exactly those
+were captured, that the summary and stacks pages work, and that the feed
+token never shows up in a label. Last, it checks a capture stops sampling
+and tracing at the PROFILE_MAX_MS cap.
+
+Usage: python -m benchmarks.profiling_check
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+_tmp = tempfile.TemporaryDirectory()
+# Must be set before src.database creates its engines.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'profiling.db')}"
+os.environ.setdefault("SESSION_SECRET", "profiling-check")
+
+from fastapi.testclient import TestClient
+
+from benchmarks.metrics_check import serve_ics
+from main import app
+from src import profiling
+from src.bootstrap import init_database
+from src.database import SessionLocal, engine
+from src.models import CalendarSource, PerformanceProfile, SourceType, User
+from src.sync_service import sync_calendar_source
+
+ADMIN_USERNAME = os.environ.get("ADMIN_USERNAME", "admin")
+ADMIN_PASSWORD = os.environ.get("ADMIN_PASSWORD", "admin123")
+
+
+def disarmed_cost(rounds: int = 100_000) -> float:
+    async def check():
+        for _ in range(rounds):
+            await profiling.start_profile_async(profiling.PROFILE_REQUESTS, "request")
+
+    started = time.perf_counter()
+    asyncio.run(check())
+    return (time.perf_counter() - started) / rounds
+
+
+def profiles() -> list:
+    with SessionLocal() as db:
+        return db.query(PerformanceProfile).order_by(PerformanceProfile.id).all()
+
+
+def sync_source(port: int):
+    db = SessionLocal()
+    try:
+        admin = db.query(User).filter(User.username == ADMIN_USERNAME).first()
+        source = CalendarSource(
+            user_id=admin.id, name="profiling check", source_type=SourceType.ICS_FEED,
+            caldav_url=f"http://127.0.0.1:{port}/test_timezones.ics"
+        )
+        db.add(source)
+        db.commit()
+        success, message = asyncio.run(sync_calendar_source(db, source))
+        if not success:
+            raise AssertionError(f"sync failed: {message}")
+    finally:
+        db.close()
+
+
+def capped_profile() -> tuple:
+    # A capture that outlives the cap: sampling and tracemalloc stop early.
+    cap = profiling.PROFILE_MAX_SECONDS
+    profiling.PROFILE_MAX_SECONDS = 0.05
+    try:
+        profiler = profiling.SamplingProfiler("request", "capped", memory=True)
+        profiler.begin()
+        time.sleep(0.3)
+        tracing = tracemalloc.is_tracing()
+        result = profiler.end()
+    finally:
+        profiling.PROFILE_MAX_SECONDS = cap
+    return result, tracing
+
+
+def run() -> bool:
+    init_database()
+    with TestClient(app) as client:
+        response = client.post("/login", data={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD},
+                               follow_redirects=False)
+        # The session cookie is Secure; the test client talks plain HTTP.
+        client.cookies.set("session_token", response.cookies.get("session_token"))
+        with SessionLocal() as db:
+            feed_token = db.query(User.feed_token).filter(User.username == ADMIN_USERNAME).scalar()
+
+        print(f"disarmed check: {disarmed_cost() * 1e9:.0f}ns per request")
+        print(f"Server-Timing: {client.get('/').headers.get('server-timing')}")
+
+        client.post("/admin/profiling", data={"requests": "2", "syncs": "1", "memory": "true"},
+                    follow_redirects=False)
+        client.get(f"/feed/{feed_token}/calendar.ics").raise_for_status()
+        client.get("/api/events").raise_for_status()
+        client.get("/").raise_for_status()
+
+        server = serve_ics()
+        try:
+            sync_source(server.server_address[1])
+        finally:
+            server.shutdown()
+
+        captured = profiles()
+        for profile in captured:
+            print(f"  {profile.kind:<8} {profile.label:<40} {profile.duration_ms:>5}ms "
+                  f"{profile.samples:>4} samples  memory={'yes' if profile.memory else 'no'}")
+        summary = client.get(f"/admin/profiles/{captured[0].id}") if captured else None
+        stacks = client.get(f"/admin/profiles/{captured[0].id}/stacks.txt") if captured else None
+        admin_page = client.get("/admin")
+    capped, tracing_after_cap = capped_profile()
+
+    checks = [
+        ("two requests and one sync captured", [p.kind for p in captured] == ["request", "request", "sync"]),
+        ("feed label is the route template", bool(captured) and captured[0].label == "GET /feed/{token}/calendar.ics"),
+        ("no feed token in labels", all(feed_token not in p.label for p in captured)),
+        ("tracemalloc report stored", all(p.memory for p in captured)),
+        ("summary page", summary is not None and summary.status_code == 200 and "Own time" in summary.text),
+        ("stacks download", stacks is not None and stacks.status_code == 200
+         and "attachment" in stacks.headers.get("content-disposition", "")),
+        ("admin page lists profiles", admin_page.status_code == 200 and "/stacks.txt" in admin_page.text),
+        ("capture stops at the cap", capped["duration_ms"] < 200 and not tracing_after_cap
+         and bool(capped["memory"]) and "cap" in capped["summary"]),
+    ]
+    for name, passed in checks:
+        print(f"{'ok  ' if passed else 'FAIL'} {name}")
+    return all(passed for _, passed in checks)
+
+
+if __name__ == "__main__":
+    try:
+        passed = run()
+    finally:
+        engine.dispose()
+        _tmp.cleanup()
+    sys.exit(0 if passed else 1)
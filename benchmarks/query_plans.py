@@ -0,0 +1,125 @@
+"""Check that the hot queries use the indexes the migrations create.
+
+Builds a throwaway SQLite database through the migrations, fills it with a
+few users, sources and events, runs ANALYZE, and checks EXPLAIN QUERY PLAN
+for the queries behind the feed, the event API, the dashboard, session and
+token lookups, the sync reconciliation, shared-feed subscribers and
+full-text search. Exits non-zero if any plan doesn't use its index.
+
+Usage: python -m benchmarks.query_plans
+"""
+import os
+import sys
+import tempfile
+
+_tmp = tempfile.TemporaryDirectory()
+# Must be set before src.database creates its engines.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'plans.db')}"
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+
+from src.database import SessionLocal, engine
+from src.ics_generator import _unified_events_query, _upcoming_counts_query
+from src.models import ApplicationLog, CalendarSource, Event, OAuthToken, SourceType, User, UserRole, UserSession
+from src.schema import upgrade_database
+from src.search import _event_search_query, log_search_filter
+
+USERS = 20
+SOURCES_PER_USER = 5
+EVENTS_PER_SOURCE = 400
+
+
+def populate():
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(User), [{
+            "id": u, "username": f"user{u}", "hashed_password": "x", "role": UserRole.USER,
+            "is_active": True, "feed_token": f"token{u}"
+        } for u in range(1, USERS + 1)])
+        conn.execute(insert(CalendarSource), [{
+            "id": (u - 1) * SOURCES_PER_USER + s, "user_id": u, "name": f"s{s}",
+            "source_type": SourceType.ICS_FEED, "is_enabled": s != 1, "masking": False
+        } for u in range(1, USERS + 1) for s in range(1, SOURCES_PER_USER + 1)])
+        conn.execute(insert(Event), [{
+            "source_id": source_id, "original_uid": f"e{i}",
+            "start_datetime": now + timedelta(hours=i - EVENTS_PER_SOURCE // 2),
+            "end_datetime": now + timedelta(hours=i - EVENTS_PER_SOURCE // 2, minutes=30),
+            "is_all_day": False
+        } for source_id in range(1, USERS * SOURCES_PER_USER + 1) for i in range(EVENTS_PER_SOURCE)])
+        conn.execute(insert(UserSession), [{
+            "user_id": u, "session_token": f"session{u}-{n}", "expires_at": now + timedelta(days=n - 3)
+        } for u in range(1, USERS + 1) for n in range(7)])
+        conn.execute(insert(OAuthToken), [{
+            "user_id": u, "provider": provider
+        } for u in range(1, USERS + 1) for provider in ("google", "microsoft")])
+        conn.exec_driver_sql("ANALYZE")
+
+
+def plan(statement) -> str:
+    sql = str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+    return "\n".join(row[-1] for row in rows)
+
+
+def checks(session):
+    now = datetime.utcnow()
+    return [
+        ("feed / event API", _unified_events_query(user_id=3),
+         ["ix_calendar_sources_user_enabled", "ix_events_source_"]),
+        ("dashboard / preview (upcoming)", _unified_events_query(upcoming_only=True, user_id=3),
+         ["ix_calendar_sources_user_enabled", "ix_events_source_end"]),
+        ("feed token lookup", select(User).where(User.feed_token == "token3"),
+         ["ix_users_feed_token"]),
+        ("session lookup", select(User).join(UserSession, UserSession.user_id == User.id).where(
+            UserSession.session_token == "session3-5", UserSession.expires_at > now, User.is_active == True
+        ), ["ix_user_sessions_session_token"]),
+        ("expired session cleanup", delete(UserSession).where(UserSession.expires_at < now - timedelta(days=2)),
+         ["ix_user_sessions_expires_at"]),
+        ("dashboard top upcoming", _unified_events_query(upcoming_only=True, user_id=3, limit=10),
+         ["ix_calendar_sources_user_enabled", "ix_events_source_end"]),
+        ("dashboard upcoming counts", _upcoming_counts_query(3, now),
+         ["ix_calendar_sources_user_enabled", "ix_events_source_end"]),
+        ("dashboard source list", select(CalendarSource).where(CalendarSource.user_id == 3),
+         ["ix_calendar_sources_user_enabled"]),
+        ("sync reconciliation", select(Event).where(Event.source_id == 12),
+         ["ix_events_source_"]),
+        ("shared feed subscribers", select(CalendarSource.id).where(CalendarSource.fetch_key == "0" * 64),
+         ["ix_calendar_sources_fetch_key"]),
+        ("oauth token lookup", select(OAuthToken).where(OAuthToken.provider == "google", OAuthToken.user_id == 3),
+         ["ix_oauth_tokens_user_provider"]),
+        ("log search", select(ApplicationLog).where(log_search_filter(session, "sync failed")),
+         ["application_logs_fts"]),
+        ("event search", _event_search_query(session, 3, ["meeting"], 50),
+         ["events_fts"]),
+    ]
+
+
+def run() -> bool:
+    upgrade_database()
+    populate()
+    ok = True
+    with SessionLocal() as session:
+        statements = checks(session)
+    for label, statement, expected in statements:
+        query_plan = plan(statement)
+        missing = [index for index in expected if index not in query_plan]
+        status = "ok  " if not missing else "FAIL"
+        print(f"{status} {label}")
+        for line in query_plan.splitlines():
+            print(f"       {line}")
+        if missing:
+            print(f"       expected index: {', '.join(missing)}")
+            ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    try:
+        passed = run()
+    finally:
+        engine.dispose()
+        _tmp.cleanup()
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,133 @@
+"""Feed read latency while a large sync is writing, default vs. tuned pragmas.
+
+A writer thread keeps replacing one source's events in big transactions (a
+large calendar re-syncing); reader threads meanwhile query another source's
+events the way the ICS feed does.
+
+Usage: python -m benchmarks.read_during_sync [rows_per_sync] [seconds] [readers]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, delete, insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from src.database import Base, configure_sqlite_engine
+from src.models import CalendarSource, Event, SourceType, User, UserRole
+from src.ics_generator import get_unified_events
+
+READ_EVENTS = 500
+
+
+def make_engine(path: str, tuned: bool):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    if tuned:
+        configure_sqlite_engine(engine)
+    return engine
+
+
+def event_rows(source_id: int, count: int, prefix: str) -> list:
+    base = datetime.utcnow()
+    return [{
+        "source_id": source_id,
+        "original_uid": f"{prefix}-{i}",
+        "original_summary": f"Meeting {i}",
+        "original_description": "Agenda " * 20,
+        "original_location": "Room 1",
+        "start_datetime": base + timedelta(hours=i),
+        "end_datetime": base + timedelta(hours=i, minutes=30),
+        "is_all_day": False,
+        "last_synced_at": base,
+    } for i in range(count)]
+
+
+def setup(engine, rows: int):
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        reader = User(username="reader", hashed_password="x", role=UserRole.USER, feed_token="r")
+        writer = User(username="writer", hashed_password="x", role=UserRole.USER, feed_token="w")
+        session.add_all([reader, writer])
+        session.flush()
+        read_source = CalendarSource(user_id=reader.id, name="Read", source_type=SourceType.ICS_FEED)
+        write_source = CalendarSource(user_id=writer.id, name="Write", source_type=SourceType.ICS_FEED)
+        session.add_all([read_source, write_source])
+        session.flush()
+        session.execute(insert(Event), event_rows(read_source.id, READ_EVENTS, "r"))
+        session.execute(insert(Event), event_rows(write_source.id, rows, "w"))
+        session.commit()
+        return reader.id, write_source.id
+
+
+def writer_loop(engine, source_id: int, rows: int, stop: threading.Event, stats: dict):
+    Session = sessionmaker(bind=engine)
+    generation = 0
+    while not stop.is_set():
+        generation += 1
+        with Session() as session:
+            session.execute(delete(Event).where(Event.source_id == source_id))
+            session.execute(insert(Event), event_rows(source_id, rows, f"w{generation}"))
+            session.commit()
+        stats["syncs"] += 1
+
+
+def reader_loop(engine, user_id: int, stop: threading.Event, latencies: list, errors: list):
+    Session = sessionmaker(bind=engine)
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            with Session() as session:
+                get_unified_events(session, user_id=user_id)
+        except OperationalError as e:
+            errors.append(str(e.orig))
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def run_case(label: str, tuned: bool, rows: int, seconds: float, readers: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(os.path.join(tmp, "bench.db"), tuned)
+        reader_id, write_source_id = setup(engine, rows)
+
+        stop = threading.Event()
+        stats = {"syncs": 0}
+        latencies, errors = [], []
+        threads = [threading.Thread(target=writer_loop, args=(engine, write_source_id, rows, stop, stats))]
+        threads += [
+            threading.Thread(target=reader_loop, args=(engine, reader_id, stop, latencies, errors))
+            for _ in range(readers)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    ms = sorted(latency * 1000 for latency in latencies) or [0.0]
+    pick = lambda q: ms[min(len(ms) - 1, int(len(ms) * q))]
+    print(
+        f"  {label:<8} reads {len(latencies):6,}  p50 {pick(0.5):7.1f}ms  p95 {pick(0.95):7.1f}ms  "
+        f"p99 {pick(0.99):7.1f}ms  max {ms[-1]:7.1f}ms  errors {len(errors)}  syncs {stats['syncs']}"
+    )
+
+
+def run(rows: int, seconds: float, readers: int):
+    print(f"writer replaces {rows:,} events per sync; {readers} readers x {READ_EVENTS} events; {seconds:.0f}s each")
+    run_case("default", False, rows, seconds, readers)
+    run_case("tuned", True, rows, seconds, readers)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run(
+        int(args[0]) if len(args) > 0 else 20_000,
+        float(args[1]) if len(args) > 1 else 10,
+        int(args[2]) if len(args) > 2 else 4,
+    )
@@ -0,0 +1,169 @@
+"""Many users subscribed to the same ICS feed, synced through the queue.
+
+Runs against a temporary SQLite database. A local server counts requests
+for two generated feeds: a shared holiday calendar that twelve users
+subscribe to (spelled with different scheme case and fragments) and a
+second feed that only differs in its query string. One worker drains the
+queue; the check is that each feed was fetched once, that every enabled
+subscriber got all events and that a disabled one was left alone. Then it
+queues a single subscriber and checks the rest ride along on its fetch,
+and finally syncs every source on its own for comparison.
+
+Usage: python -m benchmarks.shared_feeds [subscribers] [events]
+"""
+import asyncio
+import http.server
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+_tmp = tempfile.TemporaryDirectory()
+# Must be set before src.database creates its engines.
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp.name, 'shared_feeds.db')}"
+os.environ.setdefault("SESSION_SECRET", "shared-feeds")
+
+from sqlalchemy import func
+
+from src.auth import hash_password
+from src.bootstrap import init_database
+from src.database import SessionLocal, engine
+from src.models import CalendarSource, Event, SourceType, SyncJob, User
+from src.sync_queue import JOB_SUCCEEDED, claim_job, enqueue_sources, enqueue_sync, run_job
+from src.sync_service import sync_calendar_source
+
+
+def build_feed(events: int) -> bytes:
+    base = datetime(2026, 11, 1, 9)
+    lines = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//bench//shared feeds//EN"]
+    for i in range(events):
+        start = base + timedelta(hours=4 * i)
+        lines += ["BEGIN:VEVENT", f"UID:holiday-{i}@bench", f"SUMMARY:Holiday {i}",
+                  f"DESCRIPTION:Office closed for holiday {i}", f"LOCATION:Office {i % 7}",
+                  f"DTSTART:{start:%Y%m%dT%H%M%S}Z", f"DTEND:{start + timedelta(hours=1):%Y%m%dT%H%M%S}Z",
+                  "END:VEVENT"]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(lines).encode()
+
+
+class FeedHandler(http.server.BaseHTTPRequestHandler):
+    feed = b""
+    requests = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        FeedHandler.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/calendar")
+        self.send_header("Content-Length", str(len(self.feed)))
+        self.end_headers()
+        self.wfile.write(self.feed)
+
+
+def create_sources(port: int, subscribers: int) -> tuple:
+    shared_urls = [f"http://127.0.0.1:{port}/holidays.ics", f"HTTP://127.0.0.1:{port}/holidays.ics",
+                   f"http://127.0.0.1:{port}/holidays.ics#imported"]
+    with SessionLocal() as db:
+        users = [User(username=f"user{i}", hashed_password=hash_password("x")) for i in range(subscribers)]
+        db.add_all(users)
+        db.flush()
+        shared = [
+            CalendarSource(user_id=user.id, name=f"Holidays {i}", source_type=SourceType.ICS_FEED,
+                           caldav_url=shared_urls[i % len(shared_urls)])
+            for i, user in enumerate(users)
+        ]
+        other = [
+            CalendarSource(user_id=users[i].id, name=f"Team B {i}", source_type=SourceType.ICS_FEED,
+                           caldav_url=f"http://127.0.0.1:{port}/holidays.ics?team=b")
+            for i in range(2)
+        ]
+        disabled = CalendarSource(user_id=users[0].id, name="Holidays (off)", source_type=SourceType.ICS_FEED,
+                                  caldav_url=shared_urls[0], is_enabled=False)
+        db.add_all(shared + other + [disabled])
+        db.commit()
+        return [s.id for s in shared], [s.id for s in other], disabled.id
+
+
+async def drain_queue() -> int:
+    claims = 0
+    while True:
+        with SessionLocal() as db:
+            job = claim_job(db)
+        if job is None:
+            return claims
+        claims += 1
+        await run_job(job)
+
+
+def event_counts() -> dict:
+    with SessionLocal() as db:
+        return dict(db.query(Event.source_id, func.count(Event.id)).group_by(Event.source_id).all())
+
+
+def run(subscribers: int, events: int) -> bool:
+    init_database()
+    FeedHandler.feed = build_feed(events)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FeedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        shared_ids, other_ids, disabled_id = create_sources(server.server_address[1], subscribers)
+        enabled_ids = shared_ids + other_ids
+
+        with SessionLocal() as db:
+            enqueue_sources(db, db.query(CalendarSource).filter(CalendarSource.id.in_(enabled_ids)).all())
+        started = time.perf_counter()
+        claims = asyncio.run(drain_queue())
+        queued_time = time.perf_counter() - started
+        queued_fetches = FeedHandler.requests
+        counts = event_counts()
+        with SessionLocal() as db:
+            succeeded = db.query(SyncJob).filter(SyncJob.status == JOB_SUCCEEDED).count()
+
+        FeedHandler.requests = 0
+        with SessionLocal() as db:
+            enqueue_sync(db, shared_ids[-1], reason="manual")
+        asyncio.run(drain_queue())
+        ride_along_fetches = FeedHandler.requests
+        with SessionLocal() as db:
+            shared_jobs = db.query(SyncJob).filter(SyncJob.reason == "shared").count()
+
+        FeedHandler.requests = 0
+        started = time.perf_counter()
+        with SessionLocal() as db:
+            for source_id in enabled_ids:
+                asyncio.run(sync_calendar_source(db, db.get(CalendarSource, source_id)))
+        single_time = time.perf_counter() - started
+        single_fetches = FeedHandler.requests
+    finally:
+        server.shutdown()
+
+    print(f"{len(shared_ids)} subscribers of one feed + {len(other_ids)} of another, {events:,} events each")
+    print(f"  queue, shared fetch  {queued_time * 1000:7.0f}ms  {queued_fetches} fetches, {claims} claims")
+    print(f"  one by one           {single_time * 1000:7.0f}ms  {single_fetches} fetches")
+    checks = [
+        ("one fetch per distinct feed", queued_fetches == 2),
+        ("every enabled source synced", succeeded == len(enabled_ids)),
+        ("every subscriber got every event", all(counts.get(i) == events for i in enabled_ids)),
+        ("disabled subscriber left alone", disabled_id not in counts),
+        ("one queued subscriber brings the others along",
+         ride_along_fetches == 1 and shared_jobs == len(shared_ids) - 1),
+        ("without sharing every source fetches", single_fetches == len(enabled_ids)),
+    ]
+    for name, passed in checks:
+        print(f"{'ok  ' if passed else 'FAIL'} {name}")
+    return all(passed for _, passed in checks)
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    subscribers, events = (args + [12, 2000][len(args):])[:2]
+    try:
+        passed = run(subscribers, events)
+    finally:
+        engine.dispose()
+        _tmp.cleanup()
+    sys.exit(0 if passed else 1)
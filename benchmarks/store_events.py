@@ -0,0 +1,116 @@
+"""Time (and check) the sync store against a real database.
+
+Runs three syncs of one source: initial load, unchanged re-sync, and a
+re-sync with 10% edited, 5% removed and 5% new events. Every strategy the
+backend supports is timed and its added/updated/removed counts are checked.
+On PostgreSQL that is the ORM diff, the ON CONFLICT upsert fed by INSERT,
+and the upsert fed by COPY.
+
+Usage: python -m benchmarks.store_events [database_url] [count]
+       (database_url defaults to a temporary SQLite file)
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import sessionmaker
+
+from src import sync_service
+from src.database import Base, normalize_database_url
+from src.models import CalendarSource, Event, SourceType, User, UserRole
+
+
+def make_events(count: int, offset: int = 0) -> list:
+    base = datetime(2025, 1, 1, 8, 0)
+    return [{
+        "uid": f"bench-{i}",
+        "summary": f"Meeting {i}",
+        "description": "Agenda\twith\\tabs\nand lines",
+        "location": "Room 1",
+        "start": base + timedelta(hours=i),
+        "end": base + timedelta(hours=i, minutes=30),
+        "is_all_day": i % 20 == 0,
+    } for i in range(offset, offset + count)]
+
+
+def churn(events: list) -> list:
+    count = len(events)
+    kept = events[:count - count // 20]
+    changed = [
+        dict(event, summary=event["summary"] + " (moved)") if i % 10 == 0 else event
+        for i, event in enumerate(kept)
+    ]
+    return changed + make_events(count // 20, offset=count)
+
+
+def run_strategy(Session, label: str, store, count: int):
+    with Session() as session:
+        user = User(username=f"bench-{label}", hashed_password="x", role=UserRole.USER)
+        session.add(user)
+        session.flush()
+        source = CalendarSource(user_id=user.id, name=label, source_type=SourceType.ICS_FEED)
+        session.add(source)
+        session.commit()
+
+        initial = make_events(count)
+        expected_churn = {"added": count // 20, "updated": len([
+            i for i in range(count - count // 20) if i % 10 == 0
+        ]), "removed": count // 20}
+        rounds = [
+            ("initial", initial, {"added": count, "updated": 0, "removed": 0}),
+            ("unchanged", initial, {"added": 0, "updated": 0, "removed": 0}),
+            ("churn", churn(initial), expected_churn),
+        ]
+        timings = []
+        for name, events, expected in rounds:
+            started = time.perf_counter()
+            counts = store(session, source, events)
+            session.commit()
+            timings.append(time.perf_counter() - started)
+            got = {key: counts[key] for key in expected}
+            if got != expected:
+                raise AssertionError(f"{label}/{name}: expected {expected}, got {got}")
+
+        stored = session.query(Event).filter(Event.source_id == source.id).count()
+        if stored != len(rounds[-1][1]):
+            raise AssertionError(f"{label}: {stored} rows stored, expected {len(rounds[-1][1])}")
+
+        session.execute(delete(Event).where(Event.source_id == source.id))
+        session.delete(source)
+        session.delete(user)
+        session.commit()
+
+    print(f"  {label:<16} " + "  ".join(
+        f"{name} {elapsed:7.3f}s" for (name, _, _), elapsed in zip(rounds, timings)
+    ))
+
+
+def run(url: str, count: int):
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+
+    print(f"{engine.dialect.name}: {count:,} events per sync")
+    run_strategy(Session, "orm diff", sync_service.store_events_orm, count)
+    if engine.dialect.name == "postgresql":
+        original = sync_service.PG_COPY_THRESHOLD
+        try:
+            sync_service.PG_COPY_THRESHOLD = count + 1
+            run_strategy(Session, "upsert (insert)", sync_service.store_events_postgres, count)
+            sync_service.PG_COPY_THRESHOLD = 0
+            run_strategy(Session, "upsert (copy)", sync_service.store_events_postgres, count)
+        finally:
+            sync_service.PG_COPY_THRESHOLD = original
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    if len(sys.argv) > 1 and sys.argv[1]:
+        run(normalize_database_url(sys.argv[1]), count)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            run(f"sqlite:///{os.path.join(tmp, 'bench.db')}", count)
@@ -1,27 +1,41 @@
+import asyncio
+import json
 import os
 import secrets
+import time
 from datetime import datetime
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, Depends, Form, HTTPException, Query
-from fastapi.responses import HTMLResponse, RedirectResponse, Response
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.database import engine, get_db, Base
+from src.database import get_db, get_async_db, AsyncSessionLocal
 from src.models import (
     CalendarSource, Event, AppSettings, SourceType, OAuthSettings, OAuthToken,
-    User, UserRole, GlobalSettings, ApplicationLog
+    User, UserRole, GlobalSettings, ApplicationLog, PerformanceProfile
 )
 from src.auth import (
-    require_auth, require_admin, get_current_user_from_session,
-    authenticate_user, create_session, destroy_session, hash_password,
+    require_auth, require_auth_async, require_admin, get_current_user_from_session,
+    authenticate_user, create_session, destroy_session, destroy_user_sessions, invalidate_user_sessions,
+    hash_password,
     create_default_admin, is_admin
 )
 from src.crypto import encrypt_password
-from src.sync_service import sync_calendar_source, sync_all_sources
-from src.ics_generator import generate_unified_ics, get_unified_events
-from src.scheduler import start_scheduler, stop_scheduler
+from src.sync_queue import enqueue_sync, enqueue_sources, get_sync_progress_async, get_user_started_job_ids
+from src.ics_generator import (
+    generate_unified_ics_async, get_unified_events, get_unified_events_async, get_events_version_async,
+    count_upcoming_events, get_events_version
+)
+from src.event_cache import (
+    cache_dashboard, cache_events, encode_json, get_cached_dashboard, get_cached_events
+)
+from src.iso_datetime import parse_utc_naive
+from src.scheduler import start_scheduler, stop_scheduler, web_runs_scheduler
+from src.bootstrap import init_database
 from src.custom_oauth_service import (
     get_oauth_settings, save_oauth_settings, get_oauth_token, save_oauth_token,
     delete_oauth_token, get_decrypted_client_secret,
@@ -29,38 +43,45 @@ from src.custom_oauth_service import (
     exchange_google_code, exchange_microsoft_code,
     get_valid_google_token, get_valid_microsoft_token,
     list_google_calendars_custom, list_microsoft_calendars_custom,
-    get_google_user_email, get_microsoft_user_email
+    get_google_user_email, get_microsoft_user_email, get_provider_account
 )
 from src.settings_service import (
     get_setting, set_setting, get_all_settings, get_base_url as get_base_url_setting,
     initialize_default_settings
 )
-from src.logging_service import get_logs, add_log, clear_old_logs
+from src.search import EVENT_SEARCH_LIMIT, search_events_async
+from src.logging_service import get_logs, add_log, clear_old_logs, stop_log_writer
+from src.provider_policy import get_policy_snapshot
+from src.sync_runs import get_sync_run_stats
+from src.profiling import PROFILE_MEMORY, PROFILE_REQUESTS, PROFILE_SYNCS, RequestTimingMiddleware, refresh_armed
+from src.metrics import (
+    CONTENT_TYPE_LATEST as METRICS_CONTENT_TYPE, FEED_BYTES, FEED_RENDER_SECONDS, METRICS_TOKEN, render_metrics
+)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    Base.metadata.create_all(bind=engine)
-    
-    db = next(get_db())
-    create_default_admin(db)
-    initialize_default_settings(db)
-    
-    settings = db.query(AppSettings).first()
-    if not settings:
-        settings = AppSettings(feed_token=secrets.token_urlsafe(32))
-        db.add(settings)
-        db.commit()
-    db.close()
+    init_database()
     
-    start_scheduler()
+    if web_runs_scheduler():
+        start_scheduler()
     yield
     stop_scheduler()
+    stop_log_writer()
 
 
 app = FastAPI(title="Calendar Aggregator", lifespan=lifespan)
+app.add_middleware(RequestTimingMiddleware)
 templates = Jinja2Templates(directory="templates")
 
+# Server-sent sync progress: how often the job table is polled per open
+# stream, and how long a quiet stream waits before sending a keepalive.
+SYNC_PROGRESS_POLL_SECONDS = 1.0
+SYNC_PROGRESS_KEEPALIVE_SECONDS = 15
+SYNC_PROGRESS_RETRY_MS = 3000
+# Upcoming events previewed on the dashboard
+DASHBOARD_EVENT_LIMIT = 10
+
 
 def get_base_url(request: Request, db: Session = None) -> str:
     if db:
@@ -86,16 +107,66 @@ def get_feed_token(db: Session, user: User = None) -> str:
     return ""
 
 
+def fullcalendar_event(event: dict) -> dict:
+    if event["is_masked"]:
+        return {
+            "id": event["id"],
+            "title": event["summary"],
+            "start": event["start"].isoformat(),
+            "end": event["end"].isoformat(),
+            "allDay": event["is_all_day"],
+            "extendedProps": {
+                "source": event["source_name"],
+                "location": "",
+                "description": "",
+                "isMasked": True
+            },
+            "backgroundColor": "#e74c3c",
+            "borderColor": "#c0392b"
+        }
+    else:
+        return {
+            "id": event["id"],
+            "title": event["summary"],
+            "start": event["start"].isoformat(),
+            "end": event["end"].isoformat(),
+            "allDay": event["is_all_day"],
+            "extendedProps": {
+                "source": event["source_name"],
+                "location": event["location"],
+                "description": event["description"],
+                "isMasked": False
+            },
+            "backgroundColor": "#3498db",
+            "borderColor": "#2980b9"
+        }
+
+
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request, db: Session = Depends(get_db)):
     user = require_auth(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    sources = db.query(CalendarSource).filter(
+    # Only the columns the table shows; full rows drag in encrypted
+    # credentials for nothing.
+    sources = db.query(
+        CalendarSource.id, CalendarSource.name, CalendarSource.source_type, CalendarSource.masking,
+        CalendarSource.is_enabled, CalendarSource.last_sync_at, CalendarSource.last_sync_status,
+        CalendarSource.last_sync_error
+    ).filter(
         CalendarSource.user_id == user.id
     ).order_by(CalendarSource.created_at.desc()).all()
-    events = get_unified_events(db, apply_masking=True, upcoming_only=True, user_id=user.id)
+    version = get_events_version(db, user.id)
+    preview = get_cached_dashboard(user.id, version)
+    if preview is None:
+        upcoming_counts, next_end = count_upcoming_events(db, user.id)
+        events = get_unified_events(db, apply_masking=True, upcoming_only=True, user_id=user.id,
+                                    limit=DASHBOARD_EVENT_LIMIT)
+        preview = (events, upcoming_counts)
+        cache_dashboard(user.id, version, next_end, preview)
+    events, upcoming_counts = preview
+    upcoming_total = sum(upcoming_counts.get(source.id, 0) for source in sources if source.is_enabled)
     
     base_url = get_base_url(request, db)
     public_domain = get_public_domain(db)
@@ -112,9 +183,12 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
         "is_admin": is_admin(user),
         "sources": sources,
         "events": events,
+        "upcoming_counts": upcoming_counts,
+        "upcoming_total": upcoming_total,
         "ics_url": ics_url,
         "webcal_url": webcal_url,
-        "message": message
+        "message": message,
+        "watch_job_ids": get_user_started_job_ids(db, user.id)
     })
 
 
@@ -341,7 +415,9 @@ async def microsoft_login_callback(request: Request, code: str = None, error: st
 
 @app.get("/admin", response_class=HTMLResponse)
 async def admin_panel(request: Request, db: Session = Depends(get_db)):
-    from src.scheduler import get_current_interval, get_next_run_time
+    from src.scheduler import (
+        get_current_interval, get_next_run_time, get_active_workers, get_worker_policy_snapshot
+    )
     
     user = require_admin(request, db)
     if not user:
@@ -354,6 +430,14 @@ async def admin_panel(request: Request, db: Session = Depends(get_db)):
     
     next_sync = get_next_run_time()
     current_interval = get_current_interval()
+    sync_workers = get_active_workers(db)
+    provider_policies = get_policy_snapshot() or get_worker_policy_snapshot(db)
+    sync_stats = get_sync_run_stats(db)
+    profiles = db.query(
+        PerformanceProfile.id, PerformanceProfile.kind, PerformanceProfile.label, PerformanceProfile.created_at,
+        PerformanceProfile.duration_ms, PerformanceProfile.samples,
+        PerformanceProfile.memory.isnot(None).label("has_memory")
+    ).order_by(PerformanceProfile.id.desc()).all()
     
     return templates.TemplateResponse("admin.html", {
         "request": request,
@@ -364,7 +448,11 @@ async def admin_panel(request: Request, db: Session = Depends(get_db)):
         "message": message,
         "error": error,
         "next_sync": next_sync,
-        "current_interval": current_interval
+        "current_interval": current_interval,
+        "provider_policies": provider_policies,
+        "sync_stats": sync_stats,
+        "profiles": profiles,
+        "sync_workers": sync_workers
     })
 
 
@@ -414,6 +502,7 @@ async def delete_user(request: Request, user_id: int, db: Session = Depends(get_
         return RedirectResponse(url="/admin?error=Cannot delete yourself", status_code=302)
     
     username = target_user.username
+    destroy_user_sessions(db, target_user.id)
     db.delete(target_user)
     db.commit()
     
@@ -438,6 +527,7 @@ async def reset_user_password(
     
     target_user.hashed_password = hash_password(new_password)
     db.commit()
+    destroy_user_sessions(db, target_user.id)
     
     add_log(db, "INFO", f"Admin '{admin.username}' reset password for user '{target_user.username}'", source="admin")
     return RedirectResponse(url="/admin?message=Password reset successfully", status_code=302)
@@ -458,6 +548,7 @@ async def toggle_user_active(request: Request, user_id: int, db: Session = Depen
     
     target_user.is_active = not target_user.is_active
     db.commit()
+    invalidate_user_sessions(target_user.id)
     
     status = "activated" if target_user.is_active else "deactivated"
     add_log(db, "INFO", f"Admin '{admin.username}' {status} user '{target_user.username}'", source="admin")
@@ -471,7 +562,9 @@ async def save_general_settings(
     base_url: str = Form(""),
     public_domain: str = Form(""),
     app_name: str = Form(""),
-    sync_interval: str = Form("10")
+    sync_interval: str = Form("10"),
+    log_retention_days: str = Form(""),
+    log_max_rows: str = Form("")
 ):
     from src.scheduler import update_sync_interval
     
@@ -496,11 +589,76 @@ async def save_general_settings(
             update_sync_interval(interval_int)
         except ValueError:
             pass
+    if log_retention_days:
+        try:
+            set_setting(db, 'log_retention_days', str(min(max(int(log_retention_days), 0), 3650)))
+        except ValueError:
+            pass
+    if log_max_rows:
+        try:
+            set_setting(db, 'log_max_rows', str(max(int(log_max_rows), 0)))
+        except ValueError:
+            pass
     
     add_log(db, "INFO", f"Admin '{admin.username}' updated general settings", source="admin")
     return RedirectResponse(url="/admin?message=Settings saved successfully", status_code=302)
 
 
+@app.post("/admin/profiling")
+async def arm_profiling(
+    request: Request,
+    db: Session = Depends(get_db),
+    requests: str = Form("0"),
+    syncs: str = Form("0"),
+    memory: str = Form("")
+):
+    admin = require_admin(request, db)
+    if not admin:
+        return RedirectResponse(url="/login", status_code=302)
+    
+    try:
+        request_count = min(max(int(requests or 0), 0), 100)
+        sync_count = min(max(int(syncs or 0), 0), 20)
+    except ValueError:
+        return RedirectResponse(url="/admin?error=Invalid profiling counts", status_code=302)
+    set_setting(db, PROFILE_REQUESTS, str(request_count))
+    set_setting(db, PROFILE_SYNCS, str(sync_count))
+    set_setting(db, PROFILE_MEMORY, 'true' if memory else 'false')
+    refresh_armed()
+    
+    add_log(db, "INFO", f"Admin '{admin.username}' armed profiling: {request_count} request(s), "
+            f"{sync_count} sync run(s){', with tracemalloc' if memory else ''}", source="admin")
+    return RedirectResponse(url="/admin?message=Profiling armed", status_code=302)
+
+
+def _get_profile(db: Session, profile_id: int) -> PerformanceProfile:
+    profile = db.get(PerformanceProfile, profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def view_profile(request: Request, profile_id: int, db: Session = Depends(get_db)):
+    if not require_admin(request, db):
+        return RedirectResponse(url="/login", status_code=302)
+    profile = _get_profile(db, profile_id)
+    body = profile.summary
+    if profile.memory:
+        body += "\n\nMemory (tracemalloc):\n" + profile.memory
+    return PlainTextResponse(body)
+
+
+@app.get("/admin/profiles/{profile_id}/stacks.txt")
+async def download_profile_stacks(request: Request, profile_id: int, db: Session = Depends(get_db)):
+    if not require_admin(request, db):
+        return RedirectResponse(url="/login", status_code=302)
+    profile = _get_profile(db, profile_id)
+    return PlainTextResponse(profile.stacks, headers={
+        "Content-Disposition": f'attachment; filename="profile-{profile.id}-{profile.kind}.folded.txt"'
+    })
+
+
 @app.post("/admin/sync/trigger")
 async def trigger_manual_sync(request: Request, db: Session = Depends(get_db)):
     admin = require_admin(request, db)
@@ -509,14 +667,9 @@ async def trigger_manual_sync(request: Request, db: Session = Depends(get_db)):
     
     add_log(db, "INFO", f"Admin '{admin.username}' triggered manual sync", source="admin")
     
-    results = await sync_all_sources(db)
-    success_count = sum(1 for r in results.values() if r["success"])
-    fail_count = len(results) - success_count
-    
-    if fail_count == 0:
-        message = f"Sync completed: {success_count} source(s) synced successfully"
-    else:
-        message = f"Sync completed: {success_count} success, {fail_count} failed"
+    sources = db.query(CalendarSource).filter(CalendarSource.is_enabled == True).all()
+    jobs = enqueue_sources(db, sources, reason="manual")
+    message = f"Sync started for {len(jobs)} source(s). Results appear in the logs."
     
     return RedirectResponse(url=f"/admin?message={message}", status_code=302)
 
@@ -527,13 +680,14 @@ async def view_logs(
     db: Session = Depends(get_db),
     level: str = Query(None),
     hours: int = Query(24),
-    limit: int = Query(100)
+    limit: int = Query(100),
+    q: str = Query(None)
 ):
     admin = require_admin(request, db)
     if not admin:
         return RedirectResponse(url="/login", status_code=302)
     
-    logs = get_logs(db, limit=limit, level=level, hours=hours)
+    logs = get_logs(db, limit=limit, level=level, hours=hours, q=q)
     
     return templates.TemplateResponse("logs.html", {
         "request": request,
@@ -542,7 +696,8 @@ async def view_logs(
         "logs": logs,
         "current_level": level,
         "current_hours": hours,
-        "current_limit": limit
+        "current_limit": limit,
+        "current_q": q or ""
     })
 
 
@@ -581,27 +736,35 @@ async def add_source_page(request: Request, db: Session = Depends(get_db)):
     
     google_token = get_oauth_token(db, "google", user_id=user.id)
     outlook_token = get_oauth_token(db, "outlook", user_id=user.id)
+    # ?refresh=google / ?refresh=outlook skips the cached account details
+    refresh = request.query_params.get("refresh")
     
+    providers = []
     if google_configured and google_token:
-        try:
-            access_token = await get_valid_google_token(db, user_id=user.id)
-            if access_token:
-                google_connected = True
-                google_email = await get_google_user_email(access_token)
-                google_calendars = await list_google_calendars_custom(access_token)
-        except Exception as e:
-            print(f"Error fetching Google calendars: {e}")
-            error = f"Google error: {e}"
-    
+        providers.append("google")
     if outlook_configured and outlook_token:
-        try:
-            access_token = await get_valid_microsoft_token(db, user_id=user.id)
-            if access_token:
+        providers.append("outlook")
+    accounts = await asyncio.gather(
+        *[get_provider_account(db, provider, user_id=user.id, refresh=refresh == provider) for provider in providers],
+        return_exceptions=True
+    )
+    
+    for provider, account in zip(providers, accounts):
+        if isinstance(account, Exception):
+            if provider == "google":
+                print(f"Error fetching Google calendars: {account}")
+                error = f"Google error: {account}"
+            else:
+                print(f"Error fetching Outlook calendars: {account}")
+        elif account is not None:
+            if provider == "google":
+                google_connected = True
+                google_email = account["email"]
+                google_calendars = account["calendars"]
+            else:
                 outlook_connected = True
-                outlook_email = await get_microsoft_user_email(access_token)
-                outlook_calendars = await list_microsoft_calendars_custom(access_token)
-        except Exception as e:
-            print(f"Error fetching Outlook calendars: {e}")
+                outlook_email = account["email"]
+                outlook_calendars = account["calendars"]
     
     return templates.TemplateResponse("sources_add.html", {
         "request": request,
@@ -663,10 +826,10 @@ async def add_source(
     db.commit()
     
     add_log(db, "INFO", f"User '{user.username}' added calendar source '{name}'", source="calendar")
-    success, message = await sync_calendar_source(db, source, user_id=user.id)
+    enqueue_sync(db, source.id, reason="added")
     
     return RedirectResponse(
-        url=f"/?message=Source added successfully. Sync: {message}",
+        url="/?message=Source added successfully. Initial sync started.",
         status_code=302
     )
 
@@ -721,6 +884,11 @@ async def edit_source(
     source.caldav_url = caldav_url
     source.username = username
     source.google_calendar_id = google_calendar_id or "primary"
+    # Google and Outlook syncs skip description and location for masked
+    # sources; fetch them again as soon as masking is turned off.
+    refetch_details = source.masking and not masking and source.source_type in (
+        SourceType.GOOGLE_CALENDAR, SourceType.OUTLOOK_OAUTH
+    )
     source.masking = masking
     source.is_enabled = is_enabled
     
@@ -728,6 +896,8 @@ async def edit_source(
         source.encrypted_password = encrypt_password(password)
     
     db.commit()
+    if refetch_details and source.is_enabled:
+        enqueue_sync(db, source.id, reason="manual")
     
     return RedirectResponse(url="/?message=Source updated successfully", status_code=302)
 
@@ -762,12 +932,9 @@ async def sync_source(request: Request, source_id: int, db: Session = Depends(ge
     if not source:
         raise HTTPException(status_code=404, detail="Source not found")
     
-    success, message = await sync_calendar_source(db, source, user_id=user.id)
+    enqueue_sync(db, source.id, reason="manual")
     
-    return RedirectResponse(
-        url=f"/?message=Sync {'completed' if success else 'failed'}: {message}",
-        status_code=302
-    )
+    return RedirectResponse(url=f"/?message=Sync started for {source.name}", status_code=302)
 
 
 @app.post("/sync-all")
@@ -776,24 +943,64 @@ async def sync_all(request: Request, db: Session = Depends(get_db)):
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    results = await sync_all_sources(db, user_id=user.id)
-    
-    success_count = sum(1 for r in results.values() if r["success"])
-    total_count = len(results)
+    sources = db.query(CalendarSource).filter(
+        CalendarSource.user_id == user.id,
+        CalendarSource.is_enabled == True
+    ).all()
+    jobs = enqueue_sources(db, sources, reason="manual")
     
     return RedirectResponse(
-        url=f"/?message=Synced {success_count}/{total_count} sources",
+        url=f"/?message=Sync started for {len(jobs)} source(s)",
         status_code=302
     )
 
 
+@app.get("/api/sync/progress")
+async def sync_progress_stream(request: Request, db: AsyncSession = Depends(get_async_db)):
+    user = await require_auth_async(request, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    user_id = user.id
+    await db.close()
+    
+    async def events():
+        last_payload = None
+        idle_ticks = 0
+        yield f"retry: {SYNC_PROGRESS_RETRY_MS}\n\n"
+        while not await request.is_disconnected():
+            async with AsyncSessionLocal() as poll_db:
+                progress = await get_sync_progress_async(poll_db, user_id)
+            payload = json.dumps(progress, default=str)
+            
+            if payload != last_payload:
+                last_payload = payload
+                idle_ticks = 0
+                yield f"event: progress\ndata: {payload}\n\n"
+            # Nothing left to follow: the last event tells the page to close
+            # the stream, so the browser does not reconnect.
+            if not progress["active"]:
+                return
+            else:
+                idle_ticks += 1
+                if idle_ticks * SYNC_PROGRESS_POLL_SECONDS >= SYNC_PROGRESS_KEEPALIVE_SECONDS:
+                    idle_ticks = 0
+                    yield ": keepalive\n\n"
+            await asyncio.sleep(SYNC_PROGRESS_POLL_SECONDS)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.get("/preview", response_class=HTMLResponse)
-async def preview(request: Request, db: Session = Depends(get_db)):
-    user = require_auth(request, db)
+async def preview(request: Request, db: AsyncSession = Depends(get_async_db)):
+    user = await require_auth_async(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=302)
     
-    events = get_unified_events(db, apply_masking=True, upcoming_only=True, user_id=user.id)
+    events = await get_unified_events_async(db, apply_masking=True, upcoming_only=True, user_id=user.id)
     
     return templates.TemplateResponse("preview.html", {
         "request": request,
@@ -804,18 +1011,22 @@ async def preview(request: Request, db: Session = Depends(get_db)):
 
 
 @app.get("/feed/{token}/calendar.ics")
-async def ics_feed(token: str, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.feed_token == token).first()
+async def ics_feed(token: str, db: AsyncSession = Depends(get_async_db)):
+    started = time.perf_counter()
+    user = (await db.execute(select(User).where(User.feed_token == token))).scalars().first()
     if user:
-        ics_content = generate_unified_ics(db, apply_masking=True, user_id=user.id)
+        ics_content = await generate_unified_ics_async(db, apply_masking=True, user_id=user.id)
     else:
-        settings = db.query(AppSettings).first()
+        settings = (await db.execute(select(AppSettings))).scalars().first()
         if not settings or settings.feed_token != token:
             raise HTTPException(status_code=403, detail="Invalid feed token")
-        ics_content = generate_unified_ics(db, apply_masking=True)
+        ics_content = await generate_unified_ics_async(db, apply_masking=True)
+    body = ics_content.encode("utf-8")
+    FEED_RENDER_SECONDS.labels("ics").observe(time.perf_counter() - started)
+    FEED_BYTES.labels("ics").observe(len(body))
     
     return Response(
-        content=ics_content,
+        content=body,
         media_type="text/calendar",
         headers={
             "Content-Disposition": "attachment; filename=calendar.ics",
@@ -825,51 +1036,50 @@ async def ics_feed(token: str, db: Session = Depends(get_db)):
 
 
 @app.get("/api/events")
-async def api_events(request: Request, db: Session = Depends(get_db)):
-    user = require_auth(request, db)
+async def api_events(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    start: str = Query(None),
+    end: str = Query(None)
+):
+    user = await require_auth_async(request, db)
     if not user:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    events = get_unified_events(db, apply_masking=True, upcoming_only=False, user_id=user.id)
-    
-    fullcalendar_events = []
-    for event in events:
-        if event["is_masked"]:
-            fc_event = {
-                "id": event["id"],
-                "title": event["summary"],
-                "start": event["start"].isoformat(),
-                "end": event["end"].isoformat(),
-                "allDay": event["is_all_day"],
-                "extendedProps": {
-                    "source": event["source_name"],
-                    "location": "",
-                    "description": "",
-                    "isMasked": True
-                },
-                "backgroundColor": "#e74c3c",
-                "borderColor": "#c0392b"
-            }
-        else:
-            fc_event = {
-                "id": event["id"],
-                "title": event["summary"],
-                "start": event["start"].isoformat(),
-                "end": event["end"].isoformat(),
-                "allDay": event["is_all_day"],
-                "extendedProps": {
-                    "source": event["source_name"],
-                    "location": event["location"],
-                    "description": event["description"],
-                    "isMasked": False
-                },
-                "backgroundColor": "#3498db",
-                "borderColor": "#2980b9"
-            }
-        
-        fullcalendar_events.append(fc_event)
+    try:
+        range_start = parse_utc_naive(start) if start else None
+        range_end = parse_utc_naive(end) if end else None
+    except (ValueError, OverflowError):
+        raise HTTPException(status_code=400, detail="Invalid start or end")
+    
+    started = time.perf_counter()
+    # Read the version first: a sync landing in between makes the cached
+    # body look stale, never the other way round.
+    version = await get_events_version_async(db, user.id)
+    cache_key = (user.id, range_start, range_end)
+    body = get_cached_events(cache_key, version)
+    if body is None:
+        events = await get_unified_events_async(db, apply_masking=True, user_id=user.id,
+                                                start=range_start, end=range_end)
+        body = encode_json([fullcalendar_event(event) for event in events])
+        cache_events(cache_key, version, body)
+    FEED_RENDER_SECONDS.labels("api_events").observe(time.perf_counter() - started)
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/api/events/search")
+async def api_events_search(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    q: str = Query(""),
+    limit: int = Query(EVENT_SEARCH_LIMIT)
+):
+    user = await require_auth_async(request, db)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
     
-    return fullcalendar_events
+    events = await search_events_async(db, user.id, q, limit=limit)
+    return [fullcalendar_event(event) for event in events]
 
 
 @app.get("/settings", response_class=HTMLResponse)
@@ -1165,6 +1375,15 @@ async def health():
     return {"status": "ok", "timestamp": datetime.utcnow().isoformat()}
 
 
+@app.get("/metrics")
+async def metrics(request: Request):
+    if METRICS_TOKEN and not secrets.compare_digest(
+        request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"
+    ):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.get("/favicon.ico")
 async def favicon():
     return Response(content="", media_type="image/x-icon")
@@ -0,0 +1,199 @@
+"""Baseline: the schema as create_all built it before migrations existed
+
+Databases from before migrations already have some or all of these tables,
+so every table is only created when missing, and tables from older versions
+get the columns added since.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _inspector():
+    return sa.inspect(op.get_bind())
+
+
+def _create_table(name, *columns, indexes=()):
+    if _inspector().has_table(name):
+        return
+    op.create_table(name, *columns)
+    op.create_index(f"ix_{name}_id", name, ["id"])
+    for index_name, index_columns, kwargs in indexes:
+        op.create_index(index_name, name, index_columns, **kwargs)
+
+
+def upgrade():
+    _create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(255), nullable=False, unique=True),
+        sa.Column("email", sa.String(255), nullable=True),
+        sa.Column("hashed_password", sa.Text(), nullable=False),
+        sa.Column("role", sa.Enum("ADMIN", "USER", name="userrole"), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("feed_token", sa.String(64), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        "calendar_sources",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("name", sa.String(255), nullable=False),
+        sa.Column("source_type", sa.Enum(
+            "GOOGLE_CALENDAR", "OUTLOOK_OAUTH", "CALDAV", "OUTLOOK", "ICLOUD", "ICS_FEED", name="sourcetype"
+        ), nullable=False),
+        sa.Column("caldav_url", sa.String(512), nullable=True),
+        sa.Column("username", sa.String(255), nullable=True),
+        sa.Column("encrypted_password", sa.Text(), nullable=True),
+        sa.Column("masking", sa.Boolean(), nullable=True),
+        sa.Column("is_enabled", sa.Boolean(), nullable=True),
+        sa.Column("last_sync_at", sa.DateTime(), nullable=True),
+        sa.Column("last_sync_status", sa.String(50), nullable=True),
+        sa.Column("last_sync_error", sa.Text(), nullable=True),
+        sa.Column("google_calendar_id", sa.String(255), nullable=True),
+        sa.Column("outlook_calendar_id", sa.String(255), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        "events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("source_id", sa.Integer(), sa.ForeignKey("calendar_sources.id"), nullable=False),
+        sa.Column("original_uid", sa.String(512), nullable=False),
+        sa.Column("start_datetime", sa.DateTime(), nullable=False),
+        sa.Column("end_datetime", sa.DateTime(), nullable=False),
+        sa.Column("original_summary", sa.String(512), nullable=True),
+        sa.Column("original_description", sa.Text(), nullable=True),
+        sa.Column("original_location", sa.String(512), nullable=True),
+        sa.Column("is_all_day", sa.Boolean(), nullable=True),
+        sa.Column("last_synced_at", sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        "source_sync_state",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("source_id", sa.Integer(), sa.ForeignKey("calendar_sources.id"), nullable=False, unique=True),
+        sa.Column("next_sync_at", sa.DateTime(), nullable=True),
+        sa.Column("last_attempt_at", sa.DateTime(), nullable=True),
+        sa.Column("last_change_at", sa.DateTime(), nullable=True),
+        sa.Column("last_change_count", sa.Integer(), nullable=True),
+        sa.Column("idle_level", sa.Integer(), nullable=True),
+        sa.Column("consecutive_failures", sa.Integer(), nullable=True),
+        indexes=[("ix_source_sync_state_next_sync_at", ["next_sync_at"], {})],
+    )
+    _create_table(
+        "sync_jobs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("source_id", sa.Integer(), sa.ForeignKey("calendar_sources.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("status", sa.String(20), nullable=False),
+        sa.Column("reason", sa.String(50), nullable=True),
+        sa.Column("attempts", sa.Integer(), nullable=True),
+        sa.Column("max_attempts", sa.Integer(), nullable=True),
+        sa.Column("run_after", sa.DateTime(), nullable=True),
+        sa.Column("lease_owner", sa.String(255), nullable=True),
+        sa.Column("lease_expires_at", sa.DateTime(), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.Column("success", sa.Boolean(), nullable=True),
+        sa.Column("message", sa.Text(), nullable=True),
+        sa.Column("progress", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        indexes=[
+            ("ix_sync_jobs_pending_source", ["source_id"], {
+                "unique": True,
+                "sqlite_where": sa.text("status = 'pending'"),
+                "postgresql_where": sa.text("status = 'pending'"),
+            }),
+            ("ix_sync_jobs_status_run_after", ["status", "run_after"], {}),
+        ],
+    )
+    _create_table(
+        "sync_workers",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("worker_id", sa.String(255), nullable=False, unique=True),
+        sa.Column("mode", sa.String(20), nullable=False),
+        sa.Column("hostname", sa.String(255), nullable=True),
+        sa.Column("pid", sa.Integer(), nullable=True),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.Column("details", sa.Text(), nullable=True),
+        indexes=[("ix_sync_workers_heartbeat_at", ["heartbeat_at"], {})],
+    )
+    _create_table(
+        "global_settings",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("setting_key", sa.String(100), nullable=False, unique=True),
+        sa.Column("setting_value", sa.Text(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        "oauth_settings",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("provider", sa.String(50), nullable=False, unique=True),
+        sa.Column("client_id", sa.String(255), nullable=True),
+        sa.Column("encrypted_client_secret", sa.Text(), nullable=True),
+        sa.Column("tenant_id", sa.String(255), nullable=True),
+        sa.Column("is_configured", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        "oauth_tokens",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=True),
+        sa.Column("provider", sa.String(50), nullable=False),
+        sa.Column("account_email", sa.String(255), nullable=True),
+        sa.Column("encrypted_access_token", sa.Text(), nullable=True),
+        sa.Column("encrypted_refresh_token", sa.Text(), nullable=True),
+        sa.Column("expires_at", sa.DateTime(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        "application_logs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("level", sa.String(20), nullable=False),
+        sa.Column("message", sa.Text(), nullable=False),
+        sa.Column("source", sa.String(100), nullable=True),
+        sa.Column("details", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        indexes=[("ix_application_logs_created_at", ["created_at"], {})],
+    )
+    _create_table(
+        "app_settings",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("feed_token", sa.String(64), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    _create_table(
+        "user_sessions",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("session_token", sa.String(64), nullable=False),
+        sa.Column("expires_at", sa.DateTime(), nullable=False),
+        sa.Column("ip_address", sa.String(45), nullable=True),
+        sa.Column("user_agent", sa.String(512), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        indexes=[("ix_user_sessions_session_token", ["session_token"], {"unique": True})],
+    )
+
+    # sync_jobs.progress arrived after the table itself.
+    columns = {column["name"] for column in _inspector().get_columns("sync_jobs")}
+    if "progress" not in columns:
+        op.add_column("sync_jobs", sa.Column("progress", sa.Text(), nullable=True))
+
+
+def downgrade():
+    # The baseline adopts whatever schema was already there; there is
+    # nothing sensible to go back to.
+    raise RuntimeError("Cannot downgrade past the baseline migration")
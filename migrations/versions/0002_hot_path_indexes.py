@@ -0,0 +1,49 @@
+"""Indexes for the feed, API, dashboard, session and reconciliation queries
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    # (name, table, columns, unique)
+    ("ix_events_source_uid", "events", ["source_id", "original_uid"], True),
+    ("ix_events_source_start", "events", ["source_id", "start_datetime"], False),
+    ("ix_events_source_end", "events", ["source_id", "end_datetime"], False),
+    ("ix_calendar_sources_user_enabled", "calendar_sources", ["user_id", "is_enabled"], False),
+    ("ix_users_feed_token", "users", ["feed_token"], False),
+    ("ix_oauth_tokens_user_provider", "oauth_tokens", ["user_id", "provider"], False),
+    ("ix_user_sessions_expires_at", "user_sessions", ["expires_at"], False),
+]
+
+
+def _existing_indexes(table):
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    # Older syncs could store the same event twice for a source; keep the
+    # newest copy so the unique index can be built.
+    op.execute(
+        "DELETE FROM events WHERE id NOT IN ("
+        "SELECT MAX(id) FROM events GROUP BY source_id, original_uid)"
+    )
+
+    for name, table, columns, unique in INDEXES:
+        # Fresh databases created by create_all may already have them.
+        if name not in _existing_indexes(table):
+            op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for name, table, columns, unique in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,92 @@
+"""Full-text search over application logs and event text
+
+SQLite gets external-content FTS5 tables kept current by triggers, so every
+write path (ORM, bulk inserts, retention deletes) updates them. PostgreSQL
+gets GIN indexes on to_tsvector() expressions, which src.search must repeat
+verbatim in its queries.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+FTS_TABLES = [
+    # (fts table, content table, indexed columns)
+    ("application_logs_fts", "application_logs", ["message", "details"]),
+    ("events_fts", "events", ["original_summary", "original_description", "original_location"]),
+]
+PG_INDEXES = [
+    ("ix_application_logs_search", "application_logs",
+     "to_tsvector('simple', coalesce(message, '') || ' ' || coalesce(details, ''))"),
+    ("ix_events_search", "events",
+     "to_tsvector('simple', coalesce(original_summary, '') || ' ' || "
+     "coalesce(original_description, '') || ' ' || coalesce(original_location, ''))"),
+]
+
+
+def _sqlite_has_fts5(bind) -> bool:
+    try:
+        bind.exec_driver_sql("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+        bind.exec_driver_sql("DROP TABLE temp.fts5_probe")
+        return True
+    except sa.exc.OperationalError:
+        return False
+
+
+def _create_fts(fts, content, columns):
+    names = ", ".join(columns)
+    new_values = ", ".join(f"new.{column}" for column in columns)
+    old_values = ", ".join(f"old.{column}" for column in columns)
+    op.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{names}, content='{content}', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+    )
+    op.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {content} BEGIN "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {content} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); END"
+    )
+    op.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {content} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old_values}); "
+        f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new_values}); END"
+    )
+    # Index the rows that were already there.
+    op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        if not _sqlite_has_fts5(bind):
+            print("SQLite was built without FTS5; search will use LIKE")
+            return
+        for fts, content, columns in FTS_TABLES:
+            _create_fts(fts, content, columns)
+    elif bind.dialect.name == "postgresql":
+        for name, table, expression in PG_INDEXES:
+            op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (({expression}))")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        for fts, content, columns in FTS_TABLES:
+            for suffix in ("ai", "ad", "au"):
+                op.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+            op.execute(f"DROP TABLE IF EXISTS {fts}")
+    elif bind.dialect.name == "postgresql":
+        for name, table, expression in PG_INDEXES:
+            op.execute(f"DROP INDEX IF EXISTS {name}")
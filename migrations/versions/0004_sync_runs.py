@@ -0,0 +1,47 @@
+"""Sync run history: one row per source sync with per-phase timings
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("sync_runs"):
+        return
+    op.create_table(
+        "sync_runs",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("source_id", sa.Integer(), sa.ForeignKey("calendar_sources.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("source_type", sa.String(50), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=False),
+        sa.Column("duration_ms", sa.Integer(), nullable=False),
+        sa.Column("token_ms", sa.Integer(), nullable=True),
+        sa.Column("fetch_ms", sa.Integer(), nullable=True),
+        sa.Column("parse_ms", sa.Integer(), nullable=True),
+        sa.Column("expand_ms", sa.Integer(), nullable=True),
+        sa.Column("store_ms", sa.Integer(), nullable=True),
+        sa.Column("pages", sa.Integer(), nullable=True),
+        sa.Column("payload_bytes", sa.Integer(), nullable=True),
+        sa.Column("events_fetched", sa.Integer(), nullable=True),
+        sa.Column("added", sa.Integer(), nullable=True),
+        sa.Column("updated", sa.Integer(), nullable=True),
+        sa.Column("removed", sa.Integer(), nullable=True),
+        sa.Column("success", sa.Boolean(), nullable=False),
+        sa.Column("error_class", sa.String(100), nullable=True),
+    )
+    op.create_index("ix_sync_runs_id", "sync_runs", ["id"])
+    op.create_index("ix_sync_runs_started_at", "sync_runs", ["started_at"])
+    op.create_index("ix_sync_runs_source_started", "sync_runs", ["source_id", "started_at"])
+
+
+def downgrade():
+    op.drop_table("sync_runs")
@@ -0,0 +1,36 @@
+"""Stored performance profiles of sampled requests and sync runs
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if sa.inspect(op.get_bind()).has_table("performance_profiles"):
+        return
+    op.create_table(
+        "performance_profiles",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("kind", sa.String(20), nullable=False),
+        sa.Column("label", sa.String(255), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("duration_ms", sa.Integer(), nullable=False),
+        sa.Column("samples", sa.Integer(), nullable=False),
+        sa.Column("summary", sa.Text(), nullable=False),
+        sa.Column("stacks", sa.Text(), nullable=False),
+        sa.Column("memory", sa.Text(), nullable=True),
+    )
+    op.create_index("ix_performance_profiles_id", "performance_profiles", ["id"])
+
+
+def downgrade():
+    op.drop_table("performance_profiles")
@@ -0,0 +1,31 @@
+"""Indexed fetch key on calendar sources, for finding subscribers of a feed
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    # Fresh databases created by create_all already have both. Existing rows
+    # get their key from backfill_fetch_keys on startup: it needs the
+    # decrypted CalDAV password, which a migration has no business reading.
+    if "fetch_key" not in {column["name"] for column in inspector.get_columns("calendar_sources")}:
+        op.add_column("calendar_sources", sa.Column("fetch_key", sa.String(64), nullable=True))
+    if "ix_calendar_sources_fetch_key" not in {index["name"] for index in inspector.get_indexes("calendar_sources")}:
+        op.create_index("ix_calendar_sources_fetch_key", "calendar_sources", ["fetch_key"])
+
+
+def downgrade():
+    op.drop_index("ix_calendar_sources_fetch_key", table_name="calendar_sources")
+    with op.batch_alter_table("calendar_sources") as batch:
+        batch.drop_column("fetch_key")
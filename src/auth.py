@@ -1,13 +1,18 @@
 import os
 import secrets
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import Request, HTTPException, Depends
 from fastapi.responses import RedirectResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from passlib.hash import bcrypt
 
 from .database import SessionLocal
+from .metrics import cache_lookup
 from .models import User, UserRole, UserSession
 
 
@@ -19,6 +24,47 @@ def get_db():
         db.close()
 
 
+# session_token -> (user_id, role, expires_at, cached_at). Saves the session
+# lookup on every authenticated request; the user row itself is still read
+# by primary key, so deactivation takes effect immediately everywhere.
+# Logout and revocation clear entries in this process; other processes
+# notice within SESSION_CACHE_TTL_SECONDS.
+SESSION_CACHE_TTL_SECONDS = 30
+SESSION_CACHE_SIZE = 2048
+_session_cache = OrderedDict()
+
+
+def _get_cached_session(session_token: str):
+    entry = _session_cache.get(session_token)
+    if entry is None:
+        cache_lookup("session", False)
+        return None
+    user_id, role, expires_at, cached_at = entry
+    if time.monotonic() - cached_at > SESSION_CACHE_TTL_SECONDS or expires_at <= datetime.utcnow():
+        _session_cache.pop(session_token, None)
+        cache_lookup("session", False)
+        return None
+    _session_cache.move_to_end(session_token)
+    cache_lookup("session", True)
+    return entry
+
+
+def _cache_session(session_token: str, user: User, expires_at: datetime):
+    _session_cache[session_token] = (user.id, user.role, expires_at, time.monotonic())
+    _session_cache.move_to_end(session_token)
+    while len(_session_cache) > SESSION_CACHE_SIZE:
+        _session_cache.popitem(last=False)
+
+
+def invalidate_session(session_token: str):
+    _session_cache.pop(session_token, None)
+
+
+def invalidate_user_sessions(user_id: int):
+    for token in [token for token, entry in _session_cache.items() if entry[0] == user_id]:
+        del _session_cache[token]
+
+
 def get_session_secret() -> str:
     return os.environ.get("SESSION_SECRET", "default-secret-change-me")
 
@@ -65,6 +111,14 @@ def get_current_user_from_session(request: Request, db: Session) -> Optional[Use
     if not session_token:
         return None
     
+    cached = _get_cached_session(session_token)
+    if cached:
+        user = db.get(User, cached[0])
+        if user and user.is_active:
+            return user
+        invalidate_session(session_token)
+        return None
+    
     session = db.query(UserSession).filter(
         UserSession.session_token == session_token,
         UserSession.expires_at > datetime.utcnow()
@@ -74,6 +128,37 @@ def get_current_user_from_session(request: Request, db: Session) -> Optional[Use
         return None
     
     user = db.query(User).filter(User.id == session.user_id, User.is_active == True).first()
+    if user:
+        _cache_session(session_token, user, session.expires_at)
+    return user
+
+
+async def get_current_user_from_session_async(request: Request, db: AsyncSession) -> Optional[User]:
+    session_token = request.cookies.get("session_token")
+    
+    if not session_token:
+        return None
+    
+    cached = _get_cached_session(session_token)
+    if cached:
+        user = await db.get(User, cached[0])
+        if user and user.is_active:
+            return user
+        invalidate_session(session_token)
+        return None
+    
+    result = await db.execute(
+        select(User, UserSession.expires_at).join(UserSession, UserSession.user_id == User.id).where(
+            UserSession.session_token == session_token,
+            UserSession.expires_at > datetime.utcnow(),
+            User.is_active == True
+        )
+    )
+    row = result.first()
+    if not row:
+        return None
+    user, expires_at = row
+    _cache_session(session_token, user, expires_at)
     return user
 
 
@@ -115,6 +200,7 @@ def destroy_session(request: Request, session_token: str, db: Session = None):
         close_db = False
     
     try:
+        invalidate_session(session_token)
         db.query(UserSession).filter(UserSession.session_token == session_token).delete()
         db.commit()
     finally:
@@ -122,9 +208,22 @@ def destroy_session(request: Request, session_token: str, db: Session = None):
             db.close()
 
 
-def cleanup_expired_sessions(db: Session):
-    db.query(UserSession).filter(UserSession.expires_at < datetime.utcnow()).delete()
+def destroy_user_sessions(db: Session, user_id: int) -> int:
+    # Logs the user out everywhere: after a password reset or before the
+    # user is deleted.
+    invalidate_user_sessions(user_id)
+    deleted = db.query(UserSession).filter(UserSession.user_id == user_id).delete(synchronize_session=False)
     db.commit()
+    return deleted
+
+
+def cleanup_expired_sessions(db: Session) -> int:
+    now = datetime.utcnow()
+    deleted = db.query(UserSession).filter(UserSession.expires_at < now).delete(synchronize_session=False)
+    db.commit()
+    for token in [token for token, entry in _session_cache.items() if entry[2] <= now]:
+        del _session_cache[token]
+    return deleted
 
 
 def require_auth(request: Request, db: Session = None) -> Optional[User]:
@@ -137,6 +236,10 @@ def require_auth(request: Request, db: Session = None) -> Optional[User]:
     return get_current_user_from_session(request, db)
 
 
+async def require_auth_async(request: Request, db: AsyncSession) -> Optional[User]:
+    return await get_current_user_from_session_async(request, db)
+
+
 def require_admin(request: Request, db: Session = None) -> Optional[User]:
     user = require_auth(request, db)
     if user and user.role == UserRole.ADMIN:
@@ -0,0 +1,34 @@
+import secrets
+
+from .database import SessionLocal
+from .models import AppSettings
+from .auth import create_default_admin
+from .db_maintenance import enable_incremental_vacuum
+from .schema import upgrade_database
+from .settings_service import initialize_default_settings
+from .sync_service import backfill_fetch_keys
+
+
+def init_database():
+    # Shared by the web app and the sync worker; whichever starts first
+    # creates the schema and defaults, the other finds them in place.
+    upgrade_database()
+    try:
+        enable_incremental_vacuum()
+    except Exception as e:
+        # Another process may hold the database; the next start retries.
+        print(f"Could not enable incremental vacuum: {e}")
+    
+    db = SessionLocal()
+    try:
+        create_default_admin(db)
+        initialize_default_settings(db)
+        backfill_fetch_keys(db)
+        
+        settings = db.query(AppSettings).first()
+        if not settings:
+            settings = AppSettings(feed_token=secrets.token_urlsafe(32))
+            db.add(settings)
+            db.commit()
+    finally:
+        db.close()
@@ -15,6 +15,10 @@ except ImportError as e:
 from .crypto import decrypt_password
 
 
+# Per-request timeout so a hanging server fails the sync instead of blocking it.
+CALDAV_TIMEOUT_SECONDS = 30
+
+
 def fetch_caldav_events(
     caldav_url: str,
     username: str,
@@ -31,7 +35,7 @@ def fetch_caldav_events(
     
     events = []
     
-    client = caldav.DAVClient(url=caldav_url, username=username, password=password)
+    client = caldav.DAVClient(url=caldav_url, username=username, password=password, timeout=CALDAV_TIMEOUT_SECONDS)
     principal = client.principal()
     calendars = principal.calendars()
     
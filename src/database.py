@@ -1,15 +1,128 @@
-from sqlalchemy import create_engine
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
 
-DATABASE_URL = "sqlite:///./calendar_aggregator.db"
+DEFAULT_DATABASE_URL = "sqlite:///./calendar_aggregator.db"
+
+
+def normalize_database_url(url: str) -> str:
+    # Hosting providers often hand out postgres:// URLs, which SQLAlchemy
+    # no longer accepts. A bare postgresql:// means psycopg2 before
+    # SQLAlchemy 2.1, so name psycopg 3, the driver the postgres extra
+    # installs. URLs that already name a driver are left alone.
+    scheme, separator, rest = url.partition("://")
+    if separator and scheme in ("postgres", "postgresql"):
+        return "postgresql+psycopg://" + rest
+    return url
+
+
+def get_async_database_url(url: str) -> str:
+    # The same database through an asyncio driver: aiosqlite for SQLite,
+    # asyncpg for PostgreSQL. ASYNC_DATABASE_URL overrides the derivation.
+    override = os.environ.get("ASYNC_DATABASE_URL")
+    if override:
+        return normalize_database_url(override)
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    scheme, rest = url.split("://", 1)
+    if scheme.split("+")[0] == "postgresql":
+        return "postgresql+asyncpg://" + rest
+    return url
+
+
+DATABASE_URL = normalize_database_url(os.environ.get("DATABASE_URL", DEFAULT_DATABASE_URL))
+ASYNC_DATABASE_URL = get_async_database_url(DATABASE_URL)
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# Applied to every new SQLite connection. WAL lets feed reads proceed while a
+# sync transaction is writing; NORMAL is durable across application crashes
+# in WAL mode and only risks the last commits on power loss. busy_timeout
+# makes writers queue instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -32000,        # KiB, i.e. 32 MB page cache per connection
+    "mmap_size": 268435456,      # 256 MB
+    "temp_store": "MEMORY",
+}
+
+# Per engine and per process. With SQLite, WAL readers don't serialize on the
+# file, so a handful of connections is enough. With PostgreSQL every web node
+# and worker holds its own pool, so keep pool_size * processes under the
+# server's max_connections.
+POOL_TIMEOUT_SECONDS = 30
+if IS_SQLITE:
+    POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+    MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+else:
+    POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+    MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+# Server-side connections can be dropped by the server, a proxy (PgBouncer)
+# or a failover; recycle them before typical idle timeouts and ping on checkout.
+POOL_RECYCLE_SECONDS = 1800
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas: dict = None):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in (pragmas or SQLITE_PRAGMAS).items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def configure_sqlite_engine(engine, pragmas: dict = None):
+    # Works for sync engines and for AsyncEngine.sync_engine alike.
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, pragmas)
+    return engine
+
+
+def get_engine_options() -> dict:
+    options = {
+        "pool_size": POOL_SIZE,
+        "max_overflow": MAX_OVERFLOW,
+        "pool_timeout": POOL_TIMEOUT_SECONDS,
+    }
+    if not IS_SQLITE:
+        options.update({
+            "pool_pre_ping": True,
+            "pool_recycle": POOL_RECYCLE_SECONDS,
+            # Reuse the most recently returned connection so surplus ones sit
+            # idle long enough to be recycled when traffic drops.
+            "pool_use_lifo": True,
+        })
+    return options
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+if IS_SQLITE:
+    engine = configure_sqlite_engine(create_engine(
+        DATABASE_URL, connect_args={"check_same_thread": False}, **get_engine_options()
+    ))
+else:
+    engine = create_engine(DATABASE_URL, **get_engine_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **get_engine_options())
+if IS_SQLITE:
+    configure_sqlite_engine(async_engine.sync_engine)
+# expire_on_commit=False: attributes stay readable after commit without an
+# implicit (and in async, impossible) lazy refresh.
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+from .database import engine, IS_SQLITE
+
+
+# Syncs report how many event rows they wrote; once this many have piled up
+# the next maintenance pass refreshes planner statistics and returns freed
+# pages to the filesystem. ANALYZE also runs once a day regardless.
+LARGE_WRITE_ROWS = 1000
+MAINTENANCE_CHECK_MINUTES = 5
+ANALYZE_INTERVAL_HOURS = 24
+# Upper bound on pages freed per pass, so one pass never holds the write
+# lock for long (4 KB pages: ~40 MB).
+INCREMENTAL_VACUUM_PAGES = 10000
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+_rows_since_maintenance = 0
+_last_analyze_at = None
+
+
+def note_rows_written(rows: int):
+    global _rows_since_maintenance
+    _rows_since_maintenance += rows
+
+
+def _connect():
+    # PRAGMA optimize, ANALYZE and VACUUM must not run inside a transaction.
+    return engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+
+def enable_incremental_vacuum():
+    # auto_vacuum can only be switched on an existing database by a full
+    # VACUUM, so this rewrites the file once; afterwards it is a no-op.
+    if not IS_SQLITE:
+        return
+    with _connect() as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == AUTO_VACUUM_INCREMENTAL:
+            return
+        print("Enabling incremental auto-vacuum (one-time VACUUM)...")
+        conn.exec_driver_sql(f"PRAGMA auto_vacuum={AUTO_VACUUM_INCREMENTAL}")
+        conn.exec_driver_sql("VACUUM")
+
+
+def _page_counts(conn) -> tuple:
+    page_count = conn.exec_driver_sql("PRAGMA page_count").scalar() or 0
+    free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+    return page_count, free_pages
+
+
+def _incremental_vacuum(conn, pages: int) -> int:
+    # Returns the pages actually handed back to the filesystem. SQLite frees
+    # one page per step of this pragma, and pysqlite stops stepping a
+    # statement without result columns after the first step (fetchall()
+    # included). executescript() steps every statement until it is done.
+    page_count, free_pages = _page_counts(conn)
+    if not free_pages:
+        return 0
+    conn.connection.dbapi_connection.executescript(f"PRAGMA incremental_vacuum({pages})")
+    return page_count - _page_counts(conn)[0]
+
+
+def reclaim_free_pages(pages: int = INCREMENTAL_VACUUM_PAGES) -> int:
+    # Bytes the file actually shrank by; None where there is nothing to
+    # measure (PostgreSQL).
+    if not IS_SQLITE:
+        return None
+    with _connect() as conn:
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar() or 0
+        return _incremental_vacuum(conn, pages) * page_size
+
+
+def free_bytes():
+    # Space inside the SQLite file that deleted rows left free. PostgreSQL
+    # only frees space once autovacuum has run, so there is nothing to report.
+    if not IS_SQLITE:
+        return None
+    with _connect() as conn:
+        free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar() or 0
+        page_size = conn.exec_driver_sql("PRAGMA page_size").scalar() or 0
+    return free_pages * page_size
+
+
+def run_maintenance(force: bool = False) -> list:
+    global _rows_since_maintenance, _last_analyze_at
+    if not IS_SQLITE:
+        # PostgreSQL's autovacuum daemon covers statistics and space reuse.
+        return []
+    now = datetime.utcnow()
+    large_writes = _rows_since_maintenance >= LARGE_WRITE_ROWS
+    analyze_due = _last_analyze_at is None or now - _last_analyze_at >= timedelta(hours=ANALYZE_INTERVAL_HOURS)
+    if not (force or large_writes or analyze_due):
+        return []
+
+    done = []
+    with _connect() as conn:
+        if force or analyze_due:
+            conn.exec_driver_sql("ANALYZE")
+            _last_analyze_at = now
+            done.append("analyze")
+        else:
+            # Cheap: only re-analyzes tables whose statistics look stale.
+            conn.exec_driver_sql("PRAGMA optimize")
+            done.append("optimize")
+
+        reclaimed = _incremental_vacuum(conn, INCREMENTAL_VACUUM_PAGES)
+        if reclaimed:
+            done.append(f"vacuum {reclaimed} pages")
+
+        # Keep the WAL file from growing without bound after big syncs.
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    _rows_since_maintenance = 0
+    return done
@@ -0,0 +1,73 @@
+import json
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+from .metrics import cache_lookup
+
+try:
+    import orjson
+    ORJSON_SUPPORT = True
+except ImportError as e:
+    ORJSON_SUPPORT = False
+    print(f"✗ orjson NOT available ({e}); /api/events uses json")
+
+
+# Serialized /api/events responses per (user, range). Every entry carries the
+# version of the user's sources it was built from (see
+# ics_generator.get_events_version_async) and is dropped once that moves.
+EVENTS_CACHE_MAX_BYTES = 32 * 1024 * 1024
+# Dashboard previews (next events and per-source counts) per user, under the
+# same version, and only until the next upcoming event ends.
+DASHBOARD_CACHE_SIZE = 1024
+
+_events_cache = OrderedDict()
+_events_cache_bytes = 0
+_dashboard_cache = OrderedDict()
+
+
+def encode_json(value) -> bytes:
+    if ORJSON_SUPPORT:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def get_cached_events(key: tuple, version: tuple) -> Optional[bytes]:
+    entry = _events_cache.get(key)
+    if entry is None or entry[0] != version:
+        cache_lookup("api_events", False)
+        return None
+    _events_cache.move_to_end(key)
+    cache_lookup("api_events", True)
+    return entry[1]
+
+
+def cache_events(key: tuple, version: tuple, body: bytes):
+    global _events_cache_bytes
+    if len(body) > EVENTS_CACHE_MAX_BYTES // 4:
+        return
+    previous = _events_cache.pop(key, None)
+    if previous is not None:
+        _events_cache_bytes -= len(previous[1])
+    _events_cache[key] = (version, body)
+    _events_cache_bytes += len(body)
+    while _events_cache_bytes > EVENTS_CACHE_MAX_BYTES:
+        _, (_, evicted) = _events_cache.popitem(last=False)
+        _events_cache_bytes -= len(evicted)
+
+
+def get_cached_dashboard(user_id: int, version: tuple):
+    entry = _dashboard_cache.get(user_id)
+    if entry is None or entry[0] != version or (entry[1] is not None and datetime.utcnow() > entry[1]):
+        cache_lookup("dashboard", False)
+        return None
+    _dashboard_cache.move_to_end(user_id)
+    cache_lookup("dashboard", True)
+    return entry[2]
+
+
+def cache_dashboard(user_id: int, version: tuple, valid_until: datetime, preview):
+    _dashboard_cache[user_id] = (version, valid_until, preview)
+    _dashboard_cache.move_to_end(user_id)
+    while len(_dashboard_cache) > DASHBOARD_CACHE_SIZE:
+        _dashboard_cache.popitem(last=False)
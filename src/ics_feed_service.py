@@ -1,9 +1,13 @@
+import time
 import httpx
 from datetime import datetime, timedelta, timezone
 from typing import List
 from icalendar import Calendar
 from dateutil import parser as date_parser
 
+from .metrics import observe_sync_phase, sync_phase
+from .provider_policy import send_with_policy
+
 # Try to import recurring-ical-events library
 try:
     import recurring_ical_events
@@ -26,13 +30,14 @@ def normalize_ics_url(url: str) -> str:
 async def fetch_ics_feed(url: str) -> List[dict]:
     https_url = normalize_ics_url(url)
     
-    async with httpx.AsyncClient(follow_redirects=True, timeout=30.0) as client:
-        response = await client.get(https_url, headers={
-            "User-Agent": "CalendarAggregator/1.0",
-            "Accept": "text/calendar, application/calendar+json, */*"
-        })
-        response.raise_for_status()
-        ics_content = response.text
+    with sync_phase("fetch"):
+        async with httpx.AsyncClient(follow_redirects=True, timeout=30.0) as client:
+            response = await send_with_policy(client, "GET", https_url, headers={
+                "User-Agent": "CalendarAggregator/1.0",
+                "Accept": "text/calendar, application/calendar+json, */*"
+            })
+            response.raise_for_status()
+            ics_content = response.text
     
     return parse_ics_content(ics_content)
 
@@ -40,17 +45,20 @@ async def fetch_ics_feed(url: str) -> List[dict]:
 def parse_ics_content(ics_content: str) -> List[dict]:
     events = []
     
+    parse_started = time.perf_counter()
     try:
         cal = Calendar.from_ical(ics_content)
     except Exception as e:
         print(f"Error parsing ICS: {e}")
         return events
+    parse_seconds = time.perf_counter() - parse_started
     
     now = datetime.utcnow()
     time_min = now - timedelta(days=30)
     time_max = now + timedelta(days=365)
     
     # Use recurring_ical_events to expand recurring events
+    expand_started = time.perf_counter()
     if RECURRING_SUPPORT:
         try:
             expanded_events = recurring_ical_events.of(cal).between(time_min, time_max)
@@ -63,7 +71,9 @@ def parse_ics_content(ics_content: str) -> List[dict]:
     else:
         print("✗ ICS Feed: Recurring events will NOT be expanded (library not available)")
         expanded_events = cal.walk()
+    observe_sync_phase("expand", time.perf_counter() - expand_started)
     
+    parse_started = time.perf_counter()
     for component in expanded_events:
         if component.name == "VEVENT":
             try:
@@ -124,5 +134,6 @@ def parse_ics_content(ics_content: str) -> List[dict]:
                 print(f"Error parsing event: {e}")
                 continue
     
+    observe_sync_phase("parse", parse_seconds + time.perf_counter() - parse_started)
     print(f"ICS Feed: Parsed {len(events)} total events after expansion")
     return events
@@ -1,13 +1,42 @@
+import asyncio
 from datetime import datetime, timezone
-from typing import List
+from typing import Dict, List, Optional, Tuple
 from icalendar import Calendar as ICalendar, Event as IEvent
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, contains_eager
 import pytz
 
 from .models import Event, CalendarSource
 
 
-def generate_unified_ics(db: Session, apply_masking: bool = True, user_id: int = None) -> str:
+def _unified_events_query(upcoming_only: bool = False, user_id: int = None, start: datetime = None,
+                          end: datetime = None, limit: int = None):
+    # Sources are filled from the join itself: the async session cannot
+    # lazy-load event.source, and the sync one no longer queries per source.
+    query = select(Event).join(CalendarSource).options(contains_eager(Event.source)).where(
+        CalendarSource.is_enabled == True
+    )
+
+    if user_id is not None:
+        query = query.where(CalendarSource.user_id == user_id)
+
+    if upcoming_only:
+        query = query.where(Event.end_datetime >= datetime.utcnow())
+
+    # Everything overlapping [start, end), as FullCalendar asks for it.
+    if start is not None:
+        query = query.where(Event.end_datetime >= start)
+    if end is not None:
+        query = query.where(Event.start_datetime < end)
+
+    query = query.order_by(Event.start_datetime)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def _build_ics(events: List[Event], apply_masking: bool) -> str:
     cal = ICalendar()
     cal.add("prodid", "-//Calendar Aggregator//EN")
     cal.add("version", "2.0")
@@ -15,15 +44,6 @@ def generate_unified_ics(db: Session, apply_masking: bool = True, user_id: int =
     cal.add("method", "PUBLISH")
     cal.add("x-wr-calname", "Unified Calendar")
     
-    query = db.query(Event).join(CalendarSource).filter(
-        CalendarSource.is_enabled == True
-    )
-    
-    if user_id is not None:
-        query = query.filter(CalendarSource.user_id == user_id)
-    
-    events = query.all()
-    
     for event in events:
         source = event.source
         
@@ -61,19 +81,7 @@ def generate_unified_ics(db: Session, apply_masking: bool = True, user_id: int =
     return cal.to_ical().decode("utf-8")
 
 
-def get_unified_events(db: Session, apply_masking: bool = True, upcoming_only: bool = False, user_id: int = None) -> List[dict]:
-    query = db.query(Event).join(CalendarSource).filter(
-        CalendarSource.is_enabled == True
-    )
-
-    if user_id is not None:
-        query = query.filter(CalendarSource.user_id == user_id)
-
-    if upcoming_only:
-        query = query.filter(Event.end_datetime >= datetime.utcnow())
-
-    events = query.order_by(Event.start_datetime).all()
-
+def _event_dicts(events: List[Event], apply_masking: bool) -> List[dict]:
     result = []
     for event in events:
         source = event.source
@@ -109,3 +117,63 @@ def get_unified_events(db: Session, apply_masking: bool = True, upcoming_only: b
             })
 
     return result
+
+
+def generate_unified_ics(db: Session, apply_masking: bool = True, user_id: int = None) -> str:
+    events = db.execute(_unified_events_query(user_id=user_id)).scalars().all()
+    return _build_ics(events, apply_masking)
+
+
+async def generate_unified_ics_async(db: AsyncSession, apply_masking: bool = True, user_id: int = None) -> str:
+    events = (await db.execute(_unified_events_query(user_id=user_id))).scalars().all()
+    # Serializing a large calendar takes long enough to stall other requests;
+    # everything it reads is already loaded, so it can run in a thread.
+    return await asyncio.to_thread(_build_ics, events, apply_masking)
+
+
+def get_unified_events(db: Session, apply_masking: bool = True, upcoming_only: bool = False, user_id: int = None,
+                       limit: int = None) -> List[dict]:
+    events = db.execute(_unified_events_query(upcoming_only, user_id, limit=limit)).scalars().all()
+    return _event_dicts(events, apply_masking)
+
+
+def _upcoming_counts_query(user_id: int, now: datetime):
+    # Per source, disabled ones included: how many events haven't ended
+    # and when the first of them ends. Correlated subqueries are a range
+    # count and a min on ix_events_source_end each, with no GROUP BY sort.
+    upcoming = and_(Event.source_id == CalendarSource.id, Event.end_datetime >= now)
+    return select(
+        CalendarSource.id,
+        select(func.count(Event.id)).where(upcoming).scalar_subquery(),
+        select(func.min(Event.end_datetime)).where(upcoming).scalar_subquery()
+    ).where(CalendarSource.user_id == user_id)
+
+
+def count_upcoming_events(db: Session, user_id: int) -> Tuple[Dict[int, int], Optional[datetime]]:
+    # Also returns when the next upcoming event ends: until then time alone
+    # cannot change the counts or which events come next.
+    rows = db.execute(_upcoming_counts_query(user_id, datetime.utcnow())).all()
+    next_end = min((first_end for _, _, first_end in rows if first_end is not None), default=None)
+    return {source_id: count for source_id, count, _ in rows}, next_end
+
+
+def _events_version_query(user_id: int):
+    # Syncs and every source edit touch updated_at, and deleting a source
+    # changes the count, so this moves whenever the user's events may have.
+    return select(func.count(CalendarSource.id), func.max(CalendarSource.updated_at)).where(
+        CalendarSource.user_id == user_id
+    )
+
+
+def get_events_version(db: Session, user_id: int) -> tuple:
+    return tuple(db.execute(_events_version_query(user_id)).one())
+
+
+async def get_unified_events_async(db: AsyncSession, apply_masking: bool = True, upcoming_only: bool = False,
+                                   user_id: int = None, start: datetime = None, end: datetime = None) -> List[dict]:
+    events = (await db.execute(_unified_events_query(upcoming_only, user_id, start, end))).scalars().all()
+    return _event_dicts(events, apply_masking)
+
+
+async def get_events_version_async(db: AsyncSession, user_id: int) -> tuple:
+    return tuple((await db.execute(_events_version_query(user_id))).one())
@@ -0,0 +1,23 @@
+from datetime import datetime, timezone
+from dateutil import parser as date_parser
+
+
+def parse_iso_datetime(value: str) -> datetime:
+    # Google and Graph return strict RFC 3339 / ISO-8601 strings ("Z" suffix,
+    # "+03:00" offsets, Graph's 7-digit fractional seconds, date-only values
+    # for all-day events). datetime.fromisoformat handles all of these on
+    # Python 3.11+ and is an order of magnitude faster than dateutil, which is
+    # only kept as a fallback for anything unusual.
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return date_parser.parse(value)
+
+
+def parse_utc_naive(value: str) -> datetime:
+    # Events are stored as naive UTC; offsets (FullCalendar sends local
+    # ones) are converted, naive values are taken as UTC.
+    parsed = parse_iso_datetime(value.strip().replace(" ", "+"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
@@ -1,50 +1,244 @@
+import asyncio
+import atexit
 import logging
+import queue
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import List, Optional
+from sqlalchemy import func, insert
 from sqlalchemy.orm import Session
 
+from .database import SessionLocal
+from .db_maintenance import free_bytes, note_rows_written, reclaim_free_pages
+from .metrics import LOG_ENTRIES_DROPPED, LOG_QUEUE_FULL
 from .models import ApplicationLog
+from .search import log_search_filter
+from .settings_service import get_setting
 
 
-class DatabaseLogHandler(logging.Handler):
-    def __init__(self, get_db_session):
-        super().__init__()
-        self.get_db_session = get_db_session
+# Log lines are queued and written by a background thread, up to
+# LOG_BATCH_SIZE rows per transaction and at most LOG_FLUSH_SECONDS after
+# they were logged. When the queue is full, code on the event loop hands its
+# line to a worker thread, but only up to LOG_DIRECT_WRITES at a time (those
+# threads also run syncs and feed builds); past that the line is dropped.
+# Other threads wait up to LOG_SUBMIT_TIMEOUT_SECONDS for room and then
+# write it directly. A batch the writer cannot store is kept and retried
+# every LOG_RETRY_SECONDS, up to LOG_RETRY_KEEP entries. Every dropped entry
+# is counted in the metrics. stop() drains the queue before returning.
+LOG_QUEUE_SIZE = 10000
+LOG_BATCH_SIZE = 200
+LOG_FLUSH_SECONDS = 1.0
+LOG_SUBMIT_TIMEOUT_SECONDS = 2.0
+LOG_WRITE_ATTEMPTS = 3
+LOG_RETRY_SECONDS = 5.0
+LOG_RETRY_KEEP = 10000
+LOG_DIRECT_WRITES = 2
 
-    def emit(self, record):
+# Retention deletes oldest-first in short transactions of about
+# LOG_DELETE_BATCH_ROWS rows each (time buckets for the age limit, id
+# ranges for the row cap), so the sync writers never wait long for the lock.
+LOG_DELETE_BATCH_ROWS = 5000
+LOG_DELETE_PAUSE_SECONDS = 0.05
+
+_STOP = object()
+
+
+class LogWriter:
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stopped = False
+        # Entries the writer thread failed to store; only it touches this.
+        self.failed = []
+        self.direct_writes = threading.BoundedSemaphore(LOG_DIRECT_WRITES)
+
+    def submit(self, entry: dict):
+        if not self._ensure_started():
+            self._write_direct([entry])
+            return
+        try:
+            self.queue.put_nowait(entry)
+            return
+        except queue.Full:
+            LOG_QUEUE_FULL.inc()
         try:
-            db = self.get_db_session()
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop:
+            if self.direct_writes.acquire(blocking=False):
+                loop.run_in_executor(None, self._write_overflow, entry)
+            else:
+                LOG_ENTRIES_DROPPED.labels("queue_full").inc()
+            return
+        try:
+            self.queue.put(entry, timeout=LOG_SUBMIT_TIMEOUT_SECONDS)
+        except queue.Full:
+            self._write_direct([entry])
+
+    def stop(self, timeout: float = 10.0):
+        with self.lock:
+            thread = self.thread
+            self.stopped = True
+            self.thread = None
+        if thread:
+            self.queue.put(_STOP)
+            thread.join(timeout)
+
+    def _ensure_started(self) -> bool:
+        if self.thread:
+            return True
+        with self.lock:
+            if self.stopped:
+                return False
+            if not self.thread:
+                self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self.thread.start()
+        return True
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self.queue.get(timeout=LOG_RETRY_SECONDS if self.failed else None)
+            except queue.Empty:
+                self._write_batch([])
+                continue
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + LOG_FLUSH_SECONDS
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._write_batch(batch)
+        # Anything submitted while we were stopping, and what never got stored.
+        leftover = self.failed
+        self.failed = []
+        while True:
             try:
-                log_entry = ApplicationLog(
-                    level=record.levelname,
-                    message=record.getMessage(),
-                    source=record.name,
-                    details=getattr(record, 'details', None)
-                )
-                db.add(log_entry)
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover and not self._write(leftover):
+            LOG_ENTRIES_DROPPED.labels("stopped").inc(len(leftover))
+            print(f"Dropped {len(leftover)} log entries at shutdown")
+
+    def _write_batch(self, batch: list):
+        # Writer thread: earlier failures go first, and stay around for the
+        # next attempt if this one fails too.
+        batch = self.failed + batch
+        if self._write(batch):
+            self.failed = []
+            return
+        overflow = len(batch) - LOG_RETRY_KEEP
+        if overflow > 0:
+            LOG_ENTRIES_DROPPED.labels("write_failed").inc(overflow)
+            print(f"Dropped {overflow} log entries that could not be written")
+            batch = batch[overflow:]
+        self.failed = batch
+
+    def _write_overflow(self, entry: dict):
+        try:
+            self._write_direct([entry])
+        finally:
+            self.direct_writes.release()
+
+    def _write_direct(self, batch: list):
+        # Callers bypassing a full queue: a failed line goes back to the
+        # writer if there is room by now.
+        if self._write(batch):
+            return
+        if self.stopped:
+            LOG_ENTRIES_DROPPED.labels("write_failed").inc(len(batch))
+            return
+        for entry in batch:
+            try:
+                self.queue.put_nowait(entry)
+            except queue.Full:
+                LOG_ENTRIES_DROPPED.labels("write_failed").inc()
+
+    def _write(self, batch: list) -> bool:
+        for attempt in range(1, LOG_WRITE_ATTEMPTS + 1):
+            db = self.session_factory()
+            try:
+                db.execute(insert(ApplicationLog), batch)
                 db.commit()
+                return True
+            except Exception as e:
+                db.rollback()
+                if attempt == LOG_WRITE_ATTEMPTS:
+                    print(f"Could not write {len(batch)} log entries: {e}")
+                else:
+                    time.sleep(0.2 * attempt)
             finally:
                 db.close()
+        return False
+
+
+_writer = LogWriter(SessionLocal)
+atexit.register(_writer.stop)
+
+
+def stop_log_writer():
+    _writer.stop()
+
+
+class DatabaseLogHandler(logging.Handler):
+    def __init__(self, get_db_session):
+        super().__init__()
+        self.writer = LogWriter(get_db_session)
+        atexit.register(self.writer.stop)
+
+    def emit(self, record):
+        try:
+            self.writer.submit({
+                "level": record.levelname,
+                "message": record.getMessage(),
+                "source": record.name,
+                "details": getattr(record, 'details', None),
+                "created_at": datetime.utcfromtimestamp(record.created),
+            })
         except Exception:
-            pass
+            self.handleError(record)
+
+    def close(self):
+        self.writer.stop()
+        super().close()
 
 
 def add_log(db: Session, level: str, message: str, source: str = None, details: str = None):
-    log_entry = ApplicationLog(
-        level=level.upper(),
-        message=message,
-        source=source,
-        details=details
-    )
-    db.add(log_entry)
-    db.commit()
-    return log_entry
+    # db is kept for the callers' sake; the entry is written by the log
+    # writer in its own transaction.
+    _writer.submit({
+        "level": level.upper(),
+        "message": message,
+        "source": source,
+        "details": details,
+        "created_at": datetime.utcnow(),
+    })
 
 
 def get_logs(db: Session, limit: int = 100, level: str = None, 
-             source: str = None, hours: int = None) -> List[ApplicationLog]:
+             source: str = None, hours: int = None, q: str = None) -> List[ApplicationLog]:
     query = db.query(ApplicationLog)
     
+    if q:
+        match = log_search_filter(db, q)
+        if match is not None:
+            query = query.filter(match)
+    
     if level:
         query = query.filter(ApplicationLog.level == level.upper())
     
@@ -58,11 +252,77 @@ def get_logs(db: Session, limit: int = 100, level: str = None,
     return query.order_by(ApplicationLog.created_at.desc()).limit(limit).all()
 
 
+def _delete_older_than(db: Session, cutoff: datetime, pause: float = 0) -> int:
+    deleted = 0
+    while True:
+        # Each bucket runs up to the timestamp of the LOG_DELETE_BATCH_ROWS-th
+        # oldest expired entry; the last one runs up to the cutoff.
+        bucket_end = db.query(ApplicationLog.created_at).filter(
+            ApplicationLog.created_at < cutoff
+        ).order_by(ApplicationLog.created_at).offset(LOG_DELETE_BATCH_ROWS).limit(1).scalar()
+        if bucket_end is None:
+            condition = ApplicationLog.created_at < cutoff
+        else:
+            condition = ApplicationLog.created_at <= bucket_end
+        count = db.query(ApplicationLog).filter(condition).delete(synchronize_session=False)
+        db.commit()
+        deleted += count
+        if bucket_end is None or not count:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+def _trim_to_row_cap(db: Session, max_rows: int, pause: float = 0) -> int:
+    # Ring buffer: keep the newest max_rows entries.
+    threshold = db.query(ApplicationLog.id).order_by(ApplicationLog.id.desc()).offset(max_rows).limit(1).scalar()
+    if threshold is None:
+        return 0
+    deleted = 0
+    while True:
+        lowest = db.query(func.min(ApplicationLog.id)).scalar()
+        if lowest is None or lowest > threshold:
+            return deleted
+        upper = min(lowest + LOG_DELETE_BATCH_ROWS - 1, threshold)
+        deleted += db.query(ApplicationLog).filter(
+            ApplicationLog.id <= upper
+        ).delete(synchronize_session=False)
+        db.commit()
+        if pause:
+            time.sleep(pause)
+
+
+def _int_setting(db: Session, key: str, default: int) -> int:
+    try:
+        return int(get_setting(db, key, str(default)))
+    except (TypeError, ValueError):
+        return default
+
+
 def clear_old_logs(db: Session, days: int = 30):
-    cutoff = datetime.utcnow() - timedelta(days=days)
-    deleted = db.query(ApplicationLog).filter(ApplicationLog.created_at < cutoff).delete()
-    db.commit()
-    return deleted
+    return _delete_older_than(db, datetime.utcnow() - timedelta(days=days))
+
+
+def enforce_log_retention(db: Session) -> dict:
+    days = _int_setting(db, 'log_retention_days', 30)
+    max_rows = _int_setting(db, 'log_max_rows', 0)
+    free_before = free_bytes()
+
+    by_age = 0
+    if days > 0:
+        by_age = _delete_older_than(db, datetime.utcnow() - timedelta(days=days), pause=LOG_DELETE_PAUSE_SECONDS)
+    by_cap = 0
+    if max_rows > 0:
+        by_cap = _trim_to_row_cap(db, max_rows, pause=LOG_DELETE_PAUSE_SECONDS)
+    # Counts towards the next ANALYZE.
+    note_rows_written(by_age + by_cap)
+
+    # Both numbers are read from the file: pages the deletes left free
+    # (freelist_count) and how much the file then shrank (page_count).
+    free_after = free_bytes()
+    freed = free_after - free_before if free_before is not None and free_after is not None else None
+    reclaimed = reclaim_free_pages() if by_age or by_cap else None
+    return {"by_age": by_age, "by_cap": by_cap, "freed_bytes": freed, "reclaimed_bytes": reclaimed}
 
 
 def log_info(db: Session, message: str, source: str = None, details: str = None):
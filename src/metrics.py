@@ -0,0 +1,147 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, start_http_server
+    )
+    METRICS_SUPPORT = True
+except ImportError as e:
+    METRICS_SUPPORT = False
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    print(f"✗ prometheus-client NOT available ({e}); /metrics will be empty")
+
+
+# Optional bearer token for /metrics; unset means the endpoint is open.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+# The worker has no web server; set this to serve its metrics on a port.
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0") or 0)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = (1_000, 10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000, 20_000_000)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300, 900)
+
+
+class _NoopMetric:
+    # Stands in for every metric when prometheus-client is missing, so the
+    # instrumented code doesn't have to check.
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+if METRICS_SUPPORT:
+    registry = CollectorRegistry()
+
+    def _counter(name, doc, labels=()):
+        return Counter(name, doc, labels, registry=registry)
+
+    def _gauge(name, doc, labels=()):
+        return Gauge(name, doc, labels, registry=registry)
+
+    def _histogram(name, doc, labels=(), buckets=DURATION_BUCKETS):
+        return Histogram(name, doc, labels, buckets=buckets, registry=registry)
+else:
+    registry = None
+
+    def _counter(name, doc, labels=()):
+        return _NoopMetric()
+
+    _gauge = _counter
+
+    def _histogram(name, doc, labels=(), buckets=None):
+        return _NoopMetric()
+
+
+SYNC_PHASE_SECONDS = _histogram(
+    "calagg_sync_phase_seconds", "Time spent per sync phase (token, fetch, parse, expand, store)",
+    ["source_type", "phase"]
+)
+SYNC_RUNS = _counter("calagg_sync_runs_total", "Finished source syncs", ["source_type", "result"])
+SYNC_EVENTS_FETCHED = _counter("calagg_sync_events_fetched_total", "Events received from providers", ["source_type"])
+SYNC_EVENTS_WRITTEN = _counter(
+    "calagg_sync_events_written_total", "Event rows added, updated or removed by syncs", ["source_type", "change"]
+)
+SYNC_QUEUE_WAIT_SECONDS = _histogram(
+    "calagg_sync_queue_wait_seconds", "Delay between a sync job becoming due and a worker starting it",
+    buckets=LAG_BUCKETS
+)
+SCHEDULER_LAG_SECONDS = _histogram(
+    "calagg_scheduler_lag_seconds", "Delay between a scheduler job's planned and actual start", ["job"],
+    buckets=LAG_BUCKETS
+)
+FEED_RENDER_SECONDS = _histogram("calagg_feed_render_seconds", "Time to build a feed response", ["feed"])
+FEED_BYTES = _histogram("calagg_feed_bytes", "Size of feed responses", ["feed"], buckets=BYTES_BUCKETS)
+CACHE_REQUESTS = _counter("calagg_cache_requests_total", "In-process cache lookups", ["cache", "result"])
+HTTP_IN_FLIGHT = _gauge("calagg_http_requests_in_flight", "Outbound provider requests in progress", ["host"])
+HTTP_REQUEST_SECONDS = _histogram("calagg_http_request_seconds", "Outbound provider request duration", ["host"])
+LOG_QUEUE_FULL = _counter("calagg_log_queue_full_total", "Log entries that found the log writer's queue full")
+LOG_ENTRIES_DROPPED = _counter("calagg_log_entries_dropped_total", "Log entries that could not be written", ["reason"])
+HTTP_BUDGET_WAIT_SECONDS = _histogram(
+    "calagg_http_budget_wait_seconds", "Time spent waiting for a host's request budget", ["host"]
+)
+
+
+class SyncTrace:
+    # Collects what one source sync spent per phase, how many pages it
+    # fetched and how many bytes providers sent; ends up as a sync_runs row.
+    def __init__(self, source_type: str):
+        self.source_type = source_type
+        self.phases = {}
+        self.pages = 0
+        self.payload_bytes = 0
+
+
+# The sync running in this task, for phases timed deep in the provider code.
+current_sync = contextvars.ContextVar("current_sync", default=None)
+
+
+@contextmanager
+def sync_phase(phase: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_sync_phase(phase, time.perf_counter() - started)
+
+
+def observe_sync_phase(phase: str, seconds: float):
+    trace = current_sync.get()
+    SYNC_PHASE_SECONDS.labels(trace.source_type if trace else "unknown", phase).observe(seconds)
+    if trace:
+        trace.phases[phase] = trace.phases.get(phase, 0.0) + seconds
+
+
+def note_payload(size: int):
+    trace = current_sync.get()
+    if trace:
+        trace.payload_bytes += size
+
+
+def cache_lookup(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def render_metrics() -> bytes:
+    if not METRICS_SUPPORT:
+        return b""
+    return generate_latest(registry)
+
+
+def start_metrics_server():
+    if METRICS_SUPPORT and METRICS_PORT:
+        start_http_server(METRICS_PORT, registry=registry)
+        print(f"Serving metrics on port {METRICS_PORT}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey, Index, Enum as SQLEnum, text
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -22,6 +22,9 @@ class SourceType(enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_feed_token", "feed_token"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(255), nullable=False, unique=True)
@@ -39,6 +42,10 @@ class User(Base):
 
 class CalendarSource(Base):
     __tablename__ = "calendar_sources"
+    __table_args__ = (
+        # Every per-user page, feed and API call starts from here.
+        Index("ix_calendar_sources_user_enabled", "user_id", "is_enabled"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -54,15 +61,30 @@ class CalendarSource(Base):
     last_sync_error = Column(Text, nullable=True)
     google_calendar_id = Column(String(255), nullable=True)
     outlook_calendar_id = Column(String(255), nullable=True)
+    # Digest of sync_service.shared_fetch_key for ICS/CalDAV sources; equal
+    # keys mean one fetch serves them all.
+    fetch_key = Column(String(64), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     user = relationship("User", back_populates="calendar_sources")
     events = relationship("Event", back_populates="source", cascade="all, delete-orphan")
+    sync_state = relationship("SourceSyncState", back_populates="source", uselist=False, cascade="all, delete-orphan")
+    sync_jobs = relationship("SyncJob", cascade="all, delete-orphan", passive_deletes=True)
+    sync_runs = relationship("SyncRun", cascade="all, delete-orphan", passive_deletes=True)
 
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (
+        # One row per source event; also the conflict target of the
+        # PostgreSQL upsert in sync_service.
+        Index("ix_events_source_uid", "source_id", "original_uid", unique=True),
+        # Per-source range scans: the feed and API read in start order, the
+        # dashboard and preview only what hasn't ended yet.
+        Index("ix_events_source_start", "source_id", "start_datetime"),
+        Index("ix_events_source_end", "source_id", "end_datetime"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     source_id = Column(Integer, ForeignKey("calendar_sources.id"), nullable=False)
@@ -78,6 +100,109 @@ class Event(Base):
     source = relationship("CalendarSource", back_populates="events")
 
 
+class SourceSyncState(Base):
+    __tablename__ = "source_sync_state"
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_id = Column(Integer, ForeignKey("calendar_sources.id"), nullable=False, unique=True)
+    next_sync_at = Column(DateTime, nullable=True, index=True)
+    last_attempt_at = Column(DateTime, nullable=True)
+    last_change_at = Column(DateTime, nullable=True)
+    last_change_count = Column(Integer, default=0)
+    idle_level = Column(Integer, default=0)
+    consecutive_failures = Column(Integer, default=0)
+
+    source = relationship("CalendarSource", back_populates="sync_state")
+
+
+class SyncJob(Base):
+    __tablename__ = "sync_jobs"
+    __table_args__ = (
+        # At most one pending job per source: duplicate requests coalesce.
+        Index(
+            "ix_sync_jobs_pending_source", "source_id", unique=True,
+            sqlite_where=text("status = 'pending'"),
+            postgresql_where=text("status = 'pending'")
+        ),
+        Index("ix_sync_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_id = Column(Integer, ForeignKey("calendar_sources.id", ondelete="CASCADE"), nullable=False)
+    status = Column(String(20), nullable=False, default="pending")
+    reason = Column(String(50), nullable=True)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    run_after = Column(DateTime, default=datetime.utcnow)
+    lease_owner = Column(String(255), nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    success = Column(Boolean, nullable=True)
+    message = Column(Text, nullable=True)
+    # JSON: latest phase and counters reported by the running sync.
+    progress = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class SyncRun(Base):
+    # One row per sync of a source, kept for SYNC_RUN_RETENTION_DAYS.
+    __tablename__ = "sync_runs"
+    __table_args__ = (
+        Index("ix_sync_runs_source_started", "source_id", "started_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_id = Column(Integer, ForeignKey("calendar_sources.id", ondelete="CASCADE"), nullable=False)
+    source_type = Column(String(50), nullable=False)
+    started_at = Column(DateTime, nullable=False, index=True)
+    duration_ms = Column(Integer, nullable=False)
+    token_ms = Column(Integer, nullable=True)
+    fetch_ms = Column(Integer, nullable=True)
+    parse_ms = Column(Integer, nullable=True)
+    expand_ms = Column(Integer, nullable=True)
+    store_ms = Column(Integer, nullable=True)
+    pages = Column(Integer, nullable=True)
+    payload_bytes = Column(Integer, nullable=True)
+    events_fetched = Column(Integer, nullable=True)
+    added = Column(Integer, nullable=True)
+    updated = Column(Integer, nullable=True)
+    removed = Column(Integer, nullable=True)
+    success = Column(Boolean, nullable=False)
+    error_class = Column(String(100), nullable=True)
+
+
+class SyncWorker(Base):
+    __tablename__ = "sync_workers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    worker_id = Column(String(255), nullable=False, unique=True)
+    mode = Column(String(20), nullable=False)
+    hostname = Column(String(255), nullable=True)
+    pid = Column(Integer, nullable=True)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    heartbeat_at = Column(DateTime, default=datetime.utcnow, index=True)
+    details = Column(Text, nullable=True)
+
+
+class PerformanceProfile(Base):
+    # A request or sync run captured by src.profiling; the newest
+    # PROFILE_KEEP are kept.
+    __tablename__ = "performance_profiles"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), nullable=False)
+    label = Column(String(255), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    duration_ms = Column(Integer, nullable=False)
+    samples = Column(Integer, nullable=False)
+    summary = Column(Text, nullable=False)
+    # Collapsed stacks ("a;b;c 12" per line) for flamegraph tools
+    stacks = Column(Text, nullable=False)
+    memory = Column(Text, nullable=True)
+
+
 class GlobalSettings(Base):
     __tablename__ = "global_settings"
 
@@ -102,6 +227,9 @@ class OAuthSettings(Base):
 
 class OAuthToken(Base):
     __tablename__ = "oauth_tokens"
+    __table_args__ = (
+        Index("ix_oauth_tokens_user_provider", "user_id", "provider"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -141,7 +269,7 @@ class UserSession(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     session_token = Column(String(64), nullable=False, unique=True, index=True)
-    expires_at = Column(DateTime, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
     ip_address = Column(String(45), nullable=True)
     user_agent = Column(String(512), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
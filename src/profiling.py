@@ -0,0 +1,276 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Optional
+
+from .database import SessionLocal
+from .logging_service import add_log
+from .models import PerformanceProfile
+from .settings_service import get_setting, take_setting_count
+
+
+# Admin > Profiling arms these counters in global_settings, so every web
+# and worker process sees them. Each captured request or sync run takes one.
+PROFILE_REQUESTS = "profile_requests"
+PROFILE_SYNCS = "profile_syncs"
+PROFILE_MEMORY = "profile_memory"
+# How long a process goes without rereading the counters.
+PROFILE_CHECK_SECONDS = 5
+PROFILE_SAMPLE_SECONDS = float(os.environ.get("PROFILE_SAMPLE_MS", "2")) / 1000
+# The sampler and tracemalloc stop after this long even if the request or
+# sync run goes on; the profile covers the first PROFILE_MAX_MS of it.
+PROFILE_MAX_SECONDS = float(os.environ.get("PROFILE_MAX_MS", "60000")) / 1000
+PROFILE_KEEP = 50
+PROFILE_SUMMARY_ROWS = 30
+TRACEMALLOC_FRAMES = 10
+TRACEMALLOC_TOP = 25
+# Requests slower than this get an X-Slow-Request header and a log entry.
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_MS", "1000")) / 1000
+# Never profiled: static files, scrapes, the profile pages themselves and the
+# dashboard's progress stream, which stays open as long as the tab does.
+PROFILE_SKIP_PREFIXES = ("/static", "/metrics", "/favicon.ico", "/admin/profil", "/api/sync/progress")
+
+# Threads parked in one of these are idle, not work. The functions block in
+# C (SimpleQueue.get), so they are the innermost Python frame while waiting:
+# thread pool workers and aiosqlite's connection threads.
+IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+IDLE_FUNCTIONS = {("thread.py", "_worker"), ("core.py", "_connection_worker_thread")}
+
+_armed = {PROFILE_REQUESTS: False, PROFILE_SYNCS: False}
+_checked_at = {PROFILE_REQUESTS: 0.0, PROFILE_SYNCS: 0.0}
+# The sampler sees the whole process, so only one profile runs at a time.
+_active = threading.Lock()
+
+
+def _is_armed(key: str) -> bool:
+    now = time.monotonic()
+    if now - _checked_at[key] >= PROFILE_CHECK_SECONDS:
+        _checked_at[key] = now
+        with SessionLocal() as db:
+            _armed[key] = int(get_setting(db, key, '0') or 0) > 0
+    return _armed[key]
+
+
+def refresh_armed():
+    # Called after the admin changes the counters in this process.
+    for key in _checked_at:
+        _checked_at[key] = 0.0
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _is_idle(code) -> bool:
+    filename = os.path.basename(code.co_filename)
+    return filename in IDLE_FILES or (filename, code.co_name) in IDLE_FUNCTIONS
+
+
+class SamplingProfiler(threading.Thread):
+    # Samples the Python stack of every thread. cProfile only sees the thread
+    # it was enabled on, and requests and syncs hand most of their work to
+    # asyncio.to_thread. Other requests running at the same time show up too.
+    def __init__(self, kind: str, label: str, memory: bool = False):
+        super().__init__(daemon=True, name="profiler")
+        self.kind = kind
+        self.label = label
+        self.memory = memory
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._own_tracemalloc = False
+        self._memory = None
+        self.stopped = None
+
+    def begin(self):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._own_tracemalloc = True
+        self.started = time.perf_counter()
+        self.start()
+
+    def run(self):
+        deadline = self.started + PROFILE_MAX_SECONDS
+        while not self._stop_event.wait(PROFILE_SAMPLE_SECONDS):
+            if time.perf_counter() >= deadline:
+                self._stop_tracing()
+                return
+            self._sample()
+
+    def _stop_tracing(self):
+        self.stopped = time.perf_counter()
+        if self.memory and tracemalloc.is_tracing():
+            self._memory = self._memory_report()
+            if self._own_tracemalloc:
+                tracemalloc.stop()
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id or _is_idle(frame.f_code):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            self.stacks[tuple(reversed(stack))] += 1
+        self.samples += 1
+
+    def end(self) -> dict:
+        self._stop_event.set()
+        self.join()
+        capped = self.stopped is not None
+        if not capped:
+            self._stop_tracing()
+        duration = self.stopped - self.started
+        memory = self._memory
+        return {
+            "kind": self.kind,
+            "label": self.label[:255],
+            "duration_ms": int(duration * 1000),
+            "samples": self.samples,
+            "summary": self._summary(duration, capped),
+            "stacks": "\n".join(
+                f"{';'.join(_frame_name(code) for code in stack)} {count}"
+                for stack, count in self.stacks.most_common()
+            ),
+            "memory": memory,
+        }
+
+    def _summary(self, duration: float, capped: bool = False) -> str:
+        busy = sum(self.stacks.values())
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for code in set(stack):
+                total[code] += count
+        lines = [
+            f"{self.kind}: {self.label}",
+            f"{duration * 1000:.0f}ms, {self.samples} samples every {PROFILE_SAMPLE_SECONDS * 1000:g}ms, "
+            f"{busy} busy thread samples",
+        ]
+        if capped:
+            lines.append(f"Stopped at the {PROFILE_MAX_SECONDS * 1000:.0f}ms cap (PROFILE_MAX_MS); "
+                         f"the {self.kind} ran on")
+        for title, counts in (("Own time", own), ("Including callees", total)):
+            lines += ["", f"{title}:", f"{'samples':>8} {'%':>6}  function"]
+            for code, count in counts.most_common(PROFILE_SUMMARY_ROWS):
+                lines.append(f"{count:>8} {100 * count / max(busy, 1):>5.1f}%  {_frame_name(code)}")
+        return "\n".join(lines)
+
+    def _memory_report(self) -> str:
+        current, peak = tracemalloc.get_traced_memory()
+        stats = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__)
+        ]).statistics("lineno")
+        lines = [f"traced: {current / 1024:.0f} KB now, {peak / 1024:.0f} KB peak"]
+        lines += [str(stat) for stat in stats[:TRACEMALLOC_TOP]]
+        return "\n".join(lines)
+
+
+def start_profile(key: str, kind: str, label: str = "") -> Optional[SamplingProfiler]:
+    # Returns None, at the cost of a clock read, unless profiling is armed.
+    if not _is_armed(key) or not _active.acquire(blocking=False):
+        return None
+    try:
+        with SessionLocal() as db:
+            if not take_setting_count(db, key):
+                _armed[key] = False
+                _active.release()
+                return None
+            memory = get_setting(db, PROFILE_MEMORY, 'false') == 'true'
+        profiler = SamplingProfiler(kind, label, memory=memory)
+        profiler.begin()
+        return profiler
+    except Exception:
+        _active.release()
+        raise
+
+
+async def start_profile_async(key: str, kind: str, label: str = "") -> Optional[SamplingProfiler]:
+    # start_profile for code on the event loop: its settings reads run in a
+    # worker thread. Disarmed and checked recently, it never leaves the loop.
+    if not _armed[key] and time.monotonic() - _checked_at[key] < PROFILE_CHECK_SECONDS:
+        return None
+    return await asyncio.to_thread(start_profile, key, kind, label)
+
+
+async def finish_profile_async(profiler: SamplingProfiler, label: str = None):
+    await asyncio.to_thread(finish_profile, profiler, label)
+
+
+def finish_profile(profiler: SamplingProfiler, label: str = None):
+    try:
+        if label:
+            profiler.label = label
+        result = profiler.end()
+    finally:
+        _active.release()
+    db = SessionLocal()
+    try:
+        db.add(PerformanceProfile(**result))
+        db.commit()
+        oldest_kept = db.query(PerformanceProfile.id).order_by(
+            PerformanceProfile.id.desc()
+        ).offset(PROFILE_KEEP - 1).limit(1).scalar()
+        if oldest_kept:
+            db.query(PerformanceProfile).filter(PerformanceProfile.id < oldest_kept).delete(synchronize_session=False)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Error saving profile: {e}")
+    finally:
+        db.close()
+
+
+def _route_label(scope) -> str:
+    # The route template, so feed tokens in the path stay out of the logs.
+    route = scope.get("route")
+    return f"{scope.get('method', '')} {getattr(route, 'path', None) or scope.get('path', '')}"
+
+
+class RequestTimingMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware: no extra task per request,
+    # and streamed responses pass straight through.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profiler = None
+        if not scope["path"].startswith(PROFILE_SKIP_PREFIXES):
+            profiler = await start_profile_async(PROFILE_REQUESTS, "request")
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            nonlocal profiler
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", f"app;dur={elapsed * 1000:.1f}".encode()))
+                if elapsed >= SLOW_REQUEST_SECONDS:
+                    headers.append((b"x-slow-request", b"1"))
+                    add_log(None, "WARNING", f"Slow request: {_route_label(scope)} took {elapsed * 1000:.0f}ms",
+                            source="profiling")
+                message = {**message, "headers": headers}
+                # Event streams stay open until the client leaves; the profile
+                # ends with the handler rather than holding the sampler.
+                if profiler and any(name.lower() == b"content-type" and value.startswith(b"text/event-stream")
+                                    for name, value in headers):
+                    finished, profiler = profiler, None
+                    await finish_profile_async(finished, _route_label(scope))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if profiler:
+                await finish_profile_async(profiler, _route_label(scope))
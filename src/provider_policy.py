@@ -0,0 +1,330 @@
+import asyncio
+import random
+import re
+import time
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+from typing import Optional
+from urllib.parse import urlparse
+
+import httpx
+
+from .metrics import HTTP_BUDGET_WAIT_SECONDS, HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS, note_payload
+
+
+# Requests per second and burst size per remote host. Every host has its
+# own bucket; hosts not listed here (ICS feeds, CalDAV servers) get one sized
+# by the default budget.
+HOST_BUDGETS = {
+    "www.googleapis.com": (10.0, 20),
+    "graph.microsoft.com": (5.0, 10),
+}
+DEFAULT_BUDGET = (2.0, 5)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Google reports exhausted quota as a 403 with one of these reasons instead
+# of a 429; such responses are throttled, not a permissions problem.
+THROTTLED_403_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+MAX_RETRIES = 3
+BACKOFF_BASE_SECONDS = 1.0
+# Retry-After values longer than this are not slept through inline; the host
+# is blocked until then and the sync fails fast instead.
+MAX_INLINE_RETRY_SECONDS = 30.0
+
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 300
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, host: str, retry_at: datetime):
+        self.host = host
+        self.retry_at = retry_at
+        super().__init__(
+            f"{host} is failing repeatedly; requests paused until {retry_at.strftime('%Y-%m-%d %H:%M:%S')} UTC"
+        )
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        async with self._lock:
+            while not self.try_acquire():
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def available(self) -> float:
+        self._refill()
+        return self.tokens
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: int = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[datetime] = None
+        self.blocked_until: Optional[datetime] = None
+        self.probe_started: Optional[datetime] = None
+
+    def retry_at(self) -> Optional[datetime]:
+        retry_at = self.blocked_until
+        reopen_at = None
+        if self.state == self.OPEN and self.opened_at:
+            reopen_at = self.opened_at + timedelta(seconds=self.reset_seconds)
+        elif self.state == self.HALF_OPEN and self.probe_started:
+            reopen_at = self.probe_started + timedelta(seconds=self.reset_seconds)
+        if reopen_at and (not retry_at or reopen_at > retry_at):
+            retry_at = reopen_at
+        return retry_at
+
+    def allow(self) -> bool:
+        now = datetime.utcnow()
+        if self.blocked_until and self.blocked_until > now:
+            return False
+        if self.state == self.OPEN:
+            if self.opened_at + timedelta(seconds=self.reset_seconds) > now:
+                return False
+            self.state = self.HALF_OPEN
+        elif self.state == self.HALF_OPEN:
+            # One probe at a time; its outcome decides whether we close
+            # again. A probe that never reported back (its sync was
+            # cancelled) is replaced after reset_seconds.
+            if self.probe_started and self.probe_started + timedelta(seconds=self.reset_seconds) > now:
+                return False
+        if self.state == self.HALF_OPEN:
+            self.probe_started = now
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = datetime.utcnow()
+            self.probe_started = None
+
+    def block_until(self, until: datetime):
+        if not self.blocked_until or until > self.blocked_until:
+            self.blocked_until = until
+
+
+class HostPolicy:
+    def __init__(self, host: str):
+        rate, capacity = HOST_BUDGETS.get(host, DEFAULT_BUDGET)
+        self.host = host
+        self.bucket = TokenBucket(rate, capacity)
+        self.breaker = CircuitBreaker()
+        self.requests = 0
+        self.throttled = 0
+        self.last_status: Optional[int] = None
+        self.last_error: Optional[str] = None
+
+    def check(self):
+        if not self.breaker.allow():
+            raise CircuitOpenError(self.host, self.breaker.retry_at())
+
+    def snapshot(self) -> dict:
+        blocked = self.breaker.blocked_until and self.breaker.blocked_until > datetime.utcnow()
+        return {
+            "host": self.host,
+            "state": "blocked" if blocked else self.breaker.state,
+            "failures": self.breaker.failures,
+            "retry_at": self.breaker.retry_at(),
+            "tokens": round(self.bucket.available(), 1),
+            "capacity": self.bucket.capacity,
+            "rate": self.bucket.rate,
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "last_status": self.last_status,
+            "last_error": self.last_error,
+        }
+
+
+_policies = {}
+
+
+def get_host_policy(url: str) -> HostPolicy:
+    host = urlparse(url).hostname or url
+    policy = _policies.get(host)
+    if policy is None:
+        policy = _policies[host] = HostPolicy(host)
+    return policy
+
+
+def get_policy_snapshot() -> list:
+    return [policy.snapshot() for _, policy in sorted(_policies.items())]
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def is_throttled(status: int, body=None) -> bool:
+    # body is the decoded JSON error, needed to tell a quota 403 from a real one.
+    if status in RETRY_STATUS_CODES:
+        return True
+    if status != 403 or not isinstance(body, dict) or not isinstance(body.get("error"), dict):
+        return False
+    return any(isinstance(item, dict) and item.get("reason") in THROTTLED_403_REASONS
+               for item in body["error"].get("errors") or [])
+
+
+def _response_throttled(response: httpx.Response) -> bool:
+    if response.status_code != 403:
+        return response.status_code in RETRY_STATUS_CODES
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    return is_throttled(response.status_code, body)
+
+
+def _error_status(error: Exception) -> Optional[int]:
+    # HTTP status behind a blocking client's exception: httpx/requests keep
+    # the response; caldav's DAVError carries "<status> <text>" in reason or,
+    # depending on the call, in its url field.
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int):
+        return status
+    for field in ("reason", "url"):
+        match = re.match(r"\s*(\d{3}) ", str(getattr(error, field, "") or ""))
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def is_host_failure(error: Exception) -> bool:
+    # Only an unreachable, slow, failing or throttling host counts against
+    # its breaker. A wrong password or path is one source's problem; on a
+    # shared host (caldav.icloud.com) it must not pause every other tenant.
+    if isinstance(error, (OSError, httpx.TransportError)):
+        return True
+    status = _error_status(error)
+    return status is not None and (status == 429 or status >= 500)
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    if retry_after is not None:
+        return retry_after + random.uniform(0, BACKOFF_BASE_SECONDS)
+    # Full jitter: spreads retries from concurrent syncs to the same host.
+    return random.uniform(0, BACKOFF_BASE_SECONDS * (2 ** attempt))
+
+
+async def send_with_policy(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+    policy = get_host_policy(url)
+    policy.check()
+
+    for attempt in range(MAX_RETRIES + 1):
+        waited = time.perf_counter()
+        await policy.bucket.acquire()
+        HTTP_BUDGET_WAIT_SECONDS.labels(policy.host).observe(time.perf_counter() - waited)
+        policy.requests += 1
+        in_flight = HTTP_IN_FLIGHT.labels(policy.host)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            policy.last_status = None
+            policy.last_error = f"{type(e).__name__}: {e}"
+            if attempt == MAX_RETRIES:
+                policy.breaker.record_failure()
+                raise
+            response = None
+        finally:
+            in_flight.dec()
+            HTTP_REQUEST_SECONDS.labels(policy.host).observe(time.perf_counter() - started)
+        if response is None:
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+        note_payload(len(response.content))
+
+        policy.last_status = response.status_code
+        if not _response_throttled(response):
+            policy.last_error = None
+            policy.breaker.record_success()
+            return response
+
+        policy.throttled += 1
+        policy.last_error = f"HTTP {response.status_code}"
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None and retry_after > MAX_INLINE_RETRY_SECONDS:
+            policy.breaker.block_until(datetime.utcnow() + timedelta(seconds=retry_after))
+            policy.breaker.record_failure()
+            return response
+        if attempt == MAX_RETRIES:
+            policy.breaker.record_failure()
+            return response
+        await asyncio.sleep(backoff_delay(attempt, retry_after))
+
+    return response
+
+
+async def run_with_policy(url: str, func, *args, **kwargs):
+    # For blocking clients (CalDAV) that issue their own requests: one budget
+    # token per call, breaker bookkeeping on the outcome, and the call itself
+    # runs in a worker thread so a slow server doesn't stall the event loop.
+    policy = get_host_policy(url)
+    policy.check()
+    waited = time.perf_counter()
+    await policy.bucket.acquire()
+    HTTP_BUDGET_WAIT_SECONDS.labels(policy.host).observe(time.perf_counter() - waited)
+    policy.requests += 1
+    in_flight = HTTP_IN_FLIGHT.labels(policy.host)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        result = await asyncio.to_thread(func, *args, **kwargs)
+    except Exception as e:
+        policy.last_error = f"{type(e).__name__}: {e}"
+        if is_host_failure(e):
+            policy.breaker.record_failure()
+        else:
+            # The host answered, like a 4xx in send_with_policy.
+            policy.breaker.record_success()
+        raise
+    finally:
+        in_flight.dec()
+        HTTP_REQUEST_SECONDS.labels(policy.host).observe(time.perf_counter() - started)
+    policy.last_error = None
+    policy.breaker.record_success()
+    return result
@@ -1,38 +1,126 @@
 import asyncio
-from datetime import datetime
+import json
+import os
+import socket
+from datetime import datetime, timedelta, timezone
+from apscheduler.events import EVENT_JOB_SUBMITTED
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
 from .database import SessionLocal
-from .sync_service import sync_all_sources
-from .logging_service import add_log
+from .models import SyncWorker, CalendarSource
+from .sync_queue import (
+    enqueue_due_sources, enqueue_sources, prune_finished_jobs, job_worker_loop, get_worker_concurrency
+)
+from .logging_service import add_log, enforce_log_retention
+from .auth import cleanup_expired_sessions
+from .db_maintenance import run_maintenance, MAINTENANCE_CHECK_MINUTES
+from .metrics import SCHEDULER_LAG_SECONDS
+from .provider_policy import get_policy_snapshot
+from .sync_schedule import reschedule_all, get_next_scheduled_sync, get_base_interval
+from .sync_runs import prune_sync_runs
 
 
 scheduler = AsyncIOScheduler()
 _current_interval = 10
+# How often the scheduler looks for sources whose adaptive next-run time has
+# passed. Each source's own interval is decided in sync_schedule.
+SCHEDULER_TICK_SECONDS = 60
+# Processes that own scheduling report in this often; the web app treats a
+# worker as gone after two missed heartbeats.
+HEARTBEAT_SECONDS = 30
 
+_worker_id = f"{socket.gethostname()}:{os.getpid()}"
+_mode = None
+_job_runners = []
 
-async def scheduled_sync():
+
+def web_runs_scheduler() -> bool:
+    # SYNC_MODE=embedded (default): the web process schedules syncs itself.
+    # SYNC_MODE=web: the web process never schedules; run worker.py instead.
+    return os.environ.get("SYNC_MODE", "embedded").lower() != "web"
+
+
+async def scheduled_sync(due_only: bool = True):
+    # Only decides *what* should sync; the job runners (here or in other
+    # processes) do the actual work from the sync_jobs queue.
     db = SessionLocal()
     try:
-        add_log(db, "INFO", "Scheduled calendar sync started", source="scheduler")
-        results = await sync_all_sources(db)
-        
-        success_count = sum(1 for r in results.values() if r["success"])
-        fail_count = len(results) - success_count
-        
-        for source_name, result in results.items():
-            status = "Success" if result["success"] else "Failed"
-            level = "INFO" if result["success"] else "WARNING"
-            add_log(db, level, f"Sync {source_name}: {status} - {result['message']}", source="scheduler")
-        
-        add_log(db, "INFO", f"Scheduled sync completed: {success_count} success, {fail_count} failed", source="scheduler")
+        if due_only:
+            jobs = enqueue_due_sources(db)
+        else:
+            sources = db.query(CalendarSource).filter(CalendarSource.is_enabled == True).all()
+            jobs = enqueue_sources(db, sources, reason="manual")
+        if jobs:
+            add_log(db, "INFO", f"Queued {len(jobs)} calendar source(s) for sync", source="scheduler")
     except Exception as e:
         add_log(db, "ERROR", f"Error during scheduled sync: {str(e)}", source="scheduler")
     finally:
         db.close()
 
 
+def prune_sync_jobs():
+    db = SessionLocal()
+    try:
+        prune_finished_jobs(db)
+        deleted = prune_sync_runs(db)
+        if deleted:
+            print(f"Removed {deleted} old sync run(s)")
+    finally:
+        db.close()
+
+
+def cleanup_sessions():
+    db = SessionLocal()
+    try:
+        deleted = cleanup_expired_sessions(db)
+        if deleted:
+            print(f"Removed {deleted} expired session(s)")
+    except Exception as e:
+        db.rollback()
+        print(f"Error cleaning up sessions: {e}")
+    finally:
+        db.close()
+
+
+def record_job_lag(event):
+    now = datetime.now(timezone.utc)
+    for run_time in event.scheduled_run_times:
+        SCHEDULER_LAG_SECONDS.labels(event.job_id).observe(max(0.0, (now - run_time).total_seconds()))
+
+
+def run_log_retention():
+    db = SessionLocal()
+    try:
+        result = enforce_log_retention(db)
+        if result["by_age"] or result["by_cap"]:
+            message = (f"Log retention removed {result['by_age']} expired and "
+                       f"{result['by_cap']} over-cap entries")
+            if result["freed_bytes"]:
+                message += f", freeing {result['freed_bytes'] // 1024} KB"
+            if result["reclaimed_bytes"]:
+                message += f"; the database file shrank by {result['reclaimed_bytes'] // 1024} KB"
+            add_log(db, "INFO", message, source="scheduler")
+    except Exception as e:
+        db.rollback()
+        add_log(db, "WARNING", f"Log retention failed: {e}", source="scheduler")
+    finally:
+        db.close()
+
+
+def run_db_maintenance():
+    try:
+        done = run_maintenance()
+        if done:
+            print(f"Database maintenance: {', '.join(done)}")
+    except Exception as e:
+        db = SessionLocal()
+        try:
+            add_log(db, "WARNING", f"Database maintenance failed: {e}", source="scheduler")
+        finally:
+            db.close()
+
+
 def get_sync_interval() -> int:
     db = SessionLocal()
     try:
@@ -45,19 +133,116 @@ def get_sync_interval() -> int:
         db.close()
 
 
-def start_scheduler():
+def record_heartbeat():
     global _current_interval
+    db = SessionLocal()
+    try:
+        # Interval changes made through another process reach us via the DB.
+        _current_interval = get_base_interval(db)
+        
+        worker = db.query(SyncWorker).filter(SyncWorker.worker_id == _worker_id).first()
+        if not worker:
+            worker = SyncWorker(
+                worker_id=_worker_id,
+                mode=_mode,
+                hostname=socket.gethostname(),
+                pid=os.getpid(),
+                started_at=datetime.utcnow()
+            )
+            db.add(worker)
+        worker.heartbeat_at = datetime.utcnow()
+        worker.details = json.dumps({"provider_policies": get_policy_snapshot()}, default=str)
+        db.commit()
+    except Exception as e:
+        print(f"Error recording scheduler heartbeat: {e}")
+    finally:
+        db.close()
+
+
+def remove_heartbeat():
+    db = SessionLocal()
+    try:
+        db.query(SyncWorker).filter(SyncWorker.worker_id == _worker_id).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def get_active_workers(db) -> list:
+    cutoff = datetime.utcnow() - timedelta(seconds=HEARTBEAT_SECONDS * 2)
+    return db.query(SyncWorker).filter(SyncWorker.heartbeat_at >= cutoff).order_by(SyncWorker.started_at).all()
+
+
+def get_worker_policy_snapshot(db) -> list:
+    policies = []
+    for worker in get_active_workers(db):
+        details = json.loads(worker.details or "{}")
+        for policy in details.get("provider_policies", []):
+            if policy.get("retry_at"):
+                policy["retry_at"] = datetime.fromisoformat(policy["retry_at"])
+            policy["host"] = f"{policy['host']} ({worker.worker_id})"
+            policies.append(policy)
+    return policies
+
+
+def start_scheduler(mode: str = "embedded"):
+    global _current_interval, _mode
     _current_interval = get_sync_interval()
+    _mode = mode
     
     scheduler.add_job(
         scheduled_sync,
-        trigger=IntervalTrigger(minutes=_current_interval),
+        trigger=IntervalTrigger(seconds=SCHEDULER_TICK_SECONDS),
         id="calendar_sync",
-        name="Sync all calendar sources",
+        name="Sync due calendar sources",
+        replace_existing=True
+    )
+    scheduler.add_job(
+        record_heartbeat,
+        trigger=IntervalTrigger(seconds=HEARTBEAT_SECONDS),
+        id="scheduler_heartbeat",
+        name="Record scheduler heartbeat",
+        next_run_time=datetime.now(),
+        replace_existing=True
+    )
+    scheduler.add_job(
+        prune_sync_jobs,
+        trigger=IntervalTrigger(hours=1),
+        id="sync_job_cleanup",
+        name="Prune finished sync jobs",
         replace_existing=True
     )
+    scheduler.add_job(
+        cleanup_sessions,
+        trigger=IntervalTrigger(hours=1),
+        id="session_cleanup",
+        name="Remove expired login sessions",
+        next_run_time=datetime.now(),
+        replace_existing=True
+    )
+    scheduler.add_job(
+        run_log_retention,
+        trigger=IntervalTrigger(hours=1),
+        id="log_retention",
+        name="Enforce log retention",
+        next_run_time=datetime.now(),
+        replace_existing=True
+    )
+    scheduler.add_job(
+        run_db_maintenance,
+        trigger=IntervalTrigger(minutes=MAINTENANCE_CHECK_MINUTES),
+        id="db_maintenance",
+        name="SQLite maintenance after large syncs",
+        replace_existing=True
+    )
+    scheduler.add_listener(record_job_lag, EVENT_JOB_SUBMITTED)
     scheduler.start()
-    print(f"Scheduler started - syncing every {_current_interval} minutes")
+    
+    loop = asyncio.get_running_loop()
+    for _ in range(get_worker_concurrency()):
+        _job_runners.append(loop.create_task(job_worker_loop()))
+    print(f"Scheduler started ({mode}) - syncing sources at most every {_current_interval} minutes "
+          f"with {len(_job_runners)} job runner(s)")
 
 
 def update_sync_interval(new_interval_minutes: int):
@@ -70,34 +255,42 @@ def update_sync_interval(new_interval_minutes: int):
     
     _current_interval = new_interval_minutes
     
-    scheduler.reschedule_job(
-        "calendar_sync",
-        trigger=IntervalTrigger(minutes=new_interval_minutes)
-    )
-    
-    print(f"Scheduler updated - now syncing every {new_interval_minutes} minutes")
+    print(f"Scheduler updated - now syncing sources at most every {new_interval_minutes} minutes")
     
     db = SessionLocal()
     try:
+        reschedule_all(db)
         add_log(db, "INFO", f"Sync interval changed to {new_interval_minutes} minutes", source="scheduler")
     finally:
         db.close()
 
 
 def get_current_interval() -> int:
+    if _mode is None:
+        return get_sync_interval()
     return _current_interval
 
 
+def is_scheduler_running() -> bool:
+    return scheduler.running
+
+
 def get_next_run_time() -> datetime:
-    job = scheduler.get_job("calendar_sync")
-    if job and job.next_run_time:
-        return job.next_run_time
-    return None
+    db = SessionLocal()
+    try:
+        return get_next_scheduled_sync(db)
+    finally:
+        db.close()
 
 
 def trigger_manual_sync():
-    asyncio.create_task(scheduled_sync())
+    asyncio.create_task(scheduled_sync(due_only=False))
 
 
 def stop_scheduler():
-    scheduler.shutdown()
+    for task in _job_runners:
+        task.cancel()
+    _job_runners.clear()
+    if scheduler.running:
+        scheduler.shutdown()
+        remove_heartbeat()
@@ -0,0 +1,58 @@
+import fcntl
+import os
+from contextlib import contextmanager
+
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from sqlalchemy import text
+
+from .database import engine, IS_SQLITE
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALEMBIC_INI = os.path.join(ROOT_DIR, "alembic.ini")
+MIGRATIONS_DIR = os.path.join(ROOT_DIR, "migrations")
+# Arbitrary, app-wide key for pg_advisory_lock.
+PG_MIGRATION_LOCK_ID = 7261534
+
+
+@contextmanager
+def _migration_lock(connection):
+    # The web app and the worker both migrate on startup; only one may run
+    # the migrations, the other waits and then finds nothing left to do.
+    if IS_SQLITE:
+        lock_path = f"{engine.url.database}.migrate-lock"
+        with open(lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        connection.execute(text("SELECT pg_advisory_lock(:id)"), {"id": PG_MIGRATION_LOCK_ID})
+        connection.commit()
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": PG_MIGRATION_LOCK_ID})
+            connection.commit()
+
+
+def get_alembic_config() -> Config:
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", MIGRATIONS_DIR)
+    return config
+
+
+def upgrade_database():
+    config = get_alembic_config()
+    with engine.connect() as connection:
+        with _migration_lock(connection):
+            before = MigrationContext.configure(connection).get_current_revision()
+            config.attributes["connection"] = connection
+            command.upgrade(config, "head")
+            connection.commit()
+            after = MigrationContext.configure(connection).get_current_revision()
+    if after != before:
+        print(f"Database schema upgraded: {before or 'unversioned'} -> {after}")
@@ -0,0 +1,103 @@
+import re
+from typing import List
+
+from sqlalchemy import Integer, and_, column, func, literal_column, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, contains_eager
+
+from .ics_generator import _event_dicts
+from .models import ApplicationLog, CalendarSource, Event
+
+
+# SQLite: external-content FTS5 tables kept current by triggers.
+# PostgreSQL: GIN indexes on these exact to_tsvector() expressions, which
+# the queries below must repeat verbatim for the planner to use them.
+LOG_FTS_TABLE = "application_logs_fts"
+EVENT_FTS_TABLE = "events_fts"
+LOG_SEARCH_INDEX = "ix_application_logs_search"
+EVENT_SEARCH_INDEX = "ix_events_search"
+LOG_TSVECTOR = "to_tsvector('simple', coalesce(message, '') || ' ' || coalesce(details, ''))"
+EVENT_TSVECTOR = (
+    "to_tsvector('simple', coalesce(original_summary, '') || ' ' || "
+    "coalesce(original_description, '') || ' ' || coalesce(original_location, ''))"
+)
+SEARCH_MAX_TERMS = 8
+EVENT_SEARCH_LIMIT = 50
+EVENT_SEARCH_MAX_LIMIT = 200
+
+_fts_tables = None
+
+
+def is_search_object(name: str) -> bool:
+    # FTS5 tables come with shadow tables (events_fts_data, ...); none of
+    # these are declared on the models.
+    return (name.startswith(LOG_FTS_TABLE) or name.startswith(EVENT_FTS_TABLE)
+            or name in (LOG_SEARCH_INDEX, EVENT_SEARCH_INDEX))
+
+
+def search_terms(q: str) -> List[str]:
+    return re.findall(r"\w+", q or "")[:SEARCH_MAX_TERMS]
+
+
+def _has_fts(db: Session, table: str) -> bool:
+    # Python builds without FTS5 skip the tables in the migration; search
+    # then falls back to LIKE.
+    global _fts_tables
+    if _fts_tables is None:
+        _fts_tables = set(db.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN (:logs, :events)"),
+            {"logs": LOG_FTS_TABLE, "events": EVENT_FTS_TABLE}
+        ).scalars())
+    return table in _fts_tables
+
+
+def _match(db: Session, terms: List[str], id_column, fts_table: str, tsvector: str, like_columns):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        return literal_column(tsvector).op("@@")(func.to_tsquery(literal_column("'simple'"), tsquery))
+    if dialect == "sqlite" and _has_fts(db, fts_table):
+        # Every term must match, as a prefix.
+        fts_query = " ".join(f'"{term}"*' for term in terms)
+        matches = text(f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH :fts_query").bindparams(
+            fts_query=fts_query
+        ).columns(column("rowid", Integer))
+        return id_column.in_(matches)
+    return and_(*[or_(*[like_column.ilike(f"%{term}%") for like_column in like_columns]) for term in terms])
+
+
+def log_search_filter(db: Session, q: str):
+    terms = search_terms(q)
+    if not terms:
+        return None
+    return _match(db, terms, ApplicationLog.id, LOG_FTS_TABLE, LOG_TSVECTOR,
+                  [ApplicationLog.message, ApplicationLog.details])
+
+
+def _event_search_query(db: Session, user_id: int, terms: List[str], limit: int):
+    condition = _match(db, terms, Event.id, EVENT_FTS_TABLE, EVENT_TSVECTOR,
+                       [Event.original_summary, Event.original_description, Event.original_location])
+    # Masked sources only ever show "Busy", so their text must not match.
+    return select(Event).join(CalendarSource).options(contains_eager(Event.source)).where(
+        CalendarSource.user_id == user_id,
+        CalendarSource.is_enabled == True,
+        or_(CalendarSource.masking == False, CalendarSource.masking.is_(None)),
+        condition
+    ).order_by(Event.start_datetime).limit(max(1, min(limit, EVENT_SEARCH_MAX_LIMIT)))
+
+
+def search_events(db: Session, user_id: int, q: str, limit: int = EVENT_SEARCH_LIMIT) -> List[dict]:
+    terms = search_terms(q)
+    if not terms:
+        return []
+    events = db.execute(_event_search_query(db, user_id, terms, limit)).scalars().all()
+    return _event_dicts(events, apply_masking=True)
+
+
+async def search_events_async(db: AsyncSession, user_id: int, q: str, limit: int = EVENT_SEARCH_LIMIT) -> List[dict]:
+    terms = search_terms(q)
+    if not terms:
+        return []
+    query = await db.run_sync(lambda session: _event_search_query(session, user_id, terms, limit))
+    events = (await db.execute(query)).scalars().all()
+    return _event_dicts(events, apply_masking=True)
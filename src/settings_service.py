@@ -1,6 +1,10 @@
+import threading
+import time
 from typing import Optional
+from sqlalchemy import Integer, Text, update
 from sqlalchemy.orm import Session
 
+from .metrics import cache_lookup
 from .models import GlobalSettings
 
 
@@ -9,14 +13,75 @@ DEFAULT_SETTINGS = {
     'public_domain': '',
     'app_name': 'Calendar Aggregator',
     'sync_interval_minutes': '10',
-    'log_retention_days': '30'
+    'log_retention_days': '30',
+    # 0: no cap
+    'log_max_rows': '0',
+    # Armed from Admin > Profiling; counted down as profiles are taken.
+    'profile_requests': '0',
+    'profile_syncs': '0',
+    'profile_memory': 'false'
 }
 
 
+# Settings are read from an in-process snapshot. set_setting bumps the
+# version row; other processes compare it at most every
+# SETTINGS_VERSION_CHECK_SECONDS and reload the table when it moved.
+SETTINGS_VERSION_KEY = '_settings_version'
+SETTINGS_VERSION_CHECK_SECONDS = 5
+
+_snapshot = None
+_snapshot_version = None
+_version_checked_at = 0.0
+_snapshot_lock = threading.Lock()
+
+
+def _read_version(db: Session) -> Optional[str]:
+    return db.query(GlobalSettings.setting_value).filter(
+        GlobalSettings.setting_key == SETTINGS_VERSION_KEY
+    ).scalar()
+
+
+def _load_snapshot(db: Session) -> dict:
+    global _snapshot, _snapshot_version, _version_checked_at
+    rows = dict(db.query(GlobalSettings.setting_key, GlobalSettings.setting_value).all())
+    _snapshot_version = rows.pop(SETTINGS_VERSION_KEY, None)
+    _snapshot = rows
+    _version_checked_at = time.monotonic()
+    return rows
+
+
+def _get_snapshot(db: Session) -> dict:
+    global _version_checked_at
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - _version_checked_at < SETTINGS_VERSION_CHECK_SECONDS:
+        cache_lookup("settings", True)
+        return snapshot
+    with _snapshot_lock:
+        if _snapshot is not None and time.monotonic() - _version_checked_at < SETTINGS_VERSION_CHECK_SECONDS:
+            cache_lookup("settings", True)
+            return _snapshot
+        if _snapshot is not None and _read_version(db) == _snapshot_version:
+            _version_checked_at = time.monotonic()
+            cache_lookup("settings", True)
+            return _snapshot
+        cache_lookup("settings", False)
+        return _load_snapshot(db)
+
+
+def _bump_version(db: Session):
+    bumped = db.execute(
+        update(GlobalSettings)
+        .where(GlobalSettings.setting_key == SETTINGS_VERSION_KEY)
+        .values(setting_value=(GlobalSettings.setting_value.cast(Integer) + 1).cast(Text))
+    ).rowcount
+    if not bumped:
+        db.add(GlobalSettings(setting_key=SETTINGS_VERSION_KEY, setting_value='1'))
+
+
 def get_setting(db: Session, key: str, default: str = None) -> Optional[str]:
-    setting = db.query(GlobalSettings).filter(GlobalSettings.setting_key == key).first()
-    if setting:
-        return setting.setting_value
+    snapshot = _get_snapshot(db)
+    if key in snapshot:
+        return snapshot[key]
     return default if default is not None else DEFAULT_SETTINGS.get(key)
 
 
@@ -27,16 +92,35 @@ def set_setting(db: Session, key: str, value: str) -> GlobalSettings:
     else:
         setting = GlobalSettings(setting_key=key, setting_value=value)
         db.add(setting)
+    _bump_version(db)
     db.commit()
     db.refresh(setting)
+    with _snapshot_lock:
+        _load_snapshot(db)
     return setting
 
 
+def take_setting_count(db: Session, key: str) -> bool:
+    # Atomically takes one from a counter setting, so concurrent processes
+    # never take more than were set. False once it is down to 0.
+    value = GlobalSettings.setting_value.cast(Integer)
+    taken = db.execute(
+        update(GlobalSettings)
+        .where(GlobalSettings.setting_key == key, value > 0)
+        .values(setting_value=(value - 1).cast(Text))
+    ).rowcount
+    if taken:
+        _bump_version(db)
+    db.commit()
+    if taken:
+        with _snapshot_lock:
+            _load_snapshot(db)
+    return bool(taken)
+
+
 def get_all_settings(db: Session) -> dict:
-    settings = db.query(GlobalSettings).all()
     result = DEFAULT_SETTINGS.copy()
-    for setting in settings:
-        result[setting.setting_key] = setting.setting_value
+    result.update(_get_snapshot(db))
     return result
 
 
@@ -58,4 +142,8 @@ def initialize_default_settings(db: Session):
         if not existing:
             setting = GlobalSettings(setting_key=key, setting_value=value)
             db.add(setting)
+    if not _read_version(db):
+        db.add(GlobalSettings(setting_key=SETTINGS_VERSION_KEY, setting_value='1'))
     db.commit()
+    with _snapshot_lock:
+        _load_snapshot(db)
@@ -0,0 +1,505 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import and_, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .models import CalendarSource, SyncJob
+from .sync_service import (
+    BATCH_SOURCE_TYPES, prefetch_events, shared_fetch_digest, sync_calendar_source
+)
+from .sync_schedule import get_due_sources
+from .logging_service import add_log
+from .metrics import SYNC_QUEUE_WAIT_SECONDS
+from .db_maintenance import note_rows_written
+
+
+# A claimed job belongs to its worker until the lease runs out. Running jobs
+# renew it every LEASE_SECONDS / 3, so a lease only lapses when the worker
+# died; the job is then handed to another worker and counts as an attempt.
+LEASE_SECONDS = 120
+RETRY_BACKOFF_SECONDS = 30
+IDLE_POLL_SECONDS = 2.0
+CLAIM_CANDIDATES = 20
+# A worker that claims a Google or Outlook job also claims up to this many
+# pending jobs for the same user's other sources of that provider, and
+# fetches them all through one batch API call.
+BATCH_CLAIM_LIMIT = 20
+# Likewise for ICS/CalDAV jobs: up to this many sources of any user that
+# subscribe to the same feed share one fetch and parse.
+SHARED_CLAIM_LIMIT = 100
+FINISHED_JOB_RETENTION_DAYS = 7
+# Progress is written to the job row at most this often (phase changes are
+# always written), so paging through a big calendar doesn't hammer the DB.
+PROGRESS_WRITE_SECONDS = 0.5
+# Finished jobs stay in the progress feed this long so clients see the result.
+PROGRESS_RECENT_SECONDS = 60
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+# Reasons for jobs a user asked for; the dashboard follows these until they
+# finish. Scheduled syncs and feed subscribers riding along are not followed.
+USER_STARTED_REASONS = ("manual", "added")
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def get_worker_concurrency() -> int:
+    try:
+        return max(1, int(os.environ.get("SYNC_WORKER_CONCURRENCY", "2")))
+    except ValueError:
+        return 2
+
+
+def enqueue_sync(db: Session, source_id: int, reason: str = "manual") -> SyncJob:
+    existing = db.query(SyncJob).filter(
+        SyncJob.source_id == source_id, SyncJob.status == JOB_PENDING
+    ).first()
+    if existing:
+        return existing
+
+    job = SyncJob(source_id=source_id, status=JOB_PENDING, reason=reason, attempts=0, run_after=datetime.utcnow())
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another process queued the same source between our check and insert.
+        db.rollback()
+        return db.query(SyncJob).filter(
+            SyncJob.source_id == source_id, SyncJob.status == JOB_PENDING
+        ).first()
+    return job
+
+
+def enqueue_sources(db: Session, sources: List[CalendarSource], reason: str = "manual") -> List[SyncJob]:
+    return [enqueue_sync(db, source.id, reason=reason) for source in sources]
+
+
+def enqueue_due_sources(db: Session) -> List[SyncJob]:
+    busy = {
+        source_id for (source_id,) in db.query(SyncJob.source_id).filter(
+            SyncJob.status.in_([JOB_PENDING, JOB_RUNNING])
+        ).all()
+    }
+    due = [source for source in get_due_sources(db) if source.id not in busy]
+    return enqueue_sources(db, due, reason="scheduled")
+
+
+def claim_job(db: Session, worker_id: str = WORKER_ID) -> Optional[SyncJob]:
+    now = datetime.utcnow()
+    candidates = db.query(SyncJob).filter(or_(
+        and_(SyncJob.status == JOB_PENDING, SyncJob.run_after <= now),
+        and_(SyncJob.status == JOB_RUNNING, SyncJob.lease_expires_at < now)
+    )).order_by(SyncJob.run_after, SyncJob.id).limit(CLAIM_CANDIDATES).all()
+
+    for job in candidates:
+        if job.status == JOB_RUNNING and job.attempts >= job.max_attempts:
+            db.query(SyncJob).filter(
+                SyncJob.id == job.id, SyncJob.status == JOB_RUNNING, SyncJob.lease_expires_at < now
+            ).update({
+                "status": JOB_FAILED,
+                "success": False,
+                "message": "Worker lost the job too many times",
+                "finished_at": now
+            }, synchronize_session=False)
+            db.commit()
+            continue
+
+        if job.status == JOB_PENDING:
+            # Never run two syncs of the same source at once.
+            in_flight = db.query(SyncJob.id).filter(
+                SyncJob.source_id == job.source_id,
+                SyncJob.status == JOB_RUNNING,
+                SyncJob.lease_expires_at >= now
+            ).first()
+            if in_flight:
+                continue
+            condition = SyncJob.status == JOB_PENDING
+        else:
+            condition = and_(SyncJob.status == JOB_RUNNING, SyncJob.lease_expires_at < now)
+
+        # The conditional UPDATE is the actual claim: only one worker's
+        # statement can match the row in its claimable state.
+        claimed = db.query(SyncJob).filter(SyncJob.id == job.id, condition).update(
+            _claim_values(worker_id, now), synchronize_session=False
+        )
+        db.commit()
+        if claimed:
+            db.refresh(job)
+            return job
+
+    return None
+
+
+def _claim_values(worker_id: str, now: datetime) -> dict:
+    return {
+        "status": JOB_RUNNING,
+        "lease_owner": worker_id,
+        "lease_expires_at": now + timedelta(seconds=LEASE_SECONDS),
+        "heartbeat_at": now,
+        "started_at": now,
+        "progress": None,
+        "attempts": SyncJob.attempts + 1
+    }
+
+
+def claim_sibling_jobs(db: Session, source: CalendarSource, worker_id: str = WORKER_ID) -> List[SyncJob]:
+    # Jobs that can share source's fetch: the same user's other sources of
+    # the same provider (one OAuth token, one batch call), or any user's
+    # sources of the same ICS/CalDAV feed. Feed subscribers that have no job
+    # yet get one, so the whole group syncs from this fetch. Sources another
+    # worker is syncing are left alone.
+    if source.source_type in BATCH_SOURCE_TYPES:
+        shared, limit = False, BATCH_CLAIM_LIMIT
+        same_fetch = and_(CalendarSource.user_id == source.user_id, CalendarSource.source_type == source.source_type)
+    else:
+        shared, limit = True, SHARED_CLAIM_LIMIT
+        # The stored key, indexed; equal keys imply the same kind of source.
+        key = source.fetch_key or shared_fetch_digest(source)
+        if key is None:
+            return []
+        same_fetch = CalendarSource.fetch_key == key
+
+    now = datetime.utcnow()
+    in_flight = select(SyncJob.source_id).where(SyncJob.status == JOB_RUNNING, SyncJob.lease_expires_at >= now)
+    query = db.query(SyncJob, CalendarSource).join(CalendarSource, CalendarSource.id == SyncJob.source_id).filter(
+        SyncJob.status == JOB_PENDING,
+        SyncJob.run_after <= now,
+        same_fetch,
+        SyncJob.source_id != source.id,
+        SyncJob.source_id.not_in(in_flight)
+    ).order_by(SyncJob.run_after, SyncJob.id).limit(limit)
+    jobs = [job for job, _ in query.all()]
+
+    if shared and len(jobs) < limit:
+        queued = select(SyncJob.source_id).where(SyncJob.status.in_([JOB_PENDING, JOB_RUNNING]))
+        idle = db.query(CalendarSource.id).filter(
+            same_fetch,
+            CalendarSource.is_enabled == True,
+            CalendarSource.id != source.id,
+            CalendarSource.id.not_in(queued)
+        ).order_by(CalendarSource.id).limit(limit - len(jobs)).all()
+        for (other_id,) in idle:
+            jobs.append(enqueue_sync(db, other_id, reason="shared"))
+
+    claimed_jobs = []
+    for job in jobs:
+        claimed = db.query(SyncJob).filter(SyncJob.id == job.id, SyncJob.status == JOB_PENDING).update(
+            _claim_values(worker_id, now), synchronize_session=False
+        )
+        if claimed:
+            claimed_jobs.append(job)
+    db.commit()
+    for job in claimed_jobs:
+        db.refresh(job)
+    return claimed_jobs
+
+
+def renew_lease(db: Session, job_id: int, worker_id: str = WORKER_ID) -> bool:
+    now = datetime.utcnow()
+    renewed = db.query(SyncJob).filter(
+        SyncJob.id == job_id, SyncJob.status == JOB_RUNNING, SyncJob.lease_owner == worker_id
+    ).update({
+        "heartbeat_at": now,
+        "lease_expires_at": now + timedelta(seconds=LEASE_SECONDS)
+    }, synchronize_session=False)
+    db.commit()
+    return bool(renewed)
+
+
+def finish_job(db: Session, job_id: int, success: bool, message: str, worker_id: str = WORKER_ID,
+               progress: dict = None):
+    values = {
+        "status": JOB_SUCCEEDED if success else JOB_FAILED,
+        "success": success,
+        "message": message,
+        "finished_at": datetime.utcnow(),
+        "lease_expires_at": None
+    }
+    if progress is not None:
+        values["progress"] = json.dumps(progress)
+    db.query(SyncJob).filter(
+        SyncJob.id == job_id, SyncJob.lease_owner == worker_id
+    ).update(values, synchronize_session=False)
+    db.commit()
+
+
+def save_progress(db: Session, job_id: int, progress: dict, worker_id: str = WORKER_ID):
+    db.query(SyncJob).filter(
+        SyncJob.id == job_id, SyncJob.lease_owner == worker_id, SyncJob.status == JOB_RUNNING
+    ).update({"progress": json.dumps(progress)}, synchronize_session=False)
+    db.commit()
+
+
+def get_job_progress(job: SyncJob) -> dict:
+    try:
+        return json.loads(job.progress) if job.progress else {}
+    except ValueError:
+        return {}
+
+
+class ProgressReporter:
+    # Collects the counters a sync reports and persists them on the job row
+    # through its own session, so the sync's session (and its transaction)
+    # is never touched. Writes are throttled except on phase changes. The
+    # sync reports from the event loop, so writes run in a worker thread;
+    # one that lands after a newer snapshot was written is dropped.
+    def __init__(self, job_id: int, worker_id: str = WORKER_ID):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.state = {}
+        self.written_at = 0.0
+        self._version = 0
+        self._written_version = 0
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def __call__(self, phase: str, **counts):
+        changed = phase != self.state.get("phase")
+        self.state.update(counts)
+        self.state["phase"] = phase
+        now = time.monotonic()
+        if not changed and now - self.written_at < PROGRESS_WRITE_SECONDS:
+            return
+        self.written_at = now
+        self._version += 1
+        snapshot = (self._version, dict(self.state))
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(*snapshot)
+            return
+        self._pending = [write for write in self._pending if not write.done()]
+        self._pending.append(loop.run_in_executor(None, self._write, *snapshot))
+
+    async def flush(self):
+        # Waits for writes still in flight, so none lands after finish_job.
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+            self._pending = []
+
+    def _write(self, version: int, state: dict):
+        with self._lock:
+            if version <= self._written_version:
+                return
+            self._written_version = version
+            db = SessionLocal()
+            try:
+                save_progress(db, self.job_id, state, worker_id=self.worker_id)
+            except Exception as e:
+                db.rollback()
+                print(f"Sync job {self.job_id}: could not save progress: {e}")
+            finally:
+                db.close()
+
+
+def retry_job(db: Session, job: SyncJob, message: str, worker_id: str = WORKER_ID):
+    if job.attempts >= job.max_attempts:
+        finish_job(db, job.id, False, message, worker_id=worker_id)
+        return
+    db.query(SyncJob).filter(
+        SyncJob.id == job.id, SyncJob.lease_owner == worker_id
+    ).update({
+        "status": JOB_PENDING,
+        "message": message,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "run_after": datetime.utcnow() + timedelta(seconds=RETRY_BACKOFF_SECONDS * (2 ** (job.attempts - 1)))
+    }, synchronize_session=False)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A newer request for this source is already pending; it supersedes us.
+        db.rollback()
+        finish_job(db, job.id, False, message, worker_id=worker_id)
+
+
+def release_job(db: Session, job_id: int, worker_id: str = WORKER_ID):
+    # Graceful shutdown: let another worker pick the job up right away.
+    db.query(SyncJob).filter(
+        SyncJob.id == job_id, SyncJob.lease_owner == worker_id, SyncJob.status == JOB_RUNNING
+    ).update({"lease_expires_at": datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+
+
+def prune_finished_jobs(db: Session, days: int = FINISHED_JOB_RETENTION_DAYS) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    deleted = db.query(SyncJob).filter(
+        SyncJob.status.in_([JOB_SUCCEEDED, JOB_FAILED]),
+        SyncJob.finished_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def _renew_leases(job_ids: List[int], worker_id: str):
+    db = SessionLocal()
+    try:
+        for job_id in list(job_ids):
+            if not renew_lease(db, job_id, worker_id=worker_id):
+                print(f"Sync job {job_id}: lease lost")
+                job_ids.remove(job_id)
+    finally:
+        db.close()
+
+
+async def _keep_lease(job_ids: List[int], worker_id: str):
+    # job_ids may grow while this runs (sibling jobs claimed for a batch).
+    # The queue's writes can wait up to busy_timeout for SQLite's writer
+    # lock, so they run in a worker thread rather than on the event loop.
+    while True:
+        await asyncio.sleep(LEASE_SECONDS / 3)
+        await asyncio.to_thread(_renew_leases, job_ids, worker_id)
+        if not job_ids:
+            return
+
+
+def _runnable_source(db: Session, job: SyncJob, worker_id: str) -> Optional[CalendarSource]:
+    if job.run_after:
+        SYNC_QUEUE_WAIT_SECONDS.observe(max(0.0, (datetime.utcnow() - job.run_after).total_seconds()))
+    source = db.query(CalendarSource).filter(CalendarSource.id == job.source_id).first()
+    if not source:
+        finish_job(db, job.id, False, "Source no longer exists", worker_id=worker_id)
+        return None
+    if not source.is_enabled and job.reason == "scheduled":
+        finish_job(db, job.id, False, "Source is disabled", worker_id=worker_id)
+        return None
+    return source
+
+
+async def run_job(job: SyncJob, worker_id: str = WORKER_ID):
+    db = SessionLocal()
+    job_ids = [job.id]
+    unfinished = {job.id: job}
+    lease_task = asyncio.create_task(_keep_lease(job_ids, worker_id))
+    try:
+        source = await asyncio.to_thread(_runnable_source, db, job, worker_id)
+        if not source:
+            return
+        group = [(job, source)]
+        for sibling in await asyncio.to_thread(claim_sibling_jobs, db, source, worker_id=worker_id):
+            job_ids.append(sibling.id)
+            unfinished[sibling.id] = sibling
+            sibling_source = await asyncio.to_thread(_runnable_source, db, sibling, worker_id)
+            if sibling_source:
+                group.append((sibling, sibling_source))
+            else:
+                del unfinished[sibling.id]
+
+        prefetched = await prefetch_events(db, [source for _, source in group])
+        for group_job, group_source in group:
+            reporter = ProgressReporter(group_job.id, worker_id=worker_id)
+            success, message = await sync_calendar_source(
+                db, group_source, user_id=group_source.user_id, progress=reporter,
+                prefetched=prefetched.get(group_source.id)
+            )
+            await reporter.flush()
+            await asyncio.to_thread(finish_job, db, group_job.id, success, message, worker_id=worker_id,
+                                    progress=reporter.state)
+            del unfinished[group_job.id]
+            if success:
+                note_rows_written(reporter.state.get("written", 0))
+
+            status = "Success" if success else "Failed"
+            level = "INFO" if success else "WARNING"
+            add_log(db, level, f"Sync {group_source.name}: {status} - {message}", source="scheduler")
+    except asyncio.CancelledError:
+        for job_id in unfinished:
+            release_job(db, job_id, worker_id=worker_id)
+        raise
+    except Exception as e:
+        db.rollback()
+        for unfinished_job in unfinished.values():
+            await asyncio.to_thread(retry_job, db, unfinished_job, f"{type(e).__name__}: {e}", worker_id=worker_id)
+        add_log(db, "ERROR", f"Sync job {job.id} crashed: {e}", source="scheduler")
+    finally:
+        lease_task.cancel()
+        db.close()
+
+
+async def job_worker_loop(worker_id: str = WORKER_ID):
+    while True:
+        db = SessionLocal()
+        try:
+            job = await asyncio.to_thread(claim_job, db, worker_id=worker_id)
+        except Exception as e:
+            db.rollback()
+            print(f"Error claiming sync job: {e}")
+            job = None
+        finally:
+            db.close()
+
+        if job is None:
+            await asyncio.sleep(IDLE_POLL_SECONDS)
+            continue
+
+        await run_job(job, worker_id=worker_id)
+
+
+def is_job_finished(job: SyncJob) -> bool:
+    return job.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+
+
+def _sync_progress_query(user_id: int):
+    recent = datetime.utcnow() - timedelta(seconds=PROGRESS_RECENT_SECONDS)
+    return select(SyncJob, CalendarSource.name).join(
+        CalendarSource, CalendarSource.id == SyncJob.source_id
+    ).where(
+        CalendarSource.user_id == user_id,
+        or_(
+            SyncJob.status.in_([JOB_PENDING, JOB_RUNNING]),
+            SyncJob.finished_at >= recent
+        )
+    ).order_by(SyncJob.id)
+
+
+def _sync_progress_payload(rows) -> dict:
+    jobs = []
+    for job, source_name in rows:
+        progress = get_job_progress(job)
+        jobs.append({
+            "job_id": job.id,
+            "source_id": job.source_id,
+            "source_name": source_name,
+            "status": job.status,
+            "phase": progress.get("phase", "queued" if job.status == JOB_PENDING else "starting"),
+            "pages": progress.get("pages", 0),
+            "fetched": progress.get("fetched", 0),
+            "parsed": progress.get("parsed", 0),
+            "written": progress.get("written", 0),
+            "message": job.message if is_job_finished(job) else None,
+            "finished_at": job.finished_at,
+        })
+    return {
+        "jobs": jobs,
+        "active": sum(1 for job in jobs if job["status"] in (JOB_PENDING, JOB_RUNNING)),
+    }
+
+
+def get_user_started_job_ids(db: Session, user_id: int) -> List[int]:
+    return [job_id for (job_id,) in db.query(SyncJob.id).join(
+        CalendarSource, CalendarSource.id == SyncJob.source_id
+    ).filter(
+        CalendarSource.user_id == user_id,
+        SyncJob.status.in_([JOB_PENDING, JOB_RUNNING]),
+        SyncJob.reason.in_(USER_STARTED_REASONS)
+    ).all()]
+
+
+def get_sync_progress(db: Session, user_id: int) -> dict:
+    return _sync_progress_payload(db.execute(_sync_progress_query(user_id)).all())
+
+
+async def get_sync_progress_async(db: AsyncSession, user_id: int) -> dict:
+    return _sync_progress_payload((await db.execute(_sync_progress_query(user_id))).all())
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta, date
+from typing import List
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import Session
+
+from .models import CalendarSource, SyncRun, User
+
+
+SYNC_RUN_RETENTION_DAYS = 30
+# Admin > Sync Performance: the slowest sources over the last
+# SLOWEST_WINDOW_HOURS, each with its daily average over TREND_DAYS.
+SLOWEST_WINDOW_HOURS = 24
+SLOWEST_SOURCES_LIMIT = 10
+TREND_DAYS = 14
+PHASES = ("token", "fetch", "parse", "expand", "store")
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+
+def _ms(seconds) -> int:
+    return int(round(seconds * 1000)) if seconds is not None else None
+
+
+def record_sync_run(db: Session, source: CalendarSource, trace, started_at: datetime, seconds: float,
+                    events_fetched: int = None, counts: dict = None, error: Exception = None) -> SyncRun:
+    # The caller commits.
+    counts = counts or {}
+    run = SyncRun(
+        source_id=source.id,
+        source_type=trace.source_type,
+        started_at=started_at,
+        duration_ms=_ms(seconds),
+        pages=trace.pages,
+        payload_bytes=trace.payload_bytes,
+        events_fetched=events_fetched,
+        added=counts.get("added"),
+        updated=counts.get("updated"),
+        removed=counts.get("removed"),
+        success=error is None,
+        error_class=type(error).__name__[:100] if error is not None else None,
+        **{f"{phase}_ms": _ms(trace.phases.get(phase)) for phase in PHASES}
+    )
+    db.add(run)
+    return run
+
+
+def prune_sync_runs(db: Session, days: int = SYNC_RUN_RETENTION_DAYS) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    # SQLite doesn't enforce the ON DELETE CASCADE, so runs of deleted
+    # sources are swept up here too.
+    deleted = db.query(SyncRun).filter(or_(
+        SyncRun.started_at < cutoff, SyncRun.source_id.not_in(select(CalendarSource.id))
+    )).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def _sparkline(values: List[float]) -> str:
+    present = [v for v in values if v is not None]
+    if not present:
+        return ""
+    high = max(present) or 1
+    return "".join(
+        " " if v is None else SPARK_CHARS[min(len(SPARK_CHARS) - 1, int(v / high * (len(SPARK_CHARS) - 1) + 0.5))]
+        for v in values
+    )
+
+
+def _slowest_sources(db: Session, since: datetime) -> List[dict]:
+    phase_columns = [func.avg(getattr(SyncRun, f"{phase}_ms")) for phase in PHASES]
+    rows = db.query(
+        SyncRun.source_id, CalendarSource.name, SyncRun.source_type, User.username,
+        func.count(SyncRun.id), func.avg(SyncRun.duration_ms), func.max(SyncRun.duration_ms),
+        func.sum(case((SyncRun.success == False, 1), else_=0)),
+        func.avg(SyncRun.payload_bytes),
+        *phase_columns
+    ).join(CalendarSource, CalendarSource.id == SyncRun.source_id).outerjoin(
+        User, User.id == CalendarSource.user_id
+    ).filter(SyncRun.started_at >= since).group_by(
+        SyncRun.source_id, CalendarSource.name, SyncRun.source_type, User.username
+    ).order_by(func.avg(SyncRun.duration_ms).desc()).limit(SLOWEST_SOURCES_LIMIT).all()
+
+    result = []
+    for source_id, name, source_type, username, runs, avg_ms, max_ms, failures, avg_bytes, *phases in rows:
+        result.append({
+            "source_id": source_id,
+            "name": name,
+            "source_type": source_type,
+            "username": username,
+            "runs": runs,
+            "failures": int(failures or 0),
+            "avg_ms": int(avg_ms or 0),
+            "max_ms": int(max_ms or 0),
+            "avg_kb": int((avg_bytes or 0) / 1024),
+            "phases": {phase: int(value) for phase, value in zip(PHASES, phases) if value is not None},
+        })
+    return result
+
+
+def _daily_trends(db: Session, source_ids: List[int], today: date) -> dict:
+    first_day = today - timedelta(days=TREND_DAYS - 1)
+    day = func.date(SyncRun.started_at)
+    rows = db.query(SyncRun.source_id, day, func.avg(SyncRun.duration_ms)).filter(
+        SyncRun.source_id.in_(source_ids),
+        SyncRun.started_at >= datetime.combine(first_day, datetime.min.time())
+    ).group_by(SyncRun.source_id, day).all()
+
+    daily = {}
+    for source_id, run_day, avg_ms in rows:
+        # SQLite returns date() as text, PostgreSQL as a date.
+        run_day = date.fromisoformat(run_day) if isinstance(run_day, str) else run_day
+        daily.setdefault(source_id, {})[run_day] = float(avg_ms)
+    days = [first_day + timedelta(days=i) for i in range(TREND_DAYS)]
+    return {
+        source_id: _sparkline([daily.get(source_id, {}).get(d) for d in days])
+        for source_id in source_ids
+    }
+
+
+def _by_source_type(db: Session, since: datetime) -> List[dict]:
+    rows = db.query(
+        SyncRun.source_type, func.count(SyncRun.id), func.sum(SyncRun.duration_ms), func.avg(SyncRun.duration_ms)
+    ).filter(SyncRun.started_at >= since).group_by(SyncRun.source_type).all()
+    total = sum(row[2] or 0 for row in rows) or 1
+    return sorted((
+        {
+            "source_type": source_type,
+            "runs": runs,
+            "total_s": round((total_ms or 0) / 1000, 1),
+            "avg_ms": int(avg_ms or 0),
+            "share": round(100 * (total_ms or 0) / total),
+        } for source_type, runs, total_ms, avg_ms in rows
+    ), key=lambda row: row["total_s"], reverse=True)
+
+
+def get_sync_run_stats(db: Session) -> dict:
+    now = datetime.utcnow()
+    since = now - timedelta(hours=SLOWEST_WINDOW_HOURS)
+    slowest = _slowest_sources(db, since)
+    trends = _daily_trends(db, [row["source_id"] for row in slowest], now.date()) if slowest else {}
+    for row in slowest:
+        row["trend"] = trends.get(row["source_id"], "")
+    return {
+        "window_hours": SLOWEST_WINDOW_HOURS,
+        "trend_days": TREND_DAYS,
+        "slowest": slowest,
+        "by_type": _by_source_type(db, since),
+    }
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy.orm import Session
+
+from .models import CalendarSource, SourceSyncState
+from .settings_service import get_setting
+
+
+# The global sync interval is the fastest any source is polled. Sources whose
+# syncs keep coming back unchanged double their interval each run, up to
+# 2**MAX_IDLE_LEVEL times the global interval; failing sources back off the
+# same way. Nothing waits longer than MAX_INTERVAL_MINUTES.
+MAX_IDLE_LEVEL = 4
+MAX_FAILURE_LEVEL = 8
+MAX_INTERVAL_MINUTES = 1440
+
+
+def get_base_interval(db: Session) -> int:
+    try:
+        return max(1, int(get_setting(db, 'sync_interval_minutes', '10')))
+    except (TypeError, ValueError):
+        return 10
+
+
+def compute_delay_minutes(base_minutes: int, state: SourceSyncState) -> int:
+    if state.consecutive_failures:
+        level = min(state.consecutive_failures, MAX_FAILURE_LEVEL)
+    else:
+        level = min(state.idle_level or 0, MAX_IDLE_LEVEL)
+    return min(base_minutes * (2 ** level), max(base_minutes, MAX_INTERVAL_MINUTES))
+
+
+def get_or_create_state(source: CalendarSource) -> SourceSyncState:
+    state = source.sync_state
+    if state is None:
+        state = SourceSyncState(source_id=source.id, idle_level=0, consecutive_failures=0, last_change_count=0)
+        source.sync_state = state
+    return state
+
+
+def record_sync_result(db: Session, source: CalendarSource, success: bool, changes: int = 0):
+    now = datetime.utcnow()
+    state = get_or_create_state(source)
+    state.last_attempt_at = now
+
+    if success:
+        state.consecutive_failures = 0
+        state.last_change_count = changes
+        if changes:
+            state.idle_level = 0
+            state.last_change_at = now
+        else:
+            state.idle_level = min((state.idle_level or 0) + 1, MAX_IDLE_LEVEL)
+    else:
+        state.consecutive_failures = (state.consecutive_failures or 0) + 1
+
+    state.next_sync_at = now + timedelta(minutes=compute_delay_minutes(get_base_interval(db), state))
+    return state
+
+
+def get_due_sources(db: Session, now: datetime = None) -> List[CalendarSource]:
+    now = now or datetime.utcnow()
+    return db.query(CalendarSource).outerjoin(SourceSyncState).filter(
+        CalendarSource.is_enabled == True,
+        (SourceSyncState.next_sync_at == None) | (SourceSyncState.next_sync_at <= now)
+    ).all()
+
+
+def reschedule_all(db: Session):
+    # Re-derive next run times after the global interval changed, so a shorter
+    # interval takes effect immediately instead of after the old delays.
+    base = get_base_interval(db)
+    for state in db.query(SourceSyncState).filter(SourceSyncState.last_attempt_at != None).all():
+        state.next_sync_at = state.last_attempt_at + timedelta(minutes=compute_delay_minutes(base, state))
+    db.commit()
+
+
+def get_next_scheduled_sync(db: Session) -> Optional[datetime]:
+    sources = db.query(CalendarSource.id, SourceSyncState.next_sync_at).outerjoin(SourceSyncState).filter(
+        CalendarSource.is_enabled == True
+    ).all()
+    if not sources:
+        return None
+    if any(next_sync_at is None for _, next_sync_at in sources):
+        return datetime.utcnow()
+    return min(next_sync_at for _, next_sync_at in sources)
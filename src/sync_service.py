@@ -1,17 +1,106 @@
+import asyncio
+import hashlib
+import time
 from datetime import datetime, timedelta
 from typing import Optional, List
+from urllib.parse import urlsplit, urlunsplit
+import io
+from sqlalchemy import event, text
 from sqlalchemy.orm import Session
-from dateutil import parser as date_parser
 
 from .models import CalendarSource, Event, SourceType
 from .caldav_service import fetch_caldav_events
-from .ics_feed_service import fetch_ics_feed
+from .crypto import decrypt_password
+from .ics_feed_service import fetch_ics_feed, normalize_ics_url
+from .iso_datetime import parse_iso_datetime
+from .metrics import (
+    SYNC_EVENTS_FETCHED, SYNC_EVENTS_WRITTEN, SYNC_RUNS, SyncTrace, current_sync, note_payload,
+    observe_sync_phase, sync_phase
+)
+from .sync_runs import record_sync_run
+from .profiling import PROFILE_SYNCS, finish_profile_async, start_profile_async
+from .provider_policy import run_with_policy
+from .sync_schedule import record_sync_result, get_due_sources
 from .custom_oauth_service import (
     get_valid_google_token, get_valid_microsoft_token,
-    fetch_google_events_custom, fetch_microsoft_events_custom
+    fetch_google_events_custom, fetch_microsoft_events_custom,
+    fetch_google_events_batch, fetch_microsoft_events_batch
 )
 
 
+class SyncError(Exception):
+    pass
+
+
+# Source types whose sources share the user's OAuth token and can be fetched
+# together through the provider's batch API.
+BATCH_SOURCE_TYPES = (SourceType.GOOGLE_CALENDAR, SourceType.OUTLOOK_OAUTH)
+# Source types fetched by URL and credentials alone. Sources of any users
+# that point at the same feed are fetched and parsed once per run.
+CALDAV_SOURCE_TYPES = (SourceType.CALDAV, SourceType.OUTLOOK, SourceType.ICLOUD)
+SHARED_FETCH_TYPES = (SourceType.ICS_FEED,) + CALDAV_SOURCE_TYPES
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def _normalize_feed_url(url: str) -> str:
+    # Scheme and host are case-insensitive and default ports and fragments
+    # never reach the server; path and query are left exactly as given.
+    parts = urlsplit(normalize_ics_url(url.strip()))
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    if parts.username:
+        host = f"{parts.username}:{parts.password or ''}@{host}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+def shared_fetch_key(source: CalendarSource) -> Optional[tuple]:
+    # Sources with equal keys get identical events from a fetch. The
+    # password enters the key as a digest: the stored ciphertext differs
+    # per source even for the same password.
+    if not source.caldav_url:
+        return None
+    url = _normalize_feed_url(str(source.caldav_url))
+    if source.source_type == SourceType.ICS_FEED:
+        return ("ics", url)
+    if source.source_type in CALDAV_SOURCE_TYPES and source.username:
+        password = decrypt_password(str(source.encrypted_password)) if source.encrypted_password else ""
+        return ("caldav", url, str(source.username), hashlib.sha256(password.encode()).hexdigest())
+    return None
+
+
+def shared_fetch_digest(source: CalendarSource) -> Optional[str]:
+    # shared_fetch_key as stored in calendar_sources.fetch_key, so sources
+    # of the same feed can be found with an index lookup.
+    key = shared_fetch_key(source)
+    return hashlib.sha256(repr(key).encode()).hexdigest() if key else None
+
+
+@event.listens_for(CalendarSource, "before_insert")
+@event.listens_for(CalendarSource, "before_update")
+def update_fetch_key(mapper, connection, source: CalendarSource):
+    # Kept current on every flush, so no form or script that edits a
+    # source's URL or credentials can leave a stale key behind.
+    source.fetch_key = shared_fetch_digest(source)
+
+
+def backfill_fetch_keys(db: Session) -> int:
+    # Sources created before calendar_sources.fetch_key existed.
+    sources = db.query(CalendarSource).filter(
+        CalendarSource.fetch_key.is_(None),
+        CalendarSource.source_type.in_(SHARED_FETCH_TYPES),
+        CalendarSource.caldav_url.isnot(None)
+    ).all()
+    filled = 0
+    for source in sources:
+        source.fetch_key = shared_fetch_digest(source)
+        filled += source.fetch_key is not None
+    if filled:
+        db.commit()
+    return filled
+
+
 def parse_google_events(raw_events: List[dict]) -> List[dict]:
     events = []
     for item in raw_events:
@@ -21,11 +110,11 @@ def parse_google_events(raw_events: List[dict]) -> List[dict]:
         is_all_day = "date" in start
         
         if is_all_day:
-            start_dt = date_parser.parse(start.get("date"))
-            end_dt = date_parser.parse(end.get("date"))
+            start_dt = parse_iso_datetime(start.get("date"))
+            end_dt = parse_iso_datetime(end.get("date"))
         else:
-            start_dt = date_parser.parse(start.get("dateTime", start.get("date", "")))
-            end_dt = date_parser.parse(end.get("dateTime", end.get("date", "")))
+            start_dt = parse_iso_datetime(start.get("dateTime", start.get("date", "")))
+            end_dt = parse_iso_datetime(end.get("dateTime", end.get("date", "")))
         
         if start_dt.tzinfo:
             start_dt = start_dt.replace(tzinfo=None)
@@ -53,8 +142,8 @@ def parse_microsoft_events(raw_events: List[dict]) -> List[dict]:
         
         is_all_day = item.get("isAllDay", False)
         
-        start_dt = date_parser.parse(start.get("dateTime", ""))
-        end_dt = date_parser.parse(end.get("dateTime", ""))
+        start_dt = parse_iso_datetime(start.get("dateTime", ""))
+        end_dt = parse_iso_datetime(end.get("dateTime", ""))
         
         if start_dt.tzinfo:
             start_dt = start_dt.replace(tzinfo=None)
@@ -89,93 +178,415 @@ def parse_microsoft_events(raw_events: List[dict]) -> List[dict]:
     return events
 
 
-async def sync_calendar_source(db: Session, source: CalendarSource, user_id: int = None) -> tuple[bool, str]:
+def _google_calendar_id(source: CalendarSource) -> str:
+    return str(source.google_calendar_id) if source.google_calendar_id else "primary"
+
+
+def _outlook_calendar_id(source: CalendarSource) -> Optional[str]:
+    return str(source.outlook_calendar_id) if source.outlook_calendar_id else None
+
+
+async def prefetch_batched_events(db: Session, sources: List[CalendarSource]) -> dict:
+    # Google and Outlook sources of one user share an OAuth token: look it
+    # up once and fetch all their calendars through the provider's batch
+    # API. Returns {source_id: result of fetch_*_events_batch}, with the
+    # batch's fetch time split evenly under "phases". Sources left out (no
+    # token, batch call failed, nothing to group) fetch on their own.
+    groups = {}
+    for source in sources:
+        if source.source_type in BATCH_SOURCE_TYPES:
+            groups.setdefault((source.user_id, source.source_type), []).append(source)
+
+    prefetched = {}
+    for (user_id, source_type), group in groups.items():
+        if len(group) < 2:
+            continue
+        if source_type == SourceType.GOOGLE_CALENDAR:
+            get_token, fetch_batch, calendar_id = get_valid_google_token, fetch_google_events_batch, _google_calendar_id
+        else:
+            get_token, fetch_batch, calendar_id = get_valid_microsoft_token, fetch_microsoft_events_batch, _outlook_calendar_id
+        try:
+            access_token = await get_token(db, user_id=user_id)
+            if not access_token:
+                continue
+            started = time.perf_counter()
+            calendar_ids = list(dict.fromkeys(calendar_id(s) for s in group))
+            # A calendar synced into a masked and an unmasked source needs its details.
+            masked = {calendar_id(s) for s in group if s.masking} - {calendar_id(s) for s in group if not s.masking}
+            results = await fetch_batch(access_token, calendar_ids, masked=masked)
+            seconds = (time.perf_counter() - started) / len(group)
+        except Exception as e:
+            print(f"Batch fetch for user {user_id} ({source_type.value}) failed, syncing one by one: {e}")
+            continue
+        for source in group:
+            prefetched[source.id] = {**results[calendar_id(source)], "phases": {"fetch": seconds}}
+    return prefetched
+
+
+async def _fetch_feed_events(source: CalendarSource) -> List[dict]:
+    if source.source_type == SourceType.ICS_FEED:
+        ics_url = str(source.caldav_url) if source.caldav_url else ""
+        if not ics_url:
+            raise SyncError("ICS feed URL is required.")
+        # Times its own fetch, parse and expand phases.
+        return await fetch_ics_feed(ics_url)
+
+    caldav_url = str(source.caldav_url) if source.caldav_url else ""
+    username = str(source.username) if source.username else ""
+    encrypted_pwd = str(source.encrypted_password) if source.encrypted_password else ""
+    
+    if not caldav_url or not username:
+        raise SyncError("CalDAV URL and username are required.")
+    
+    # The CalDAV client fetches, parses and expands in one blocking
+    # call; it is all counted as fetch.
+    with sync_phase("fetch"):
+        return await run_with_policy(
+            caldav_url,
+            fetch_caldav_events,
+            caldav_url=caldav_url,
+            username=username,
+            encrypted_password=encrypted_pwd
+        )
+
+
+async def prefetch_shared_feeds(sources: List[CalendarSource]) -> dict:
+    # ICS and CalDAV sources that point at the same feed with the same
+    # credentials, whoever owns them: fetch and parse the feed once and
+    # hand every source the same parsed events. Phase times and payload
+    # bytes are split evenly; a failed fetch fails every source in the group.
+    groups = {}
+    for source in sources:
+        if source.source_type in SHARED_FETCH_TYPES:
+            key = shared_fetch_key(source)
+            if key:
+                groups.setdefault(key, []).append(source)
+
+    prefetched = {}
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        trace = SyncTrace(group[0].source_type.value)
+        trace_token = current_sync.set(trace)
+        result = {"pages": 1, "events": []}
+        try:
+            result["events"] = await _fetch_feed_events(group[0])
+        except Exception as e:
+            result["error"] = e
+        finally:
+            current_sync.reset(trace_token)
+        result["phases"] = {phase: seconds / len(group) for phase, seconds in trace.phases.items()}
+        result["bytes"] = trace.payload_bytes // len(group)
+        print(f"Shared fetch of {group[0].name}: {len(result['events'])} events for {len(group)} sources")
+        for source in group:
+            prefetched[source.id] = result
+    return prefetched
+
+
+async def prefetch_events(db: Session, sources: List[CalendarSource]) -> dict:
+    # Everything that can be fetched for several of these sources at once.
+    # Returns {source_id: prefetched} for sync_calendar_source.
+    return {**await prefetch_batched_events(db, sources), **await prefetch_shared_feeds(sources)}
+
+
+def _use_prefetched(prefetched: dict, on_page) -> list:
+    for phase, seconds in prefetched["phases"].items():
+        observe_sync_phase(phase, seconds)
+    note_payload(prefetched["bytes"])
+    if prefetched.get("error"):
+        raise prefetched["error"]
+    on_page(prefetched["pages"], len(prefetched["events"]))
+    return prefetched["events"]
+
+
+async def sync_calendar_source(db: Session, source: CalendarSource, user_id: int = None, progress=None,
+                               prefetched: dict = None) -> tuple[bool, str]:
+    # progress, when given, is called as progress(phase, **counts) while the
+    # sync runs: fetching (pages, fetched), parsing, storing and done.
+    # prefetched is this source's entry from prefetch_events; the token
+    # lookup, fetch and (for feeds) parse are skipped then.
+    def report(phase, **counts):
+        if progress:
+            progress(phase, **counts)
+
+    def on_page(pages, fetched):
+        trace.pages = pages
+        report("fetching", pages=pages, fetched=fetched)
+
+    source_type = source.source_type.value if source.source_type else "unknown"
+    trace = SyncTrace(source_type)
+    trace_token = current_sync.set(trace)
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    profiler = await start_profile_async(PROFILE_SYNCS, "sync", f"{source.name} ({source_type})")
     try:
         events_data = []
         source_user_id = user_id if user_id is not None else source.user_id
         
-        if source.source_type == SourceType.GOOGLE_CALENDAR:
-            access_token = await get_valid_google_token(db, user_id=source_user_id)
+        if source.source_type == SourceType.GOOGLE_CALENDAR and prefetched:
+            raw_events = _use_prefetched(prefetched, on_page)
+            report("parsing", fetched=len(raw_events))
+            with sync_phase("parse"):
+                events_data = parse_google_events(raw_events)
+        
+        elif source.source_type == SourceType.GOOGLE_CALENDAR:
+            with sync_phase("token"):
+                access_token = await get_valid_google_token(db, user_id=source_user_id)
             if not access_token:
-                return False, "Could not get Google access token. Please configure and connect Google in Settings."
+                raise SyncError("Could not get Google access token. Please configure and connect Google in Settings.")
             
-            calendar_id = str(source.google_calendar_id) if source.google_calendar_id else "primary"
-            raw_events = await fetch_google_events_custom(access_token, calendar_id)
-            events_data = parse_google_events(raw_events)
+            calendar_id = _google_calendar_id(source)
+            report("fetching", pages=0, fetched=0)
+            with sync_phase("fetch"):
+                raw_events = await fetch_google_events_custom(access_token, calendar_id, on_page=on_page,
+                                                              masked=bool(source.masking))
+            report("parsing", fetched=len(raw_events))
+            with sync_phase("parse"):
+                events_data = parse_google_events(raw_events)
+        
+        elif source.source_type == SourceType.OUTLOOK_OAUTH and prefetched:
+            raw_events = _use_prefetched(prefetched, on_page)
+            report("parsing", fetched=len(raw_events))
+            with sync_phase("parse"):
+                events_data = parse_microsoft_events(raw_events)
         
         elif source.source_type == SourceType.OUTLOOK_OAUTH:
-            access_token = await get_valid_microsoft_token(db, user_id=source_user_id)
+            with sync_phase("token"):
+                access_token = await get_valid_microsoft_token(db, user_id=source_user_id)
             if not access_token:
-                return False, "Could not get Outlook access token. Please configure and connect Outlook in Settings."
+                raise SyncError("Could not get Outlook access token. Please configure and connect Outlook in Settings.")
             
-            calendar_id = str(source.outlook_calendar_id) if source.outlook_calendar_id else None
-            raw_events = await fetch_microsoft_events_custom(access_token, calendar_id)
-            events_data = parse_microsoft_events(raw_events)
-        
-        elif source.source_type == SourceType.ICS_FEED:
-            ics_url = str(source.caldav_url) if source.caldav_url else ""
-            if not ics_url:
-                return False, "ICS feed URL is required."
-            
-            events_data = await fetch_ics_feed(ics_url)
+            calendar_id = _outlook_calendar_id(source)
+            report("fetching", pages=0, fetched=0)
+            with sync_phase("fetch"):
+                raw_events = await fetch_microsoft_events_custom(access_token, calendar_id, on_page=on_page,
+                                                                 masked=bool(source.masking))
+            report("parsing", fetched=len(raw_events))
+            with sync_phase("parse"):
+                events_data = parse_microsoft_events(raw_events)
         
-        elif source.source_type in [SourceType.CALDAV, SourceType.OUTLOOK, SourceType.ICLOUD]:
-            caldav_url = str(source.caldav_url) if source.caldav_url else ""
-            username = str(source.username) if source.username else ""
-            encrypted_pwd = str(source.encrypted_password) if source.encrypted_password else ""
-            
-            if not caldav_url or not username:
-                return False, "CalDAV URL and username are required."
-            
-            events_data = fetch_caldav_events(
-                caldav_url=caldav_url,
-                username=username,
-                encrypted_password=encrypted_pwd
-            )
+        elif source.source_type in SHARED_FETCH_TYPES and prefetched:
+            events_data = _use_prefetched(prefetched, on_page)
+        
+        elif source.source_type in SHARED_FETCH_TYPES:
+            report("fetching", pages=0, fetched=0)
+            events_data = await _fetch_feed_events(source)
+            on_page(1, len(events_data))
         
         else:
-            return False, f"Unknown source type: {source.source_type}"
-        
-        db.query(Event).filter(Event.source_id == source.id).delete()
-        
-        for event_data in events_data:
-            event = Event(
-                source_id=source.id,
-                original_uid=event_data["uid"],
-                start_datetime=event_data["start"],
-                end_datetime=event_data["end"],
-                original_summary=event_data.get("summary", ""),
-                original_description=event_data.get("description", ""),
-                original_location=event_data.get("location", ""),
-                is_all_day=event_data.get("is_all_day", False),
-                last_synced_at=datetime.utcnow()
-            )
-            db.add(event)
+            raise SyncError(f"Unknown source type: {source.source_type}")
         
-        source.last_sync_at = datetime.utcnow()
-        source.last_sync_status = "success"
-        source.last_sync_error = None
+        report("storing", parsed=len(events_data))
+        SYNC_EVENTS_FETCHED.labels(source_type).inc(len(events_data))
+        # The diff and commit touch every event row of the source; run them in
+        # a worker thread so other requests keep being served meanwhile. The
+        # session is only used by that thread until the call returns.
+        with sync_phase("store"):
+            counts = await asyncio.to_thread(save_sync_success, db, source, events_data)
+        changes = counts["added"] + counts["updated"] + counts["removed"]
+        for change in ("added", "updated", "removed"):
+            SYNC_EVENTS_WRITTEN.labels(source_type, change).inc(counts[change])
+        SYNC_RUNS.labels(source_type, "success").inc()
+        record_sync_run(db, source, trace, started_at, time.perf_counter() - started,
+                        events_fetched=len(events_data), counts=counts)
         db.commit()
+        report("done", parsed=counts["total"], written=changes, **counts)
         
-        return True, f"Successfully synced {len(events_data)} events."
+        return True, (
+            f"Successfully synced {counts['total']} events "
+            f"({counts['added']} added, {counts['updated']} updated, {counts['removed']} removed)."
+        )
     
     except Exception as e:
+        db.rollback()
         source.last_sync_at = datetime.utcnow()
         source.last_sync_status = "error"
         source.last_sync_error = str(e)
+        record_sync_result(db, source, False)
+        record_sync_run(db, source, trace, started_at, time.perf_counter() - started, error=e)
         db.commit()
+        SYNC_RUNS.labels(source_type, "error").inc()
         return False, str(e)
+    finally:
+        current_sync.reset(trace_token)
+        if profiler:
+            await finish_profile_async(profiler)
+
+
+def save_sync_success(db: Session, source: CalendarSource, events_data: List[dict]) -> dict:
+    counts = store_events(db, source, events_data)
+    changes = counts["added"] + counts["updated"] + counts["removed"]
+    
+    source.last_sync_at = datetime.utcnow()
+    source.last_sync_status = "success"
+    source.last_sync_error = None
+    record_sync_result(db, source, True, changes)
+    db.commit()
+    return counts
+
+
+def store_events(db: Session, source: CalendarSource, events_data: List[dict]) -> dict:
+    if db.get_bind().dialect.name == "postgresql":
+        return store_events_postgres(db, source, events_data)
+    return store_events_orm(db, source, events_data)
+
+
+def store_events_orm(db: Session, source: CalendarSource, events_data: List[dict]) -> dict:
+    # Diff against what is already stored instead of delete-and-reinsert, so
+    # an unchanged calendar costs no writes and the counts drive scheduling.
+    existing = {
+        event.original_uid: event
+        for event in db.query(Event).filter(Event.source_id == source.id).all()
+    }
+    incoming = {event_data["uid"]: event_data for event_data in events_data}
+    
+    now = datetime.utcnow()
+    added = updated = 0
+    for uid, event_data in incoming.items():
+        values = {
+            "start_datetime": event_data["start"],
+            "end_datetime": event_data["end"],
+            "original_summary": event_data.get("summary", ""),
+            "original_description": event_data.get("description", ""),
+            "original_location": event_data.get("location", ""),
+            "is_all_day": event_data.get("is_all_day", False)
+        }
+        event = existing.pop(uid, None)
+        if event is None:
+            db.add(Event(source_id=source.id, original_uid=uid, last_synced_at=now, **values))
+            added += 1
+        elif any(getattr(event, key) != value for key, value in values.items()):
+            for key, value in values.items():
+                setattr(event, key, value)
+            event.last_synced_at = now
+            updated += 1
+    
+    for event in existing.values():
+        db.delete(event)
+    
+    return {"total": len(incoming), "added": added, "updated": updated, "removed": len(existing)}
+
+
+# Syncs with at least this many events load their rows with COPY instead of
+# a multi-row INSERT.
+PG_COPY_THRESHOLD = 500
+# varchar limits from the Event model; PostgreSQL enforces them, SQLite not.
+PG_TEXT_LIMIT = 512
+
+PG_INCOMING_COLUMNS = (
+    "original_uid", "start_datetime", "end_datetime", "original_summary",
+    "original_description", "original_location", "is_all_day"
+)
+
+
+def _pg_incoming_rows(events_data: List[dict]) -> List[tuple]:
+    incoming = {event_data["uid"]: event_data for event_data in events_data}
+    return [(
+        uid[:PG_TEXT_LIMIT],
+        event_data["start"],
+        event_data["end"],
+        (event_data.get("summary", "") or "")[:PG_TEXT_LIMIT],
+        event_data.get("description", "") or "",
+        (event_data.get("location", "") or "")[:PG_TEXT_LIMIT],
+        bool(event_data.get("is_all_day", False))
+    ) for uid, event_data in incoming.items()]
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_incoming(db: Session, rows: List[tuple]) -> bool:
+    copy_sql = f"COPY incoming_events ({', '.join(PG_INCOMING_COLUMNS)}) FROM STDIN"
+    cursor = db.connection().connection.dbapi_connection.cursor()
+    try:
+        if hasattr(cursor, "copy"):
+            # psycopg 3
+            with cursor.copy(copy_sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+            return True
+        if hasattr(cursor, "copy_expert"):
+            # psycopg2
+            buffer = io.StringIO()
+            for row in rows:
+                buffer.write("\t".join(_copy_value(value) for value in row))
+                buffer.write("\n")
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+            return True
+        # Other drivers: the caller falls back to INSERT.
+        return False
+    finally:
+        cursor.close()
+
+
+def store_events_postgres(db: Session, source: CalendarSource, events_data: List[dict]) -> dict:
+    # Same result as the ORM diff, done by the server: stage the fetched rows
+    # in a temp table, upsert them with ON CONFLICT (only rows whose content
+    # changed are rewritten) and delete what the source no longer has.
+    rows = _pg_incoming_rows(events_data)
+    
+    db.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS incoming_events ("
+        "original_uid varchar(512) PRIMARY KEY, start_datetime timestamp NOT NULL, "
+        "end_datetime timestamp NOT NULL, original_summary varchar(512), original_description text, "
+        "original_location varchar(512), is_all_day boolean"
+        ") ON COMMIT DELETE ROWS"
+    ))
+    
+    if rows and not (len(rows) >= PG_COPY_THRESHOLD and _copy_incoming(db, rows)):
+        db.execute(
+            text(
+                f"INSERT INTO incoming_events ({', '.join(PG_INCOMING_COLUMNS)}) "
+                f"VALUES ({', '.join(':' + column for column in PG_INCOMING_COLUMNS)})"
+            ),
+            [dict(zip(PG_INCOMING_COLUMNS, row)) for row in rows]
+        )
+    
+    content = ("start_datetime", "end_datetime", "original_summary", "original_description",
+               "original_location", "is_all_day")
+    upserted = db.execute(text(
+        f"INSERT INTO events (source_id, {', '.join(PG_INCOMING_COLUMNS)}, last_synced_at) "
+        f"SELECT :source_id, {', '.join(PG_INCOMING_COLUMNS)}, :now FROM incoming_events "
+        f"ON CONFLICT (source_id, original_uid) DO UPDATE SET "
+        f"{', '.join(f'{column} = EXCLUDED.{column}' for column in content)}, "
+        f"last_synced_at = EXCLUDED.last_synced_at "
+        f"WHERE ({', '.join(f'events.{column}' for column in content)}) "
+        f"IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in content)}) "
+        f"RETURNING (xmax = 0) AS inserted"
+    ), {"source_id": source.id, "now": datetime.utcnow()}).scalars().all()
+    
+    removed = db.execute(text(
+        "DELETE FROM events WHERE source_id = :source_id AND NOT EXISTS ("
+        "SELECT 1 FROM incoming_events i WHERE i.original_uid = events.original_uid)"
+    ), {"source_id": source.id}).rowcount
+    
+    db.expire(source, ["events"])
+    added = sum(1 for inserted in upserted if inserted)
+    return {"total": len(rows), "added": added, "updated": len(upserted) - added, "removed": removed}
 
 
-async def sync_all_sources(db: Session, user_id: int = None) -> dict:
-    query = db.query(CalendarSource).filter(CalendarSource.is_enabled == True)
-    if user_id is not None:
-        query = query.filter(CalendarSource.user_id == user_id)
-    sources = query.all()
+async def sync_all_sources(db: Session, user_id: int = None, due_only: bool = False) -> dict:
+    if due_only:
+        sources = get_due_sources(db)
+    else:
+        query = db.query(CalendarSource).filter(CalendarSource.is_enabled == True)
+        if user_id is not None:
+            query = query.filter(CalendarSource.user_id == user_id)
+        sources = query.all()
     results = {}
+    prefetched = await prefetch_events(db, sources)
     
     for source in sources:
-        success, message = await sync_calendar_source(db, source, user_id=source.user_id)
+        success, message = await sync_calendar_source(db, source, user_id=source.user_id,
+                                                      prefetched=prefetched.get(source.id))
         results[str(source.name)] = {"success": success, "message": message}
     
     return results
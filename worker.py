@@ -0,0 +1,32 @@
+import asyncio
+import signal
+
+from src.bootstrap import init_database
+from src.logging_service import stop_log_writer
+from src.metrics import start_metrics_server
+from src.scheduler import start_scheduler, stop_scheduler
+
+
+# Dedicated sync process for web processes started with SYNC_MODE=web; the two
+# only talk through the database. Several workers can run side by side: they
+# claim jobs from the shared sync_jobs queue under leases.
+async def main():
+    init_database()
+    start_scheduler(mode="worker")
+    start_metrics_server()
+    
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+    
+    try:
+        await stop_event.wait()
+    finally:
+        stop_scheduler()
+        stop_log_writer()
+        print("Sync worker stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())